@@ -0,0 +1,371 @@
+"""Benchmarks for hashcommit.
+
+Two levels are measured:
+
+- micro: candidates per second of one process, per engine and match type,
+  and digests per second of the ways of matching CONTAIN patterns;
+- e2e: wall time of the commands on synthetic repositories of varying
+  history length, message size and tree size.
+
+Results are written as JSON and compared against a stored baseline:
+
+    python benchmarks/bench.py --output bench.json --baseline benchmarks/baseline.json
+
+Use `--update-baseline` to record the current results as the new baseline.
+"""
+
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
+
+from hashcommit import kernel
+from hashcommit.args import MatchType, NoncePlacement
+from hashcommit.commit import (
+    create_a_commit_with_hash,
+    overwrite_a_commit_with_hash,
+    overwrite_and_rebase,
+)
+from hashcommit.engine import SearchJob, nonce_template
+from hashcommit.estimate import calibrate
+from hashcommit.gitio import close_git_io
+from hashcommit.pattern import PatternSet, contain_matcher
+from hashcommit.rewrite import rewrite_history
+from hashcommit.version import VERSION
+
+MICRO_TARGET = "0123abcd"
+E2E_TARGET = "00"
+DEFAULT_THRESHOLD = 0.2
+
+IDENTITY = {
+    "GIT_AUTHOR_NAME": "Bench Author",
+    "GIT_AUTHOR_EMAIL": "author@bench.invalid",
+    "GIT_COMMITTER_NAME": "Bench Committer",
+    "GIT_COMMITTER_EMAIL": "committer@bench.invalid",
+}
+
+
+@dataclass(frozen=True)
+class RepoShape:
+    name: str
+    history: int
+    message_size: int
+    tree_size: int
+
+
+REPO_SHAPES = [
+    RepoShape("base", history=10, message_size=64, tree_size=10),
+    RepoShape("long-history", history=100, message_size=64, tree_size=10),
+    RepoShape("large-message", history=10, message_size=16384, tree_size=10),
+    RepoShape("large-tree", history=10, message_size=64, tree_size=2000),
+]
+
+QUICK_REPO_SHAPES = [RepoShape("base", history=5, message_size=64, tree_size=5)]
+
+
+def micro_benchmarks(duration: float) -> Dict[str, float]:
+    """Return candidates per second keyed by `micro/<engine>/<match type>`."""
+    engines = {
+        "scalar": (NoncePlacement.HEADER, False),
+        "timestamp": (NoncePlacement.TIMESTAMP, False),
+    }
+    if kernel.is_available():
+        engines["batch"] = (NoncePlacement.HEADER, True)
+
+    results = {}
+    for engine, (placement, batch) in engines.items():
+        template, nonces = nonce_template(
+            placement=placement,
+            tree_hash="4b825dc642cb6eb9a060e54bf8d69288fbbfecd9",
+            parent_hashes=["0" * 40],
+            author="Bench Author <author@bench.invalid> 1700000000 +0000",
+            committer="Bench Committer <committer@bench.invalid>",
+            message="Benchmark commit\n",
+            encoding=None,
+            start=datetime(2024, 1, 1),
+        )
+        for match_type in MatchType:
+            pattern = PatternSet.compile(MICRO_TARGET, match_type)
+            job = SearchJob(template, nonces, pattern, batch=batch)
+            rate = calibrate(job, duration)
+            results[f"micro/{engine}/{match_type.value}"] = rate
+            print(f"micro/{engine}/{match_type.value}: {rate:,.0f} candidates/s")
+    return results
+
+
+def matcher_benchmarks(duration: float) -> Dict[str, float]:
+    """Return digests checked per second keyed by `micro/matcher/<check>`.
+
+    Compares the two ways of checking a plain hex CONTAIN pattern: a
+    substring search in the hex digest, and the regular expressions over
+    the raw digest used for patterns with wildcards.
+    """
+    digests = [hashlib.sha1(b"%d" % number).digest() for number in range(10000)]
+    checks = {
+        "contain-hex": PatternSet.compile(MICRO_TARGET, MatchType.CONTAIN).matcher(),
+        "contain-raw": contain_matcher(MICRO_TARGET),
+    }
+    results = {}
+    for name, check in checks.items():
+        checked = 0
+        started = time.perf_counter()
+        while time.perf_counter() - started < duration:
+            for digest in digests:
+                check(digest)
+            checked += len(digests)
+        rate = checked / (time.perf_counter() - started)
+        results[f"micro/matcher/{name}"] = rate
+        print(f"micro/matcher/{name}: {rate:,.0f} digests/s")
+    return results
+
+
+def fast_import_stream(shape: RepoShape) -> Iterator[bytes]:
+    """Yield a `git fast-import` stream describing a repository of `shape`."""
+    message = (b"Commit message " * (shape.message_size // 15 + 1))[
+        : shape.message_size
+    ]
+    for number in range(shape.history):
+        yield b"commit refs/heads/main\n"
+        yield b"committer Bench <bench@bench.invalid> %d +0000\n" % (
+            1700000000 + number
+        )
+        yield b"data %d\n%s\n" % (len(message), message)
+        files = range(shape.tree_size) if number == 0 else [number % shape.tree_size]
+        for index in files:
+            content = b"file %d, revision %d\n" % (index, number)
+            yield b"M 644 inline file%05d.txt\ndata %d\n%s\n" % (
+                index,
+                len(content),
+                content,
+            )
+        yield b"\n"
+
+
+def create_repo(path: Path, shape: RepoShape) -> None:
+    subprocess.run(["git", "init", "-q", "-b", "main", str(path)], check=True)
+    subprocess.run(
+        ["git", "fast-import", "--quiet"],
+        input=b"".join(fast_import_stream(shape)),
+        cwd=path,
+        check=True,
+    )
+    subprocess.run(["git", "reset", "-q", "--hard", "main"], cwd=path, check=True)
+
+
+@contextlib.contextmanager
+def quiet() -> Iterator[None]:
+    """Silence stdout and stderr, including those of git subprocesses."""
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved = os.dup(1), os.dup(2)
+    with open(os.devnull, "w") as devnull:
+        os.dup2(devnull.fileno(), 1)
+        os.dup2(devnull.fileno(), 2)
+        try:
+            yield
+        finally:
+            os.dup2(saved[0], 1)
+            os.dup2(saved[1], 2)
+            os.close(saved[0])
+            os.close(saved[1])
+
+
+def first_commit(path: Path) -> str:
+    result = subprocess.run(
+        ["git", "rev-list", "--max-parents=0", "HEAD"],
+        cwd=path,
+        check=True,
+        capture_output=True,
+    )
+    return result.stdout.decode().split()[0]
+
+
+def operations(jobs: int) -> Dict[str, Callable[[Path, RepoShape], None]]:
+    def create(path: Path, shape: RepoShape) -> None:
+        create_a_commit_with_hash(
+            E2E_TARGET, "x" * shape.message_size, MatchType.BEGIN, jobs=jobs
+        )
+
+    def overwrite(path: Path, shape: RepoShape) -> None:
+        overwrite_a_commit_with_hash(
+            E2E_TARGET, None, MatchType.BEGIN, preserve_author=True, jobs=jobs
+        )
+
+    def overwrite_root(path: Path, shape: RepoShape) -> None:
+        overwrite_and_rebase(
+            E2E_TARGET,
+            None,
+            first_commit(path),
+            preserve_author=True,
+            match_type=MatchType.BEGIN,
+            jobs=jobs,
+        )
+
+    def rewrite(path: Path, shape: RepoShape) -> None:
+        digits = len(str(shape.history - 1))
+        rewrite_history(digits, preserve_author=True, jobs=jobs)
+
+    return {
+        "create": create,
+        "overwrite": overwrite,
+        "overwrite-and-rebase": overwrite_root,
+        "rewrite": rewrite,
+    }
+
+
+def e2e_benchmarks(shapes: List[RepoShape], repeat: int, jobs: int) -> Dict[str, float]:
+    """Return the median wall time keyed by `e2e/<operation>/<repo shape>`."""
+    results = {}
+    cwd = os.getcwd()
+    os.environ.update(IDENTITY)
+    with tempfile.TemporaryDirectory(prefix="hashcommit-bench") as workdir:
+        for shape in shapes:
+            template = Path(workdir, shape.name)
+            create_repo(template, shape)
+            for name, operation in operations(jobs).items():
+                timings = []
+                for _ in range(repeat):
+                    repo = Path(workdir, "run")
+                    shutil.copytree(template, repo)
+                    os.chdir(repo)
+                    try:
+                        started = time.perf_counter()
+                        with quiet():
+                            operation(repo, shape)
+                        timings.append(time.perf_counter() - started)
+                    finally:
+                        close_git_io()
+                        os.chdir(cwd)
+                        shutil.rmtree(repo)
+                key = f"e2e/{name}/{shape.name}"
+                results[key] = statistics.median(timings)
+                print(f"{key}: {results[key]:.3f}s")
+    return results
+
+
+def compare(
+    results: Dict[str, float], baseline: Dict[str, float], threshold: float
+) -> List[str]:
+    """Return a description of every benchmark that regressed past `threshold`.
+
+    Micro benchmarks are rates, where lower is worse. End-to-end benchmarks
+    are times, where higher is worse.
+    """
+    regressions = []
+    for key, value in sorted(results.items()):
+        if key not in baseline:
+            continue
+        change = value / baseline[key] - 1
+        worse = -change if key.startswith("micro/") else change
+        marker = "REGRESSION" if worse > threshold else "ok"
+        print(f"{key}: {change:+.1%} against the baseline ({marker})")
+        if worse > threshold:
+            regressions.append(f"{key}: {change:+.1%}")
+    return regressions
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark hashcommit.")
+    parser.add_argument(
+        "--level",
+        choices=["micro", "e2e", "all"],
+        default="all",
+        help="Which benchmarks to run (default: all).",
+    )
+    parser.add_argument(
+        "--duration",
+        type=float,
+        default=1.0,
+        help="Seconds spent on each micro benchmark (default: 1).",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="Runs of each end-to-end benchmark; the median is kept (default: 3).",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Search processes used by the end-to-end benchmarks (default: 1).",
+    )
+    parser.add_argument(
+        "--quick",
+        action="store_true",
+        help="Only benchmark one small repository.",
+    )
+    parser.add_argument("--output", type=Path, help="Write the results to this file.")
+    parser.add_argument(
+        "--baseline", type=Path, help="Compare the results against this file."
+    )
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="Store the results as the new baseline instead of comparing.",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="Relative slowdown reported as a regression (default: 0.2).",
+    )
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    results: Dict[str, float] = {}
+    if args.level in ("micro", "all"):
+        results.update(micro_benchmarks(args.duration))
+        results.update(matcher_benchmarks(args.duration))
+    if args.level in ("e2e", "all"):
+        shapes = QUICK_REPO_SHAPES if args.quick else REPO_SHAPES
+        results.update(e2e_benchmarks(shapes, args.repeat, args.jobs))
+
+    report = {
+        "hashcommit": VERSION,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "numpy": kernel.is_available(),
+        "results": results,
+    }
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2) + "\n")
+
+    baseline_path: Optional[Path] = args.baseline
+    if baseline_path is None:
+        return 0
+    if args.update_baseline:
+        baseline_path.write_text(json.dumps(report, indent=2) + "\n")
+        print(f"Stored the baseline in {baseline_path}")
+        return 0
+    if not baseline_path.exists():
+        print(
+            f"No baseline at {baseline_path}, record one with --update-baseline",
+            file=sys.stderr,
+        )
+        return 2
+
+    baseline = json.loads(baseline_path.read_text())["results"]
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print("Regressions:\n" + "\n".join(regressions), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,41 @@
+"""Generate Git commits with chosen hashes.
+
+The library API is loaded on first use, so that the command line, which
+imports this package too, does not pay for it.
+"""
+
+from importlib import import_module
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from .aio import AsyncHashCommitSession
+    from .api import HashCommitSession, RewriteResult
+    from .args import MatchType, NoncePlacement
+    from .commit import FoundCommit
+    from .engine import SearchBudget
+
+_EXPORTS = {
+    "AsyncHashCommitSession": "aio",
+    "FoundCommit": "commit",
+    "HashCommitSession": "api",
+    "MatchType": "args",
+    "NoncePlacement": "args",
+    "RewriteResult": "api",
+    "SearchBudget": "engine",
+}
+
+__all__ = [
+    "AsyncHashCommitSession",
+    "FoundCommit",
+    "HashCommitSession",
+    "MatchType",
+    "NoncePlacement",
+    "RewriteResult",
+    "SearchBudget",
+]
+
+
+def __getattr__(name: str) -> Any:
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(import_module(f".{_EXPORTS[name]}", __name__), name)
@@ -0,0 +1,455 @@
+"""Using hashcommit from asyncio programs without blocking the event loop.
+
+`AsyncHashCommitSession` is the asynchronous counterpart of
+`HashCommitSession`:
+
+    async with AsyncHashCommitSession("path/to/repo", jobs=4) as session:
+        found = await session.create("00", "First commit")
+
+git runs in asyncio subprocesses in the session's repository, and
+candidates are hashed in a thread, by the session's search processes when
+it has more than one job. Nothing is written until the search is over:
+the new commit objects, in one packfile when there are several, and HEAD
+are then written in one step that runs to completion even if the
+operation is cancelled meanwhile. Cancelling an operation during its
+search stops the search processes within one chunk and leaves the
+repository untouched.
+"""
+
+import asyncio
+import os
+import subprocess
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from types import TracebackType
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+)
+
+from .args import MatchType, NoncePlacement
+from .commit import FoundCommit, prepare_search_space, rebuild_descendants
+from .engine import (
+    CHUNK_SIZE,
+    SearchJob,
+    SearchResult,
+    WorkerPool,
+    search,
+    use_batch_kernel,
+)
+from .git import (
+    CommitContext,
+    commit_encoding_from,
+    derive_commit_context,
+    parse_config,
+    refresh_commit_context,
+    signing_config_from,
+)
+from .gitio import Commit, LooseObjectWriter, parse_commit
+from .pack import PackWriter
+from .pattern import PatternSet
+from .signing import search_signed
+
+CONFIG_PATTERN = r"^(commit\.gpgsign|gpg\..*|user\.signingkey|i18n\.commitencoding)$"
+NO_COMMIT = "0" * 40
+
+T = TypeVar("T")
+
+
+class _Stopped(Exception):
+    """Raised in the search thread once its operation has been cancelled."""
+
+
+def _write_pack(objects: Path, bodies: List[bytes]) -> None:
+    with PackWriter(objects) as pack:
+        for body in bodies:
+            pack.write(body)
+
+
+def _write_loose(objects: Path, bodies: List[bytes]) -> None:
+    writer = LooseObjectWriter(objects)
+    for body in bodies:
+        writer.write(body)
+
+
+class AsyncHashCommitSession:
+    """Create and amend commits with chosen hashes from a running event loop.
+
+    Operations of one session run one at a time.
+    """
+
+    def __init__(
+        self,
+        repo_path: Union[str, "os.PathLike[str]"] = ".",
+        jobs: Optional[int] = None,
+        nonce_placement: Optional[NoncePlacement] = None,
+    ) -> None:
+        self.repo_path = os.path.abspath(repo_path)
+        self.jobs = jobs or os.cpu_count() or 1
+        self.nonce_placement = nonce_placement
+        self._context: Optional[CommitContext] = None
+        self._pool: Optional[WorkerPool] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def __aenter__(self) -> "AsyncHashCommitSession":
+        await self.open()
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        await self.close()
+
+    async def open(self) -> None:
+        """Resolve the identities and configuration of the repository."""
+        if self._context is not None:
+            return
+        if await self._try_git(["rev-parse", "--git-dir"]) is None:
+            raise RuntimeError(f"Not a git repository: {self.repo_path}")
+        author = await self._git_text(["var", "GIT_AUTHOR_IDENT"])
+        committer = await self._git_text(["var", "GIT_COMMITTER_IDENT"])
+        committer = committer.rsplit(" ", 2)[0]
+        output = await self._try_git(["config", "--get-regexp", CONFIG_PATTERN])
+        config = parse_config((output or b"").decode())
+        signing = None
+        if config.get("commit.gpgsign") == "true":
+            signing = signing_config_from(config, committer)
+        self._context = CommitContext(
+            env=os.environ.copy(),
+            author=author,
+            committer=committer,
+            encoding=commit_encoding_from(config.get("i18n.commitencoding")),
+            signing=signing,
+            timestamp=datetime.now(),
+            fixed_author_date=False,
+        )
+        if self.jobs > 1:
+            self._pool = WorkerPool(self.jobs)
+
+    async def close(self) -> None:
+        """Stop the search processes."""
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            await asyncio.get_running_loop().run_in_executor(None, pool.close)
+
+    def _serialized(self) -> asyncio.Lock:
+        # Created on first use, inside the event loop that runs the session.
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    async def create(
+        self,
+        desired_hash: Union[str, Sequence[str]],
+        message: str,
+        match_type: MatchType = MatchType.BEGIN,
+    ) -> FoundCommit:
+        """Commit the index with `message` as a new commit on HEAD."""
+        async with self._serialized():
+            await self.open()
+            started = time.perf_counter()
+            head = await self._resolve("HEAD")
+            tree = await self._git_text(["write-tree"])
+            context = await self._context_for(head, preserve_author=False)
+            result, body = await self._mine(
+                desired_hash, match_type, message, tree, [head] if head else [], context
+            )
+            subject = (message.splitlines() or [""])[0]
+            await self._store([body], result.commit_hash, head, f"commit: {subject}")
+            return FoundCommit(
+                result.commit_hash, result.attempts, time.perf_counter() - started
+            )
+
+    async def amend(
+        self,
+        desired_hash: Union[str, Sequence[str]],
+        message: Optional[str] = None,
+        commit: Optional[str] = None,
+        preserve_author: bool = True,
+        match_type: MatchType = MatchType.BEGIN,
+    ) -> FoundCommit:
+        """Replace the last commit, or `commit` and everything after it.
+
+        Like `HashCommitSession.amend`, the last commit is replaced by the
+        index and the working tree is reset to it, while an earlier commit
+        keeps its tree and has its descendants recreated on top of it.
+        """
+        async with self._serialized():
+            await self.open()
+            started = time.perf_counter()
+            head = await self._resolve("HEAD")
+            if head is None:
+                raise ValueError("No commit to overwrite")
+            if commit is None:
+                result = await self._amend_head(
+                    desired_hash, message, head, preserve_author, match_type
+                )
+            else:
+                result = await self._overwrite(
+                    desired_hash, message, commit, head, preserve_author, match_type
+                )
+            return FoundCommit(
+                result.commit_hash, result.attempts, time.perf_counter() - started
+            )
+
+    async def _amend_head(
+        self,
+        desired_hash: Union[str, Sequence[str]],
+        message: Optional[str],
+        head: str,
+        preserve_author: bool,
+        match_type: MatchType,
+    ) -> SearchResult:
+        current = await self._read_commit(head)
+        tree = await self._git_text(["write-tree"])
+        context = await self._context_for(head, preserve_author)
+        result, body = await self._mine(
+            desired_hash,
+            match_type,
+            message or current.message.strip(),
+            tree,
+            current.parents,
+            context,
+        )
+        await self._store(
+            [body], result.commit_hash, head, "hashcommit: amend", reset=True
+        )
+        return result
+
+    async def _overwrite(
+        self,
+        desired_hash: Union[str, Sequence[str]],
+        message: Optional[str],
+        commit: str,
+        head: str,
+        preserve_author: bool,
+        match_type: MatchType,
+    ) -> SearchResult:
+        oid = await self._resolve(commit)
+        if oid is None:
+            raise ValueError(f"Not a commit: {commit}")
+        ancestry = ["merge-base", "--is-ancestor", oid, head]
+        if await self._try_git(ancestry) is None:
+            raise RuntimeError(f"{oid} is not an ancestor of HEAD")
+        current = await self._read_commit(oid)
+        context = await self._context_for(oid, preserve_author)
+        result, body = await self._mine(
+            desired_hash,
+            match_type,
+            message or current.message.strip(),
+            current.tree,
+            current.parents,
+            context,
+        )
+
+        listing = await self._git_text(
+            ["rev-list", "--reverse", "--topo-order", "--parents", f"{oid}..{head}"]
+        )
+        descendants = []
+        for line in listing.splitlines():
+            descendant, *parents = line.split()
+            descendants.append((descendant, tuple(parents)))
+        objects = await self._read_objects([oid for oid, _ in descendants])
+        # Signing the descendants runs gpg for each of them.
+        rewritten, bodies = await self._in_thread(
+            rebuild_descendants,
+            oid,
+            result.commit_hash,
+            descendants,
+            objects.__getitem__,
+            context.signing,
+        )
+        await self._store(
+            [body] + bodies,
+            rewritten.get(head, head),
+            head,
+            f"hashcommit: overwrite {oid}",
+        )
+        return result
+
+    async def _mine(
+        self,
+        desired_hash: Union[str, Sequence[str]],
+        match_type: MatchType,
+        message: str,
+        tree_hash: str,
+        parent_hashes: Sequence[str],
+        context: CommitContext,
+    ) -> Tuple[SearchResult, bytes]:
+        """Search in a thread and return the result and the winning body."""
+        if context.signing and not context.signing.in_process:
+            raise RuntimeError("Asynchronous searches cannot sign commits with SSH")
+        patterns = PatternSet.compile(desired_hash, match_type)
+        space = await self._in_thread(
+            prepare_search_space,
+            message,
+            tree_hash,
+            parent_hashes,
+            context,
+            self.nonce_placement,
+        )
+        template = space.template
+        job = SearchJob(
+            template, space.nonces, patterns, use_batch_kernel(template, patterns)
+        )
+        stop = threading.Event()
+
+        def check_stop(attempts: int) -> None:
+            if stop.is_set():
+                raise _Stopped()
+
+        if context.signing and space.placement != NoncePlacement.SIGNATURE:
+            return await self._in_thread(
+                search_signed, job, context.signing, check_stop, stop=stop
+            )
+        result = await self._in_thread(
+            search, job, self.jobs, CHUNK_SIZE, check_stop, 0, self._pool, stop=stop
+        )
+        return result, template.body(result.nonce)
+
+    async def _in_thread(
+        self,
+        function: Callable[..., T],
+        *args: Any,
+        stop: Optional[threading.Event] = None,
+    ) -> T:
+        """Run `function` in a thread; on cancellation, wait for it to stop."""
+        future = asyncio.get_running_loop().run_in_executor(None, function, *args)
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            if stop is not None:
+                stop.set()
+            await asyncio.wait({future})
+            if not future.cancelled():
+                future.exception()
+            raise
+
+    async def _store(
+        self,
+        bodies: List[bytes],
+        new_head: str,
+        old_head: Optional[str],
+        reflog_message: str,
+        reset: bool = False,
+    ) -> None:
+        """Write `bodies` and move HEAD from `old_head` to `new_head`.
+
+        Once started, the write runs to completion even if the operation is
+        cancelled. HEAD is only moved if nothing else moved it meanwhile.
+        """
+        task = asyncio.ensure_future(
+            self._write(bodies, new_head, old_head, reflog_message, reset)
+        )
+        try:
+            await asyncio.shield(task)
+        except asyncio.CancelledError:
+            await asyncio.wait({task})
+            raise
+
+    async def _write(
+        self,
+        bodies: List[bytes],
+        new_head: str,
+        old_head: Optional[str],
+        reflog_message: str,
+        reset: bool,
+    ) -> None:
+        objects = await self._git_text(["rev-parse", "--git-path", "objects"])
+        write = _write_pack if len(bodies) > 1 else _write_loose
+        await self._in_thread(write, Path(self.repo_path, objects), bodies)
+        update = ["update-ref", "-m", reflog_message, "HEAD", new_head]
+        if await self._try_git(update + [old_head or NO_COMMIT]) is None:
+            raise RuntimeError("HEAD was moved during the search")
+        if reset:
+            await self._git(["reset", "-q", "--hard"])
+
+    async def _context_for(
+        self, related_commit_hash: Optional[str], preserve_author: bool
+    ) -> CommitContext:
+        assert self._context is not None
+        context = refresh_commit_context(self._context)
+        if related_commit_hash is None:
+            return context
+        related = await self._read_commit(related_commit_hash)
+        return derive_commit_context(context, related, preserve_author)
+
+    async def _resolve(self, rev: str) -> Optional[str]:
+        output = await self._try_git(
+            ["rev-parse", "--verify", "-q", f"{rev}^{{commit}}"]
+        )
+        return output.decode().strip() if output else None
+
+    async def _read_commit(self, oid: str) -> Commit:
+        return parse_commit(oid, await self._git(["cat-file", "commit", oid]))
+
+    async def _read_objects(self, oids: Sequence[str]) -> Dict[str, bytes]:
+        """Read the objects `oids` through one `git cat-file --batch`."""
+        if not oids:
+            return {}
+        output = await self._git(
+            ["cat-file", "--batch"], input="".join(f"{oid}\n" for oid in oids).encode()
+        )
+        objects = {}
+        position = 0
+        for oid in oids:
+            end = output.index(b"\n", position)
+            _, _, size = output[position:end].decode().split()
+            position = end + 1
+            objects[oid] = output[position : position + int(size)]
+            position += int(size) + 1
+        return objects
+
+    async def _git_text(self, args: List[str]) -> str:
+        return (await self._git(args)).decode().strip()
+
+    async def _git(self, args: List[str], input: Optional[bytes] = None) -> bytes:
+        """Run git in the repository and return its output.
+
+        A failing command raises `CalledProcessError`.
+        """
+        returncode, stdout, stderr = await self._run(args, input)
+        if returncode != 0:
+            raise subprocess.CalledProcessError(
+                returncode, ["git"] + args, stdout, stderr
+            )
+        return stdout
+
+    async def _try_git(self, args: List[str]) -> Optional[bytes]:
+        """Run git in the repository and return its output, None if it fails."""
+        returncode, stdout, _ = await self._run(args, None)
+        return stdout if returncode == 0 else None
+
+    async def _run(
+        self, args: List[str], input: Optional[bytes]
+    ) -> Tuple[int, bytes, bytes]:
+        """Run git in the repository; a cancelled call kills git."""
+        process = await asyncio.create_subprocess_exec(
+            "git",
+            *args,
+            cwd=self.repo_path,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        try:
+            stdout, stderr = await process.communicate(input)
+        except asyncio.CancelledError:
+            process.kill()
+            await process.wait()
+            raise
+        assert process.returncode is not None
+        return process.returncode, stdout, stderr
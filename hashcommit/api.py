@@ -0,0 +1,192 @@
+"""Using hashcommit from Python.
+
+A `HashCommitSession` resolves the repository's identities, encoding and
+signing configuration once and keeps its search processes alive, so that
+a program creating many commits pays for neither more than once:
+
+    with HashCommitSession("path/to/repo", jobs=4) as session:
+        first = session.create("00", "First commit")
+        second = session.create("01", "Second commit")
+        print(second.commit_hash, second.attempts, second.elapsed)
+
+Operations print nothing and return what they did. Errors are raised as
+`RuntimeError` or `ValueError`, like the command line reports them. A
+session is not thread-safe: it runs git in its repository by changing the
+working directory for the duration of each call.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from types import TracebackType
+from typing import Dict, Iterator, Optional, Sequence, Type, Union
+
+from .args import MatchType, NoncePlacement
+from .commit import (
+    FoundCommit,
+    create_a_commit_with_hash,
+    overwrite_a_commit_with_hash,
+    overwrite_and_rebase,
+)
+from .engine import SearchBudget, WorkerPool
+from .git import CommitContext, is_in_git_repo, resolve_commit_context
+from .gitio import close_git_io
+from .rewrite import rewrite_history
+
+
+@dataclass(frozen=True)
+class RewriteResult:
+    """The rewritten history: new commit hashes by old commit hash."""
+
+    commits: Dict[str, str]
+    attempts: int
+    elapsed: float
+
+
+@contextmanager
+def _working_directory(path: str) -> Iterator[None]:
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+class HashCommitSession:
+    """Create, amend and rewrite commits with chosen hashes in one repository."""
+
+    def __init__(
+        self,
+        repo_path: Union[str, "os.PathLike[str]"] = ".",
+        jobs: Optional[int] = None,
+        nonce_placement: Optional[NoncePlacement] = None,
+    ) -> None:
+        self.repo_path = os.path.abspath(repo_path)
+        self.jobs = jobs or os.cpu_count() or 1
+        self.nonce_placement = nonce_placement
+        with self._in_repo():
+            if not is_in_git_repo():
+                raise RuntimeError(f"Not a git repository: {self.repo_path}")
+            self._context: CommitContext = resolve_commit_context(
+                preserve_author=False, related_commit_hash=None
+            )
+        self._pool = WorkerPool(self.jobs) if self.jobs > 1 else None
+
+    def __enter__(self) -> "HashCommitSession":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Stop the search processes and the git processes."""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+        close_git_io()
+
+    @contextmanager
+    def _in_repo(self) -> Iterator[None]:
+        with _working_directory(self.repo_path):
+            yield
+
+    def create(
+        self,
+        desired_hash: Union[str, Sequence[str]],
+        message: str,
+        match_type: MatchType = MatchType.BEGIN,
+        budget: Optional[SearchBudget] = None,
+        strict: bool = False,
+    ) -> FoundCommit:
+        """Commit the index with `message` as a new commit on HEAD.
+
+        With a `budget`, the closest candidate is committed when it runs
+        out, unless `strict` is set; see `find_commit_content`.
+        """
+        with self._in_repo():
+            return create_a_commit_with_hash(
+                desired_hash=desired_hash,
+                message=message,
+                match_type=match_type,
+                jobs=self.jobs,
+                nonce_placement=self.nonce_placement,
+                pool=self._pool,
+                quiet=True,
+                context=self._context,
+                budget=budget,
+                strict=strict,
+            )
+
+    def amend(
+        self,
+        desired_hash: Union[str, Sequence[str]],
+        message: Optional[str] = None,
+        commit: Optional[str] = None,
+        preserve_author: bool = True,
+        match_type: MatchType = MatchType.BEGIN,
+        budget: Optional[SearchBudget] = None,
+        strict: bool = False,
+    ) -> FoundCommit:
+        """Replace the last commit, or `commit` and everything after it.
+
+        The last commit is replaced by the index and, like `git commit
+        --amend`, the working tree is reset to it. An earlier commit keeps
+        its tree, and its descendants are recreated on top of the new one.
+        The message is kept unless a new one is given. `budget` and `strict`
+        work as for `create`.
+        """
+        with self._in_repo():
+            if commit is not None:
+                return overwrite_and_rebase(
+                    desired_hash=desired_hash,
+                    message=message,
+                    commit_hash=commit,
+                    preserve_author=preserve_author,
+                    match_type=match_type,
+                    jobs=self.jobs,
+                    nonce_placement=self.nonce_placement,
+                    pool=self._pool,
+                    quiet=True,
+                    context=self._context,
+                    budget=budget,
+                    strict=strict,
+                )
+            return overwrite_a_commit_with_hash(
+                desired_hash=desired_hash,
+                message=message,
+                match_type=match_type,
+                preserve_author=preserve_author,
+                jobs=self.jobs,
+                nonce_placement=self.nonce_placement,
+                pool=self._pool,
+                quiet=True,
+                context=self._context,
+                budget=budget,
+                strict=strict,
+            )
+
+    def rewrite(self, digits: int = 3, preserve_author: bool = True) -> RewriteResult:
+        """Rewrite the current branch so that commit hashes begin with 0, 1, 2..."""
+        started = time.perf_counter()
+        with self._in_repo():
+            rewritten = rewrite_history(
+                digits=digits,
+                preserve_author=preserve_author,
+                jobs=self.jobs,
+                nonce_placement=self.nonce_placement,
+                pool=self._pool,
+                quiet=True,
+                context=self._context,
+            )
+        return RewriteResult(
+            commits={old: new.commit_hash for old, new in rewritten.items()},
+            attempts=sum(found.attempts for found in rewritten.values()),
+            elapsed=time.perf_counter() - started,
+        )
@@ -1,8 +1,15 @@
 import argparse
+import os
 import sys
 from argparse import Namespace
 from enum import Enum
-from typing import Optional
+from typing import Any, List, Optional, Tuple
+
+HASH_LENGTH = 40
+PATTERN_DIGITS = frozenset("0123456789abcdef?")
+DEFAULT_PORT = 7420
+
+Address = Tuple[str, int]
 
 
 class MatchType(Enum):
@@ -11,53 +18,341 @@ class MatchType(Enum):
     END = "end"
 
 
+class NoncePlacement(Enum):
+    HEADER = "header"
+    TRAILER = "trailer"
+    WHITESPACE = "whitespace"
+    TIMESTAMP = "timestamp"
+    SIGNATURE = "signature"
+
+
 class HashCommitArgs(Namespace):
-    hash: Optional[str]
+    hash: Optional[List[str]]
+    hash_file: Optional[List[str]]
     message: Optional[str]
     match_type: MatchType
+    nonce: Optional[NoncePlacement]
     version: bool
     verbose: int
     overwrite: bool
     no_preserve_author: bool
     commit: Optional[str]
+    jobs: int
+    gc: bool
+    command: Optional[str]
+    digits: int
+    estimate: bool
+    listen: Address
+    coordinator: Address
+    socket: Optional[str]
+    time_budget: Optional[float]
+    max_attempts: Optional[int]
+    strict: bool
 
 
-def parse_args() -> HashCommitArgs:
-    parser = argparse.ArgumentParser(
-        description="Generate a Git commit with a specific hash prefix."
-    )
-    if len(sys.argv) == 1:
-        parser.print_help(sys.stderr)
-        sys.exit(0)
+def positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
+
+def positive_float(value: str) -> float:
+    number = float(value)
+    if not number > 0:
+        raise argparse.ArgumentTypeError(f"must be positive, got {value}")
+    return number
+
+
+def hex_target(value: str) -> str:
+    target = value.lower()
+    if not set(target) <= PATTERN_DIGITS:
+        raise argparse.ArgumentTypeError(
+            f"must be hexadecimal digits or ? wildcards, got {value!r}"
+        )
+    if len(target) > HASH_LENGTH:
+        raise argparse.ArgumentTypeError(
+            f"must be at most {HASH_LENGTH} characters, got {len(target)}"
+        )
+    return target
+
+
+def pattern_file(path: str) -> List[str]:
+    """Read one pattern per line, skipping blank lines and `#` comments."""
+    try:
+        with open(path) as handle:
+            lines = [line.split("#", 1)[0].strip() for line in handle]
+    except OSError as error:
+        raise argparse.ArgumentTypeError(f"cannot read {path}: {error.strerror}")
+    try:
+        patterns = [hex_target(line) for line in lines if line]
+    except argparse.ArgumentTypeError as error:
+        raise argparse.ArgumentTypeError(f"{path}: pattern {error}")
+    if not patterns:
+        raise argparse.ArgumentTypeError(f"no patterns in {path}")
+    return patterns
+
+
+def hash_length(value: str) -> int:
+    number = positive_int(value)
+    if number > HASH_LENGTH:
+        raise argparse.ArgumentTypeError(f"must be at most {HASH_LENGTH}, got {value}")
+    return number
+
+
+def address(value: str) -> Address:
+    """Parse `host:port`, `host` or `:port`."""
+    host, _, port = value.rpartition(":") if ":" in value else (value, "", "")
+    try:
+        number = int(port) if port else DEFAULT_PORT
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid port in {value!r}")
+    if not 0 <= number <= 65535:
+        raise argparse.ArgumentTypeError(f"invalid port in {value!r}")
+    return host.strip("[]") or "0.0.0.0", number
+
+
+def shared_default(value: Any, subcommand: bool) -> Any:
+    """Default of an option that the main parser and subcommands share.
+
+    Subcommands leave it out, so that the option given before the
+    subcommand is not reset to its default when the subcommand is parsed.
+    """
+    return argparse.SUPPRESS if subcommand else value
+
 
-    parser.add_argument("--hash", help="Desired hash string.", type=str)
-    parser.add_argument("--message", help="Commit message.", type=str)
+def add_target_arguments(
+    parser: argparse.ArgumentParser, subcommand: bool = False
+) -> None:
+    parser.add_argument(
+        "--hash",
+        help=(
+            "Desired hash string. Use ? to match any hex digit, e.g. c0ffee??42. "
+            "Repeat to accept any of several patterns."
+        ),
+        type=hex_target,
+        action="append",
+        default=shared_default(None, subcommand),
+    )
+    parser.add_argument(
+        "--hash-file",
+        help="File with acceptable hash patterns, one per line.",
+        type=pattern_file,
+        default=shared_default(None, subcommand),
+    )
+    parser.add_argument(
+        "--message",
+        help="Commit message.",
+        type=str,
+        default=shared_default(None, subcommand),
+    )
     parser.add_argument(
         "--match-type",
         type=lambda mt: MatchType[mt.upper()],
         choices=list(MatchType),
-        default=MatchType.BEGIN,
+        default=shared_default(MatchType.BEGIN, subcommand),
         help="Match type.",
     )
     parser.add_argument(
-        "--version", action="store_true", help="Show the version of hashcommit."
+        "--overwrite",
+        action="store_true",
+        default=shared_default(False, subcommand),
+        help="Overwrite the existing commit instead of creating a new one.",
     )
     parser.add_argument(
-        "-v", "--verbose", action="count", default=0, help="Increase verbosity level."
+        "--commit",
+        help="Commit hash to overwrite. If not provided, the last commit will be used.",
+        type=str,
+        default=shared_default(None, subcommand),
     )
+
+
+def add_jobs_argument(
+    parser: argparse.ArgumentParser,
+    subcommand: bool = False,
+    default: Optional[int] = None,
+) -> None:
     parser.add_argument(
-        "--overwrite",
-        action="store_true",
-        help="Overwrite the existing commit instead of creating a new one.",
+        "-j",
+        "--jobs",
+        type=positive_int,
+        default=shared_default(default or os.cpu_count() or 1, subcommand),
+        help="Number of processes searching for the hash (default: CPU count).",
+    )
+
+
+def add_verbose_argument(
+    parser: argparse.ArgumentParser, subcommand: bool = False
+) -> None:
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="count",
+        default=shared_default(0, subcommand),
+        help="Increase verbosity level.",
+    )
+
+
+def add_search_arguments(
+    parser: argparse.ArgumentParser, subcommand: bool = False
+) -> None:
+    parser.add_argument(
+        "--nonce",
+        type=lambda placement: NoncePlacement[placement.upper()],
+        choices=list(NoncePlacement),
+        default=shared_default(None, subcommand),
+        help=(
+            "Where to put the value varied between attempts: an extra commit "
+            "header, a message trailer, trailing whitespace of the message, "
+            "the committer date or an armor header of the commit signature "
+            "(default: signature for commits signed with OpenPGP, header "
+            "otherwise, or whitespace when the message is too long for the "
+            "header to stay fast)."
+        ),
     )
+    add_verbose_argument(parser, subcommand)
     parser.add_argument(
         "--no-preserve-author",
         action="store_true",
+        default=shared_default(False, subcommand),
         help="Do not preserve the original commit author when overwriting.",
     )
     parser.add_argument(
-        "--commit",
-        help="Commit hash to overwrite. If not provided, the last commit will be used.",
-        type=str,
+        "--gc",
+        action="store_true",
+        default=shared_default(False, subcommand),
+        help="Run `git gc --prune=now` when done.",
+    )
+
+
+def add_budget_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--time-budget",
+        type=positive_float,
+        metavar="SECONDS",
+        help=(
+            "Stop searching after this many seconds and commit the candidate "
+            "matching the most characters of a pattern."
+        ),
+    )
+    parser.add_argument(
+        "--max-attempts",
+        type=positive_int,
+        metavar="N",
+        help=(
+            "Stop searching after about this many attempts and commit the "
+            "candidate matching the most characters of a pattern."
+        ),
+    )
+    parser.add_argument(
+        "--strict",
+        action="store_true",
+        help=(
+            "When the budget runs out without a match, fail and leave the "
+            "repository untouched."
+        ),
+    )
+
+
+def parse_args(
+    argv: Optional[List[str]] = None, default_jobs: Optional[int] = None
+) -> HashCommitArgs:
+    """Parse `argv`, or the command line.
+
+    `default_jobs` replaces the CPU count as the default of `--jobs`.
+    """
+    parser = argparse.ArgumentParser(
+        prog="hashcommit",
+        description="Generate a Git commit with a specific hash prefix.",
+    )
+    if (sys.argv[1:] if argv is None else argv) == []:
+        parser.print_help(sys.stderr)
+        sys.exit(0)
+
+    add_target_arguments(parser)
+    parser.add_argument(
+        "--version", action="store_true", help="Show the version of hashcommit."
+    )
+    parser.add_argument(
+        "--estimate",
+        action="store_true",
+        help=(
+            "Measure the hash rate on this machine and print the expected search "
+            "time without changing the repository."
+        ),
+    )
+    add_budget_arguments(parser)
+    add_search_arguments(parser)
+    add_jobs_argument(parser, default=default_jobs)
+
+    subparsers = parser.add_subparsers(dest="command")
+    rewrite = subparsers.add_parser(
+        "rewrite",
+        help="Rewrite the current branch so that commit hashes form a sequence.",
+        description=(
+            "Rewrite the history of the current branch, starting from the first "
+            "commit, so that each commit hash begins with its sequence number."
+        ),
+    )
+    rewrite.add_argument(
+        "-d",
+        "--digits",
+        type=hash_length,
+        default=3,
+        help="Number of digits for the sequence number (default: 3).",
+    )
+    add_search_arguments(rewrite, subcommand=True)
+    add_jobs_argument(rewrite, subcommand=True)
+
+    coordinator = subparsers.add_parser(
+        "coordinator",
+        help="Hand the search out to workers on other machines.",
+        description=(
+            "Build the commit to search for, then hand nonce ranges to "
+            "`hashcommit worker` processes connecting over TCP. The match is "
+            "written to the repository like a local search would."
+        ),
+    )
+    add_target_arguments(coordinator, subcommand=True)
+    coordinator.add_argument(
+        "--listen",
+        type=address,
+        default=("0.0.0.0", DEFAULT_PORT),
+        help=f"Address to wait for workers on (default: 0.0.0.0:{DEFAULT_PORT}).",
+    )
+    add_search_arguments(coordinator, subcommand=True)
+
+    worker = subparsers.add_parser(
+        "worker",
+        help="Search for a coordinator; no repository is needed.",
+        description=(
+            "Connect to a `hashcommit coordinator` and scan the nonce ranges it "
+            "hands out until a match is found."
+        ),
+    )
+    worker.add_argument(
+        "coordinator",
+        type=address,
+        help=f"Address of the coordinator, as host:port (default port: {DEFAULT_PORT}).",
+    )
+    add_jobs_argument(worker, subcommand=True)
+    add_verbose_argument(worker, subcommand=True)
+
+    serve = subparsers.add_parser(
+        "serve",
+        help="Keep search processes warm and run commands handed over by the CLI.",
+        description=(
+            "Serve hashcommit commands over a Unix domain socket. While it runs, "
+            "`hashcommit` hands its work to it instead of searching in-process."
+        ),
+    )
+    serve.add_argument(
+        "--socket",
+        help=(
+            "Path of the socket (default: $HASHCOMMIT_SOCKET, or hashcommit-<uid>"
+            ".sock in $XDG_RUNTIME_DIR or the temporary directory)."
+        ),
     )
-    return parser.parse_args(namespace=HashCommitArgs())
+    add_jobs_argument(serve, subcommand=True)
+    add_verbose_argument(serve, subcommand=True)
+    return parser.parse_args(argv, namespace=HashCommitArgs())
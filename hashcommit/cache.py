@@ -0,0 +1,71 @@
+"""Solutions of finished searches, so that repeating a search is instant.
+
+Solutions are keyed like checkpoints, on everything that defines the
+search except the committer date, and the author date when it is taken
+from the clock rather than from another commit. A solution stores the
+dates and signature its template was built from and the index of the
+winning nonce, so the same commit can be rebuilt without mining. The cache
+keeps the most recently used solutions in one file under
+`.git/hashcommit`.
+"""
+
+import json
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, Optional
+
+from .checkpoint import state_dir, write_json
+
+SOLUTION_CACHE_SIZE = 1024
+
+
+@dataclass(frozen=True)
+class Solution:
+    timestamp: str
+    author: str
+    signature: Optional[str]
+    nonce_index: int
+    commit_hash: str
+
+
+def solution_cache_path() -> Path:
+    return state_dir() / "solutions.json"
+
+
+def _read_solutions() -> Dict[str, Dict]:
+    try:
+        solutions = json.loads(solution_cache_path().read_text())
+    except (OSError, ValueError):
+        return {}
+    return solutions if isinstance(solutions, dict) else {}
+
+
+def load_solution(key: str) -> Optional[Solution]:
+    """Return the cached solution for `key` and mark it as recently used."""
+    solutions = _read_solutions()
+    entry = solutions.pop(key, None)
+    if entry is None:
+        return None
+    try:
+        solution = Solution(**entry)
+    except TypeError:
+        return None
+    solutions[key] = entry
+    write_json(solution_cache_path(), solutions)
+    return solution
+
+
+def store_solution(key: str, solution: Solution) -> None:
+    """Cache `solution`, evicting the least recently used beyond the limit."""
+    solutions = _read_solutions()
+    solutions.pop(key, None)
+    solutions[key] = asdict(solution)
+    for stale in list(solutions)[: max(0, len(solutions) - SOLUTION_CACHE_SIZE)]:
+        del solutions[stale]
+    write_json(solution_cache_path(), solutions)
+
+
+def forget_solution(key: str) -> None:
+    solutions = _read_solutions()
+    if solutions.pop(key, None) is not None:
+        write_json(solution_cache_path(), solutions)
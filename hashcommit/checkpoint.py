@@ -0,0 +1,115 @@
+"""Saved progress of long searches, so that an interrupted search resumes.
+
+A checkpoint is keyed on everything that defines the search: tree,
+parents, message, identities, the author date when it comes from another
+commit, signing key, nonce placement and patterns. It stores the dates and
+signature the interrupted run built its template from, so that a later run
+rebuilds the very same template, and the number of candidates already
+checked. Ranges are collected in order, so the completed ranges always
+form one prefix of the nonce sequence.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+from dataclasses import asdict, dataclass, replace
+from pathlib import Path
+from typing import Any, Optional
+
+from .engine import CommitTemplate
+from .gitio import object_reader
+from .utils import run_subprocess
+
+CHECKPOINT_INTERVAL = 30.0
+
+
+@dataclass(frozen=True)
+class Checkpoint:
+    key: str
+    template: str
+    timestamp: str
+    author: str
+    signature: Optional[str]
+    completed: int
+
+
+def job_key(**inputs: Any) -> str:
+    """Fingerprint the inputs of a search."""
+    encoded = json.dumps(inputs, sort_keys=True).encode()
+    return hashlib.sha1(encoded).hexdigest()
+
+
+def template_fingerprint(template: CommitTemplate) -> str:
+    digest = hashlib.sha1(template.prefix)
+    digest.update(b"%d\0" % template.nonce_width + template.tail)
+    return digest.hexdigest()
+
+
+def state_dir() -> Path:
+    """Directory of the state hashcommit keeps in the repository."""
+    store = object_reader().store
+    if store is not None:
+        return store.git_dir / "hashcommit"
+    result = run_subprocess(["git", "rev-parse", "--git-path", "hashcommit"])
+    return Path(result.stdout.decode().strip())
+
+
+def checkpoint_dir() -> Path:
+    return state_dir() / "checkpoints"
+
+
+def write_json(path: Path, data: Any) -> None:
+    """Write `data` atomically, so a kill never leaves half a file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(
+        "w", dir=path.parent, suffix=".tmp", delete=False
+    ) as handle:
+        json.dump(data, handle)
+    os.replace(handle.name, path)
+
+
+def load_checkpoint(key: str) -> Optional[Checkpoint]:
+    try:
+        data = json.loads((checkpoint_dir() / f"{key}.json").read_text())
+        return Checkpoint(**data)
+    except (OSError, ValueError, TypeError):
+        return None
+
+
+def save_checkpoint(checkpoint: Checkpoint) -> None:
+    write_json(checkpoint_dir() / f"{checkpoint.key}.json", asdict(checkpoint))
+
+
+def remove_checkpoint(key: str) -> None:
+    try:
+        (checkpoint_dir() / f"{key}.json").unlink()
+    except FileNotFoundError:
+        pass
+
+
+class Checkpointer:
+    """Progress callback saving the searched prefix every `interval` seconds."""
+
+    def __init__(
+        self, checkpoint: Checkpoint, interval: float = CHECKPOINT_INTERVAL
+    ) -> None:
+        self.checkpoint = checkpoint
+        self.interval = interval
+        # The search reports its attempts since it resumed from here.
+        self._resumed_from = checkpoint.completed
+        self._saved = checkpoint.completed
+        self._last_save = time.monotonic()
+
+    def __call__(self, attempts: int) -> None:
+        completed = self._resumed_from + attempts
+        self.checkpoint = replace(self.checkpoint, completed=completed)
+        if time.monotonic() - self._last_save >= self.interval:
+            self.save()
+
+    def save(self) -> None:
+        if self.checkpoint.completed > self._saved:
+            save_checkpoint(self.checkpoint)
+            self._saved = self.checkpoint.completed
+            self._last_save = time.monotonic()
@@ -0,0 +1,127 @@
+"""Handing commands to a running `hashcommit serve` daemon.
+
+This is all the command line needs before it knows whether it runs the
+command itself, so it imports nothing that searches.
+"""
+
+import base64
+import logging
+import os
+import socket
+import stat
+import struct
+import sys
+import tempfile
+from typing import Dict, List, Optional
+
+from .args import HashCommitArgs
+from .connection import Connection
+
+PROTOCOL_VERSION = 1
+SOCKET_ENV = "HASHCOMMIT_SOCKET"
+NO_DAEMON_ENV = "HASHCOMMIT_NO_DAEMON"
+
+LOCAL_COMMANDS = ("serve", "worker", "coordinator")
+
+
+def default_socket_path() -> str:
+    if os.environ.get(SOCKET_ENV):
+        return os.environ[SOCKET_ENV]
+    directory = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return os.path.join(directory, f"hashcommit-{os.getuid()}.sock")
+
+
+def can_forward(args: HashCommitArgs) -> bool:
+    """Whether the daemon may run the command; the others talk to the terminal
+    or the network themselves."""
+    return args.command not in LOCAL_COMMANDS and not args.version
+
+
+def git_environment() -> Dict[str, str]:
+    """The variables that decide how git behaves for the client."""
+    return {
+        name: value
+        for name, value in os.environ.items()
+        if name.startswith("GIT_") or name == "EMAIL"
+    }
+
+
+def is_trusted_socket(path: str) -> bool:
+    """Whether the socket at `path` is private to this user.
+
+    In a shared temporary directory, another user could create the socket
+    first and receive every command, working directory and environment.
+    """
+    try:
+        status = os.lstat(path)
+    except OSError:
+        return False
+    if not stat.S_ISSOCK(status.st_mode):
+        return False
+    if status.st_uid != os.getuid() or status.st_mode & 0o077:
+        logging.warning(f"Ignoring {path}: it is not private to this user")
+        return False
+    return True
+
+
+def is_trusted_peer(sock: socket.socket) -> bool:
+    """Whether the daemon on the other end runs as this user, where the
+    platform tells."""
+    if not hasattr(socket, "SO_PEERCRED"):
+        return True
+    credentials = sock.getsockopt(
+        socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")
+    )
+    _, uid, _ = struct.unpack("3i", credentials)
+    if uid != os.getuid():
+        logging.warning("Ignoring a hashcommit daemon run by another user")
+        return False
+    return True
+
+
+def forward_to_daemon(argv: List[str]) -> Optional[int]:
+    """Run the command `argv` in the daemon and return its exit code.
+
+    Returns None when no daemon is listening, or the socket or daemon
+    belongs to another user, so that the command runs in-process instead.
+    """
+    if os.environ.get(NO_DAEMON_ENV) or not hasattr(socket, "AF_UNIX"):
+        return None
+    path = default_socket_path()
+    if not is_trusted_socket(path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        return None
+    if not is_trusted_peer(sock):
+        sock.close()
+        return None
+    with sock:
+        connection = Connection(sock)
+        connection.send(
+            {
+                "type": "run",
+                "version": PROTOCOL_VERSION,
+                "argv": argv,
+                "cwd": os.getcwd(),
+                "env": git_environment(),
+            }
+        )
+        try:
+            reply = connection.receive()
+        except ConnectionError:
+            raise RuntimeError(f"The hashcommit daemon at {path} closed the connection")
+    if reply.get("type") != "exit":
+        logging.warning(f"The hashcommit daemon refused the command: {reply}")
+        return None
+    for stream, output in (
+        (sys.stdout, reply["stdout"]),
+        (sys.stderr, reply["stderr"]),
+    ):
+        stream.flush()
+        stream.buffer.write(base64.b64decode(output))
+        stream.flush()
+    return int(reply["code"])
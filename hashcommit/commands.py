@@ -0,0 +1,158 @@
+"""Running commands in this process, for the command line and the daemon."""
+
+import logging
+import sys
+from typing import Optional
+
+from .args import HashCommitArgs
+from .commit import (
+    create_a_commit_with_hash,
+    estimate_search,
+    overwrite_a_commit_with_hash,
+    overwrite_and_rebase,
+)
+from .daemon import serve
+from .distributed import run_worker
+from .engine import SearchBudget, WorkerPool
+from .git import CommitContext, is_in_git_repo
+from .gitio import close_git_io
+from .rewrite import rewrite_history
+from .utils import run_subprocess
+from .version import VERSION
+
+
+def run_command(
+    args: HashCommitArgs,
+    pool: Optional[WorkerPool] = None,
+    context: Optional[CommitContext] = None,
+) -> int:
+    if args.command == "rewrite":
+        rewrite_history(
+            digits=args.digits,
+            preserve_author=not args.no_preserve_author,
+            jobs=args.jobs,
+            nonce_placement=args.nonce,
+            pool=pool,
+            context=context,
+        )
+        return 0
+    if args.command == "worker":
+        run_worker(args.coordinator, jobs=args.jobs)
+        return 0
+    if args.command == "serve":
+        return serve(args.socket, args.jobs, run)
+
+    listen = args.listen if args.command == "coordinator" else None
+    desired_hashes = [
+        text for text in (args.hash or []) + (args.hash_file or []) if text
+    ]
+    if not desired_hashes:
+        print("Error: --hash argument is required.", file=sys.stderr)
+        return 1
+
+    budget = None
+    if args.time_budget or args.max_attempts:
+        budget = SearchBudget(seconds=args.time_budget, attempts=args.max_attempts)
+    elif args.strict:
+        print(
+            "Error: --strict requires --time-budget or --max-attempts.",
+            file=sys.stderr,
+        )
+        return 1
+
+    if args.estimate:
+        print(
+            estimate_search(
+                desired_hash=desired_hashes,
+                message=args.message or "",
+                match_type=args.match_type,
+                jobs=args.jobs,
+                nonce_placement=args.nonce,
+            )
+        )
+        return 0
+
+    if args.overwrite:
+        if args.commit:
+            overwrite_and_rebase(
+                desired_hash=desired_hashes,
+                message=args.message,
+                commit_hash=args.commit,
+                preserve_author=not args.no_preserve_author,
+                match_type=args.match_type,
+                jobs=args.jobs,
+                nonce_placement=args.nonce,
+                listen=listen,
+                pool=pool,
+                context=context,
+                budget=budget,
+                strict=args.strict,
+            )
+        else:
+            overwrite_a_commit_with_hash(
+                desired_hash=desired_hashes,
+                message=args.message,
+                match_type=args.match_type,
+                preserve_author=not args.no_preserve_author,
+                jobs=args.jobs,
+                nonce_placement=args.nonce,
+                listen=listen,
+                pool=pool,
+                context=context,
+                budget=budget,
+                strict=args.strict,
+            )
+    else:
+        if not args.message:
+            print(
+                "Error: --message argument is required if not using --overwrite.",
+                file=sys.stderr,
+            )
+            return 1
+        create_a_commit_with_hash(
+            desired_hash=desired_hashes,
+            message=args.message,
+            match_type=args.match_type,
+            jobs=args.jobs,
+            nonce_placement=args.nonce,
+            listen=listen,
+            pool=pool,
+            context=context,
+            budget=budget,
+            strict=args.strict,
+        )
+    return 0
+
+
+def run(
+    args: HashCommitArgs,
+    pool: Optional[WorkerPool] = None,
+    context: Optional[CommitContext] = None,
+) -> int:
+    """Run the command described by `args` in this process.
+
+    The daemon passes its warm `pool` and the `context` it cached for the
+    repository, which it has already found.
+    """
+    if args.version:
+        print(f"hashcommit {VERSION}")
+        return 0
+
+    in_repo = context is not None or args.command in ("worker", "serve")
+    if not in_repo and not is_in_git_repo():
+        print("fatal: not a git repository", file=sys.stderr)
+        return 1
+
+    try:
+        return run_command(args, pool, context)
+    except KeyboardInterrupt:
+        print("\nProcess interrupted by user")
+        return 3
+    except RuntimeError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    finally:
+        close_git_io()
+        if args.gc:
+            logging.info("Running git garbage collection")
+            run_subprocess(["git", "gc", "--prune=now"])
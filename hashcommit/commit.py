@@ -1,226 +1,803 @@
+import itertools
 import logging
 import subprocess
+import sys
+import time
+from dataclasses import dataclass, replace
 from datetime import datetime, timedelta
-from typing import Callable, Dict, Optional, Tuple
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
 
-from .args import MatchType
+from .args import Address, MatchType, NoncePlacement
+from .cache import Solution, forget_solution, load_solution, store_solution
+from .checkpoint import (
+    Checkpoint,
+    Checkpointer,
+    job_key,
+    load_checkpoint,
+    remove_checkpoint,
+    template_fingerprint,
+)
+from .distributed import coordinate
+from .engine import (
+    CommitTemplate,
+    CommitterDateNonce,
+    NonceScheme,
+    SearchBudget,
+    SearchJob,
+    SearchResult,
+    WorkerPool,
+    ends_in_last_blocks,
+    format_commit_object,
+    format_git_date,
+    hash_commit_object,
+    nonce_template,
+    search,
+    search_within_budget,
+    use_batch_kernel,
+)
+from .estimate import (
+    CALIBRATION_SECONDS,
+    ProgressReporter,
+    calibrate,
+    format_estimate,
+    match_probability,
+)
 from .git import (
-    create_git_env,
-    extract_stdout,
+    EMPTY_TREE_HASH,
+    CommitContext,
+    derive_commit_context,
+    format_timestamp,
     get_head_hash,
-    get_parent_head_hash,
     get_tree_hash,
+    is_ancestor,
+    list_commit_parents,
+    read_commit,
+    read_commit_object,
+    refresh_commit_context,
+    resolve_commit_context,
     run_commit_tree,
+    update_head,
+    write_commit_object,
 )
-from .utils import run_subprocess
-
-
-def create_a_commit(
-    message: str, timestamp: str, related_commit_hash: Optional[str]
-) -> subprocess.CompletedProcess:
-    return run_subprocess(
-        ["git", "commit", "--allow-empty", "-m", message],
-        env=create_git_env(
-            timestamp=timestamp,
-            preserve_author=False,
-            related_commit_hash=related_commit_hash,
-        ),
+from .gitio import object_reader, packed_writes, replace_parents
+from .pattern import PatternSet
+from .signing import (
+    SigningConfig,
+    add_signature,
+    search_signed,
+    sign_payload,
+    signature_template,
+)
+
+
+@dataclass(frozen=True)
+class SearchSpace:
+    placement: NoncePlacement
+    template: CommitTemplate
+    nonces: NonceScheme
+    signature: Optional[bytes] = None
+
+
+def prepare_search_space(
+    message: str,
+    tree_hash: str,
+    parent_hashes: Sequence[str],
+    context: CommitContext,
+    nonce_placement: Optional[NoncePlacement],
+    signature: Optional[bytes] = None,
+) -> SearchSpace:
+    """Pick the nonce placement and build the template to mine.
+
+    Commits signed with OpenPGP default to the signature placement, which
+    signs the commit once and varies an armor header of the signature.
+    Other commits default to the header placement, unless the message is
+    too long for it: the header comes before the message, which every
+    candidate would then hash again, so trailing whitespace is varied
+    instead. `signature` reuses a signature made for the same payload
+    before.
+    """
+    signing = context.signing
+    automatic = nonce_placement is None
+    if nonce_placement is None:
+        if signing and signing.has_armor_headers:
+            nonce_placement = NoncePlacement.SIGNATURE
+        else:
+            nonce_placement = NoncePlacement.HEADER
+
+    if nonce_placement != NoncePlacement.SIGNATURE:
+
+        def build(placement: NoncePlacement) -> Tuple[CommitTemplate, NonceScheme]:
+            return nonce_template(
+                placement=placement,
+                tree_hash=tree_hash,
+                parent_hashes=parent_hashes,
+                author=context.author,
+                committer=context.committer,
+                message=message,
+                encoding=context.encoding,
+                start=context.timestamp,
+            )
+
+        template, nonces = build(nonce_placement)
+        if automatic and not ends_in_last_blocks(template):
+            nonce_placement = NoncePlacement.WHITESPACE
+            template, nonces = build(nonce_placement)
+        return SearchSpace(nonce_placement, template, nonces)
+
+    if not signing or not signing.has_armor_headers:
+        raise RuntimeError("The signature nonce requires commits signed with OpenPGP")
+    payload = format_commit_object(
+        tree_hash=tree_hash,
+        parent_hashes=parent_hashes,
+        author=context.author,
+        committer=f"{context.committer} {format_git_date(context.timestamp)}",
+        message=message,
+        encoding=context.encoding,
     )
+    signature = signature or sign_payload(payload, signing)
+    template, nonces = signature_template(payload, signature)
+    return SearchSpace(nonce_placement, template, nonces, signature)
+
+
+@dataclass(frozen=True)
+class FoundCommit:
+    """A commit written to the repository and how it was found.
+
+    `exact` is False for the closest candidate of a search whose budget
+    ran out.
+    """
+
+    commit_hash: str
+    attempts: int
+    elapsed: float
+    reused: bool = False
+    exact: bool = True
+
 
+def report_match(commit_hash: str, patterns: PatternSet) -> None:
+    print(f"Found matching commit hash: {commit_hash}")
+    if len(patterns) > 1:
+        matched = patterns.matching(bytes.fromhex(commit_hash))
+        assert matched is not None
+        print(f"Matched pattern: {matched.text}")
 
-def create_commit_content(message: Optional[str], number: int) -> str:
-    return f"""\
-{message or ''}
 
---- meta: {number} ---
-""".strip()
+def describe_closeness(commit_hash: str, patterns: PatternSet) -> str:
+    """Say how much of the closest pattern `commit_hash` matches."""
+    pattern, matched = patterns.closest(bytes.fromhex(commit_hash))
+    return f"{matched} of {len(pattern.text)} characters of {pattern.text}"
 
 
 def find_commit_content(
-    desired_hash: str,
+    desired_hash: Union[str, Sequence[str]],
     message: str,
     match_type: MatchType,
     tree_hash: str,
-    head_hash: Optional[str],
-    preserve_author: bool,
-    related_commit_hash: Optional[str],
-) -> Tuple[str, str]:
-
-    def compare(value: str) -> bool:
-        mapping: Dict[MatchType, Callable[[], bool]] = {
-            MatchType.BEGIN: lambda: value.startswith(desired_hash),
-            MatchType.END: lambda: value.endswith(desired_hash),
-            MatchType.CONTAIN: lambda: desired_hash in value,
-        }
-        return mapping[match_type]()
-
-    timestamp = datetime.now()
-    logging.debug(f"Starting from: {timestamp}")
-    while True:
+    parent_hashes: Sequence[str],
+    context: CommitContext,
+    jobs: int = 1,
+    nonce_placement: Optional[NoncePlacement] = None,
+    listen: Optional[Address] = None,
+    pool: Optional[WorkerPool] = None,
+    quiet: bool = False,
+    budget: Optional[SearchBudget] = None,
+    strict: bool = False,
+    remember: bool = True,
+) -> FoundCommit:
+    """Search for a commit matching `desired_hash` and write it to the repository.
+
+    `desired_hash` is one pattern or several acceptable ones. `pool` reuses
+    search processes kept alive by the caller; `quiet` prints nothing.
+    Without `remember`, the search neither reuses nor saves checkpoints and
+    solutions, which only pay off for long searches.
+
+    With a `budget`, the search stops when it is spent and writes the
+    candidate matching the most characters of a pattern instead, or with
+    `strict` raises `RuntimeError` and writes nothing. Budgets are only
+    supported for searches hashing candidates locally and in-process.
+
+    Candidates are hashed in-process and only the winning commit object is
+    written. Signed commits are either signed once with the nonce in the
+    signature or signed in-process for each candidate. SSH signatures still
+    go through `git commit-tree` for each attempt.
+
+    With `listen`, the candidates are hashed by workers connecting to that
+    address instead of by local processes.
+    """
+
+    started = time.perf_counter()
+    say = _silent if quiet else print
+    patterns = PatternSet.compile(desired_hash, match_type)
+    probability = match_probability(patterns)
+    logging.info(f"Expected attempts: {1 / probability:,.0f}")
+
+    if budget and listen:
+        raise RuntimeError("Distributed searches do not support a search budget")
+    if context.signing and not context.signing.in_process:
+        if listen:
+            raise RuntimeError("Distributed searches cannot sign commits with SSH")
+        if budget:
+            raise RuntimeError("Searches signing with SSH do not support a budget")
+        return find_commit_with_git(
+            patterns, message, tree_hash, parent_hashes, context, probability, quiet
+        )
+
+    key = job_key(
+        tree=tree_hash,
+        parents=list(parent_hashes),
+        message=message,
+        author=context.author.rsplit(" ", 2)[0],
+        # A date from the clock is taken from the checkpoint or solution
+        # instead; one from another commit is what the search is for.
+        author_date=(
+            context.author.rsplit(" ", 2)[1:] if context.fixed_author_date else None
+        ),
+        committer=context.committer,
+        encoding=context.encoding,
+        signing=context.signing.key if context.signing else None,
+        placement=nonce_placement.value if nonce_placement else None,
+        patterns=[pattern.text for pattern in patterns.patterns],
+        match_type=match_type.value,
+    )
+    cached = None
+    if remember:
+        cached = reuse_solution(
+            key, patterns, message, tree_hash, parent_hashes, context, nonce_placement
+        )
+    if cached:
+        commit_hash, body = cached
+        say("Reusing the solution of an earlier search")
+        write_match(commit_hash, body, patterns, quiet)
+        return FoundCommit(commit_hash, 0, time.perf_counter() - started, True)
+
+    # Workers report ranges out of order, so distributed searches have no
+    # searched prefix to save.
+    saved = load_checkpoint(key) if remember and not listen else None
+    signature = None
+    if saved:
+        context = resume_context(context, saved)
+        signature = saved.signature.encode() if saved.signature else None
+    logging.debug(f"Starting from: {context.timestamp}")
+    space = prepare_search_space(
+        message, tree_hash, parent_hashes, context, nonce_placement, signature
+    )
+    template, nonces = space.template, space.nonces
+    fingerprint = template_fingerprint(template)
+    resume_from = 0
+    if saved and saved.template == fingerprint:
+        resume_from = saved.completed
+        say(f"Resuming the search after {resume_from:,} attempts")
+
+    progress = None
+    if sys.stderr.isatty() and not quiet:
+        progress = ProgressReporter(probability, previous_attempts=resume_from)
+    job = SearchJob(
+        template, nonces, patterns, batch=use_batch_kernel(template, patterns)
+    )
+    if context.signing and space.placement != NoncePlacement.SIGNATURE:
+        if listen:
+            raise RuntimeError(
+                "Distributed searches of signed commits need the signature nonce"
+            )
+        if budget:
+            raise RuntimeError(
+                "Searches signing every candidate do not support a budget"
+            )
+        logging.debug("Commits will be signed, signing every candidate")
+        result, body = search_signed(job, context.signing, progress)
+    elif listen:
+        try:
+            result = coordinate(job, listen, progress)
+        finally:
+            if progress:
+                progress.finish()
+        body = template.body(result.nonce)
+    else:
+        logging.debug(
+            f"Searching with {jobs} job(s), nonce: {space.placement.value}, "
+            f"batch kernel: {job.batch}"
+        )
+        checkpointer = None
+        if remember:
+            checkpointer = Checkpointer(
+                Checkpoint(
+                    key=key,
+                    template=fingerprint,
+                    timestamp=context.timestamp.isoformat(),
+                    author=context.author,
+                    signature=space.signature.decode() if space.signature else None,
+                    completed=resume_from,
+                )
+            )
+
+        def report(attempts: int) -> None:
+            if checkpointer:
+                checkpointer(attempts)
+            if progress:
+                progress(attempts)
+
+        try:
+            if budget:
+                closest = search_within_budget(
+                    job,
+                    budget,
+                    jobs,
+                    progress=report,
+                    resume_from=resume_from,
+                    pool=pool,
+                )
+            else:
+                closest = search(
+                    job, jobs=jobs, progress=report, resume_from=resume_from, pool=pool
+                )
+        except BaseException:
+            if checkpointer:
+                checkpointer.save()
+            raise
+        finally:
+            if progress:
+                progress.finish()
+        if closest is None or not patterns.matches_hex(closest.commit_hash):
+            if closest is None or strict:
+                # Nothing is committed, so a later search picks up where
+                # this one ran out.
+                if checkpointer:
+                    checkpointer.save()
+            if closest is None:
+                raise RuntimeError("The search budget ran out before the first attempt")
+            if strict:
+                raise RuntimeError(
+                    f"No match within the search budget; the closest hash "
+                    f"{closest.commit_hash} matched "
+                    f"{describe_closeness(closest.commit_hash, patterns)}"
+                )
+            found = write_closest(closest, template, patterns, started, quiet)
+            # HEAD moves past the commit searched for, so nothing resumes it.
+            if remember:
+                remove_checkpoint(key)
+            return found
+        result = closest
+        body = template.body(result.nonce)
+    if isinstance(nonces, CommitterDateNonce):
+        logging.debug(f"End timestamp: {nonces.timestamp(result.nonce_index)}")
+    else:
+        logging.debug(f"Nonce: {result.nonce!r}")
+    logging.debug(f"Attempts: {result.attempts}")
+    write_match(result.commit_hash, body, patterns, quiet)
+    if remember:
+        remove_checkpoint(key)
+    if remember and (
+        not context.signing or space.placement == NoncePlacement.SIGNATURE
+    ):
+        store_solution(
+            key,
+            Solution(
+                timestamp=context.timestamp.isoformat(),
+                author=context.author,
+                signature=space.signature.decode() if space.signature else None,
+                nonce_index=result.nonce_index,
+                commit_hash=result.commit_hash,
+            ),
+        )
+    elapsed = time.perf_counter() - started
+    return FoundCommit(result.commit_hash, result.attempts, elapsed)
+
+
+def _silent(text: str) -> None:
+    pass
+
+
+def write_closest(
+    result: SearchResult,
+    template: CommitTemplate,
+    patterns: PatternSet,
+    started: float,
+    quiet: bool = False,
+) -> FoundCommit:
+    """Write the closest candidate of a search whose budget ran out."""
+    logging.debug(f"Attempts: {result.attempts}")
+    if not quiet:
+        print(f"Search budget spent, closest commit hash: {result.commit_hash}")
+        print(f"Matched {describe_closeness(result.commit_hash, patterns)}")
+    written_hash = write_commit_object(template.body(result.nonce))
+    if written_hash != result.commit_hash:
+        raise RuntimeError(
+            f"git stored the commit as {written_hash}, expected {result.commit_hash}"
+        )
+    elapsed = time.perf_counter() - started
+    return FoundCommit(result.commit_hash, result.attempts, elapsed, exact=False)
+
+
+def write_match(
+    commit_hash: str, body: bytes, patterns: PatternSet, quiet: bool = False
+) -> None:
+    if not quiet:
+        report_match(commit_hash, patterns)
+    written_hash = write_commit_object(body)
+    if written_hash != commit_hash:
+        raise RuntimeError(
+            f"git stored the commit as {written_hash}, expected {commit_hash}"
+        )
+
+
+def reuse_solution(
+    key: str,
+    patterns: PatternSet,
+    message: str,
+    tree_hash: str,
+    parent_hashes: Sequence[str],
+    context: CommitContext,
+    nonce_placement: Optional[NoncePlacement],
+) -> Optional[Tuple[str, bytes]]:
+    """Rebuild the commit an earlier search with the same `key` found.
+
+    Returns its hash and body. The commit is rebuilt from the cached dates
+    and nonce and rehashed, so a stale or corrupt entry is dropped rather
+    than trusted.
+    """
+    solution = load_solution(key)
+    if solution is None:
+        return None
+    context = resume_context(context, solution)
+    signature = solution.signature.encode() if solution.signature else None
+    space = prepare_search_space(
+        message, tree_hash, parent_hashes, context, nonce_placement, signature
+    )
+    try:
+        nonce = space.nonces.nonce(solution.nonce_index)
+        digest = space.template.digest(nonce)
+    except ValueError:
+        digest = b""
+    if digest.hex() != solution.commit_hash or not patterns.matches(digest):
+        logging.warning("Ignoring a cached solution that does not match")
+        forget_solution(key)
+        return None
+    return solution.commit_hash, space.template.body(nonce)
+
+
+def find_commit_with_git(
+    patterns: PatternSet,
+    message: str,
+    tree_hash: str,
+    parent_hashes: Sequence[str],
+    context: CommitContext,
+    probability: float,
+    quiet: bool = False,
+) -> FoundCommit:
+    """Search by running `git commit-tree` for every candidate.
+
+    Used for SSH-signed commits, which hashcommit cannot sign itself.
+    """
+    logging.debug("Commits will be signed, hashing candidates with git")
+    started = time.perf_counter()
+    progress = None
+    if sys.stderr.isatty() and not quiet:
+        progress = ProgressReporter(probability)
+    timestamp = context.timestamp
+    for attempts in itertools.count():
+        if progress:
+            progress(attempts)
         timestamp -= timedelta(seconds=1)
-        timestamp_str = timestamp.astimezone().strftime("%a %b %d %H:%M:%S %Y %z")
-        content = message
         commit_hash = run_commit_tree(
             tree_hash,
-            content,
-            timestamp_str,
-            head_hash,
-            preserve_author,
-            related_commit_hash,
+            message,
+            format_timestamp(timestamp),
+            parent_hashes,
+            context,
         )
-
-        if compare(commit_hash):
+        if patterns.matches_hex(commit_hash):
             logging.debug(f"End timestamp: {timestamp}")
-            print(f"Found matching commit hash: {commit_hash}")
-            return content, timestamp_str
+            if progress:
+                progress.finish()
+            if not quiet:
+                report_match(commit_hash, patterns)
+            elapsed = time.perf_counter() - started
+            return FoundCommit(commit_hash, attempts + 1, elapsed)
+    raise AssertionError("unreachable")
+
+
+def resume_context(
+    context: CommitContext, saved: Union[Checkpoint, Solution]
+) -> CommitContext:
+    """Reuse the dates of an earlier run, which are part of the template."""
+    timestamp = datetime.fromisoformat(saved.timestamp)
+    author_date = " ".join(saved.author.rsplit(" ", 2)[1:])
+    env = {
+        **context.env,
+        "GIT_AUTHOR_DATE": author_date,
+        "GIT_COMMITTER_DATE": format_timestamp(timestamp),
+    }
+    return replace(context, env=env, author=saved.author, timestamp=timestamp)
+
+
+def estimate_search(
+    desired_hash: Union[str, Sequence[str]],
+    message: str,
+    match_type: MatchType,
+    jobs: int = 1,
+    nonce_placement: Optional[NoncePlacement] = None,
+) -> str:
+    """Time a short search on this machine and describe the expected run.
+
+    Nothing is written to the repository. The rate of one process is
+    measured and assumed to scale with `jobs`.
+    """
+    patterns = PatternSet.compile(desired_hash, match_type)
+    context = resolve_commit_context(preserve_author=False, related_commit_hash=None)
+    if context.signing and not context.signing.in_process:
+        raise RuntimeError("Cannot estimate searches for SSH-signed commits")
+    head_hash = get_head_hash()
+    tree_hash = read_commit().tree if head_hash else EMPTY_TREE_HASH
+    parent_hashes = [head_hash] if head_hash else []
+    space = prepare_search_space(
+        message, tree_hash, parent_hashes, context, nonce_placement
+    )
+    template = space.template
+    job = SearchJob(
+        template, space.nonces, patterns, batch=use_batch_kernel(template, patterns)
+    )
+    if context.signing and space.placement != NoncePlacement.SIGNATURE:
+        # Every candidate is signed separately, so gpg sets the pace.
+        jobs = 1
+        started = time.perf_counter()
+        search_signed(job, context.signing)
+        rate = 1 / (time.perf_counter() - started)
+    else:
+        rate = calibrate(job, CALIBRATION_SECONDS) * jobs
+    return format_estimate(patterns, rate, jobs)
 
 
 def create_a_commit_with_hash(
-    desired_hash: str, message: str, match_type: MatchType
-) -> None:
+    desired_hash: Union[str, Sequence[str]],
+    message: str,
+    match_type: MatchType,
+    jobs: int = 1,
+    nonce_placement: Optional[NoncePlacement] = None,
+    listen: Optional[Address] = None,
+    pool: Optional[WorkerPool] = None,
+    quiet: bool = False,
+    context: Optional[CommitContext] = None,
+    budget: Optional[SearchBudget] = None,
+    strict: bool = False,
+) -> FoundCommit:
     logging.debug(f"Creating a commit with hash: {desired_hash} ({match_type})")
     head_hash = get_head_hash()
     logging.debug(f"HEAD: {head_hash}")
     tree_hash = get_tree_hash()
     logging.debug(f"Tree: {tree_hash}")
-    content, timestamp = find_commit_content(
+    found = find_commit_content(
         desired_hash=desired_hash,
         message=message,
         match_type=match_type,
         tree_hash=tree_hash,
-        head_hash=head_hash,
-        preserve_author=False,
-        related_commit_hash=None,
+        parent_hashes=[head_hash] if head_hash else [],
+        context=resolve_context(
+            preserve_author=False, related_commit_hash=None, base=context
+        ),
+        jobs=jobs,
+        nonce_placement=nonce_placement,
+        listen=listen,
+        pool=pool,
+        quiet=quiet,
+        budget=budget,
+        strict=strict,
     )
-    create_a_commit(message=content, timestamp=timestamp, related_commit_hash=None)
+    subject = (message.splitlines() or [""])[0]
+    update_head(found.commit_hash, f"commit: {subject}")
+    return found
+
+
+def resolve_context(
+    preserve_author: bool,
+    related_commit_hash: Optional[str],
+    base: Optional[CommitContext] = None,
+) -> CommitContext:
+    """Resolve the context of a new commit, or derive it from `base`.
+
+    `base` is a context resolved earlier without preserving the author; its
+    identities, encoding and signing configuration are reused and only the
+    dates and the related commit are looked up again.
+    """
+    if base is None:
+        return resolve_commit_context(
+            preserve_author=preserve_author, related_commit_hash=related_commit_hash
+        )
+    context = refresh_commit_context(base)
+    related = object_reader().read_commit(related_commit_hash or "HEAD")
+    if related is None:
+        return context
+    return derive_commit_context(context, related, preserve_author)
 
 
 def get_commit_message(commit: Optional[str] = None) -> str:
-    args = ["git", "show", "--no-patch", "--format=%B"]
-    if commit:
-        args.append(commit)
-    result = run_subprocess(args)
-    return extract_stdout(result)
+    return read_commit(commit).message.strip()
 
 
-def amend_a_commit(
-    timestamp: str,
-    tree_hash: str,
-    parent_hash: Optional[str],
-    content: str,
-    preserve_author: bool,
-    related_commit_hash: str,
-) -> None:
-    """Amend the last commit with new content."""
-    new_commit_hash = run_commit_tree(
-        tree_hash=tree_hash,
-        content=content,
-        timestamp=timestamp,
-        head_hash=parent_hash,
-        preserve_author=preserve_author,
-        related_commit_hash=related_commit_hash,
-    )
+def amend_a_commit(new_commit_hash: str, quiet: bool = False) -> None:
+    """Move HEAD to the replacement of the last commit."""
     subprocess.run(
-        ["git", "reset", "--hard", new_commit_hash],
+        ["git", "reset", "--hard", *(["-q"] if quiet else []), new_commit_hash],
         check=True,
     )
 
 
 def overwrite_a_commit_with_hash(
-    desired_hash: str,
+    desired_hash: Union[str, Sequence[str]],
     message: Optional[str],
     match_type: MatchType,
     preserve_author: bool,
-) -> None:
+    jobs: int = 1,
+    nonce_placement: Optional[NoncePlacement] = None,
+    listen: Optional[Address] = None,
+    pool: Optional[WorkerPool] = None,
+    quiet: bool = False,
+    context: Optional[CommitContext] = None,
+    budget: Optional[SearchBudget] = None,
+    strict: bool = False,
+) -> FoundCommit:
     logging.debug(f"Overwriting a commit with hash: {desired_hash} ({match_type})")
     current_hash = get_head_hash()
     if not current_hash:
         raise ValueError("No commit to overwrite")
     logging.debug(f"HEAD: {current_hash}")
-    head_hash = get_parent_head_hash()
-    logging.debug(f"HEAD^: {head_hash}")
+    parent_hashes = read_commit(current_hash).parents
+    logging.debug(f"Parents: {parent_hashes}")
     tree_hash = get_tree_hash()
     logging.debug(f"Tree: {tree_hash}")
     commit_message = message or get_commit_message()
-    content, timestamp = find_commit_content(
+    found = find_commit_content(
         desired_hash=desired_hash,
         message=commit_message,
         match_type=match_type,
         tree_hash=tree_hash,
-        head_hash=head_hash,
-        preserve_author=preserve_author,
-        related_commit_hash=current_hash,
-    )
-    amend_a_commit(
-        timestamp=timestamp,
-        tree_hash=tree_hash,
-        parent_hash=head_hash,
-        content=content,
-        preserve_author=preserve_author,
-        related_commit_hash=current_hash,
+        parent_hashes=parent_hashes,
+        context=resolve_context(
+            preserve_author=preserve_author,
+            related_commit_hash=current_hash,
+            base=context,
+        ),
+        jobs=jobs,
+        nonce_placement=nonce_placement,
+        listen=listen,
+        pool=pool,
+        quiet=quiet,
+        budget=budget,
+        strict=strict,
     )
-
-
-def get_parent_hash(commit: Optional[str] = None) -> Optional[str]:
-    args = ["git", "show", "--no-patch", "--format=%P"]
-    if commit:
-        args.append(commit)
-
-    result = run_subprocess(args)
-    parents = result.stdout.decode("utf-8").strip().split()
-    if len(parents) > 1:
-        raise NotImplementedError("Commit has more than one parent")
-    return parents[0] if parents else None
+    amend_a_commit(found.commit_hash, quiet)
+    return found
 
 
 def overwrite_and_rebase(
-    desired_hash: str,
+    desired_hash: Union[str, Sequence[str]],
     message: Optional[str],
     commit_hash: str,
     preserve_author: bool,
     match_type: MatchType,
-) -> None:
+    jobs: int = 1,
+    nonce_placement: Optional[NoncePlacement] = None,
+    listen: Optional[Address] = None,
+    pool: Optional[WorkerPool] = None,
+    quiet: bool = False,
+    context: Optional[CommitContext] = None,
+    budget: Optional[SearchBudget] = None,
+    strict: bool = False,
+) -> FoundCommit:
+    """Overwrite `commit_hash` and recreate its descendants on top of it.
+
+    The descendants keep their trees, messages and idents; only their parents
+    change, so they are rewritten as objects, stored in one packfile,
+    without touching the index or the working tree, and HEAD is moved once
+    at the end. Commits that are signed with SSH, which hashcommit cannot
+    sign, are replayed by `git rebase` instead.
+    """
     logging.debug(
         f"Will overwrite commit {commit_hash} with hash: {desired_hash} ({match_type})"
     )
+    commit_hash = read_commit(commit_hash).oid
+    if not is_ancestor(commit_hash):
+        raise RuntimeError(f"{commit_hash} is not an ancestor of HEAD")
 
-    parent_hash = get_parent_hash(commit=commit_hash)
-    logging.debug(f"Parent: {parent_hash}")
+    parent_hashes = read_commit(commit_hash).parents
+    logging.debug(f"Parents: {parent_hashes}")
     tree_hash = get_tree_hash(commit=commit_hash)
     logging.debug(f"Tree: {tree_hash}")
     commit_message = message or get_commit_message(commit=commit_hash)
     logging.debug(f"Message: {commit_message}")
-
-    content, timestamp = find_commit_content(
-        desired_hash=desired_hash,
-        message=commit_message,
-        match_type=match_type,
-        tree_hash=tree_hash,
-        head_hash=parent_hash,
-        preserve_author=preserve_author,
-        related_commit_hash=commit_hash,
+    context = resolve_context(
+        preserve_author=preserve_author, related_commit_hash=commit_hash, base=context
     )
-    logging.debug(f"Content: {content}")
-    logging.debug(f"Timestamp: {timestamp}")
 
-    new_commit_hash = run_commit_tree(
-        tree_hash=tree_hash,
-        content=content,
-        timestamp=timestamp,
-        head_hash=parent_hash,
-        preserve_author=preserve_author,
-        related_commit_hash=commit_hash,
-    )
+    rebase = context.signing is not None and not context.signing.in_process
+    # The new commit and its rewritten descendants go into one pack.
+    with packed_writes():
+        found = find_commit_content(
+            desired_hash=desired_hash,
+            message=commit_message,
+            match_type=match_type,
+            tree_hash=tree_hash,
+            parent_hashes=parent_hashes,
+            context=context,
+            jobs=jobs,
+            nonce_placement=nonce_placement,
+            listen=listen,
+            pool=pool,
+            quiet=quiet,
+            budget=budget,
+            strict=strict,
+        )
+        if not rebase:
+            new_head = rewrite_descendants(
+                commit_hash, found.commit_hash, context.signing
+            )
 
-    logging.debug(f"Replacing {commit_hash} with {new_commit_hash}")
-    subprocess.run(
-        ["git", "replace", commit_hash, new_commit_hash, "--force"], check=True
+    if rebase:
+        rebase_descendants(commit_hash, found.commit_hash)
+    else:
+        update_head(new_head, f"hashcommit: overwrite {commit_hash}")
+    return found
+
+
+def rewrite_descendants(
+    old_hash: str, new_hash: str, signing: Optional[SigningConfig]
+) -> str:
+    """Recreate the commits from `old_hash` to HEAD on top of `new_hash`.
+
+    The commits are visited once each, parents first, so every merge sees
+    all of its rewritten parents, in their original order. Each commit gets
+    the rewritten parents and is otherwise copied byte for byte; commits
+    none of whose parents changed, such as those of merged side branches,
+    are kept. Signatures are redone when commits are signed. Returns the
+    new HEAD.
+    """
+    commits = list_commit_parents(f"{old_hash}..HEAD")
+    rewritten, bodies = rebuild_descendants(
+        old_hash, new_hash, commits, read_commit_object, signing
     )
+    for body in bodies:
+        write_commit_object(body)
+    head_hash = get_head_hash()
+    assert head_hash is not None
+    return rewritten.get(head_hash, head_hash)
+
+
+def rebuild_descendants(
+    old_hash: str,
+    new_hash: str,
+    commits: Sequence[Tuple[str, Tuple[str, ...]]],
+    read: Callable[[str], bytes],
+    signing: Optional[SigningConfig],
+) -> Tuple[Dict[str, str], List[bytes]]:
+    """Rebuild `commits`, listed parents first, on top of `new_hash`.
+
+    Returns the new hashes by old hash and the bodies of the new commits,
+    which are hashed in-process and left for the caller to write.
+    """
+    rewritten = {old_hash: new_hash}
+    bodies = []
+    for oid, parents in commits:
+        new_parents = [rewritten.get(parent, parent) for parent in parents]
+        if new_parents == list(parents):
+            continue
+        body = replace_parents(read(oid), new_parents)
+        if signing:
+            body = add_signature(body, sign_payload(body, signing))
+        rewritten[oid] = hash_commit_object(body)
+        bodies.append(body)
+        logging.debug(f"Rewrote {oid} as {rewritten[oid]}")
+    return rewritten, bodies
 
-    logging.debug(f"Rebasing onto {new_commit_hash}")
+
+def rebase_descendants(old_hash: str, new_hash: str) -> None:
+    """Replay the commits after `old_hash` on top of `new_hash` with git."""
+    logging.debug(f"Replacing {old_hash} with {new_hash}")
+    subprocess.run(["git", "replace", old_hash, new_hash, "--force"], check=True)
+
+    logging.debug(f"Rebasing onto {new_hash}")
     subprocess.run(
-        ["git", "rebase", "--onto", new_commit_hash, commit_hash, "HEAD"], check=True
+        ["git", "rebase", "--rebase-merges", "--onto", new_hash, old_hash, "HEAD"],
+        check=True,
     )
 
-    logging.debug(f"Deleting {commit_hash} replacement")
-    subprocess.run(["git", "replace", "--delete", commit_hash], check=True)
+    logging.debug(f"Deleting {old_hash} replacement")
+    subprocess.run(["git", "replace", "--delete", old_hash], check=True)
@@ -0,0 +1,25 @@
+"""JSON messages over sockets, shared by the distributed search and the daemon."""
+
+import json
+import socket
+from typing import Any, Dict
+
+
+class Connection:
+    """JSON messages, one per line, over a connected socket."""
+
+    def __init__(self, sock: socket.socket) -> None:
+        self._socket = sock
+        self._reader = sock.makefile("rb")
+
+    def send(self, message: Dict[str, Any]) -> None:
+        self._socket.sendall(json.dumps(message).encode() + b"\n")
+
+    def receive(self) -> Dict[str, Any]:
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed")
+        message = json.loads(line)
+        if not isinstance(message, dict):
+            raise ValueError(f"Unexpected message: {message!r}")
+        return message
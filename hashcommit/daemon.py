@@ -0,0 +1,347 @@
+"""A long-lived process serving hashcommit commands over a Unix domain socket.
+
+`hashcommit serve` starts its search processes once and caches what it
+resolves about each repository. While it runs, `hashcommit` sends it the
+command line, working directory and `GIT_*` environment instead of running
+the command itself, and prints what the daemon sends back:
+
+- client: `{"type": "run", "version": 1, "argv": [...], "cwd": ..., "env": ...}`
+- daemon: `{"type": "exit", "code": 0, "stdout": ..., "stderr": ...}`
+
+Output is base64-encoded. Commands run one at a time, in the order they
+arrive. Their `--jobs` defaults to the daemon's, whose warm processes they
+search with; a command asking for another number starts its own. A client
+that goes away interrupts its command as Ctrl-C would, so that the search
+saves its checkpoint: the daemon signals its main thread with SIGUSR1,
+which raises `ClientGone` there. The main thread only unblocks the signal
+while the command itself runs, so that it never lands while the daemon
+restores its output and environment.
+"""
+
+import base64
+import logging
+import os
+import signal
+import socket
+import sys
+import tempfile
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from types import FrameType
+from typing import IO, Callable, Dict, Iterator, List, Optional, Tuple
+
+from .args import HashCommitArgs, parse_args
+from .client import PROTOCOL_VERSION, can_forward, default_socket_path, git_environment
+from .connection import Connection
+from .engine import WorkerPool
+from .git import CommitContext, resolve_commit_context
+from .logging import configure_logging
+from .utils import run_subprocess
+
+
+class ClientGone(KeyboardInterrupt):
+    """The client hung up; interrupts its command like Ctrl-C."""
+
+
+def _client_gone(signum: int, frame: Optional[FrameType]) -> None:
+    raise ClientGone()
+
+
+def _block_interrupts() -> None:
+    signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGUSR1})
+
+
+def _discard_pending_interrupt() -> None:
+    """Drop a signal sent for a command that finished before it arrived."""
+    if signal.SIGUSR1 in signal.sigpending():
+        handler = signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, {signal.SIGUSR1})
+        _block_interrupts()
+        signal.signal(signal.SIGUSR1, handler)
+
+
+@contextmanager
+def _interruptible() -> Iterator[None]:
+    """Let a client that goes away interrupt the command in this block."""
+    signal.pthread_sigmask(signal.SIG_UNBLOCK, {signal.SIGUSR1})
+    try:
+        yield
+    finally:
+        _block_interrupts()
+
+
+Runner = Callable[[HashCommitArgs, Optional[WorkerPool], Optional[CommitContext]], int]
+
+
+@dataclass(frozen=True)
+class Metadata:
+    """What the daemon resolved about a repository, and when."""
+
+    config: Tuple[Optional[int], ...]
+    context: CommitContext
+
+
+def config_files(git_dir: str) -> List[Path]:
+    """Files whose changes may change identities or signing."""
+    home = Path.home()
+    xdg = Path(os.environ.get("XDG_CONFIG_HOME") or home / ".config")
+    files = [Path(git_dir) / "config", home / ".gitconfig", xdg / "git" / "config"]
+    for name in ("GIT_CONFIG_GLOBAL", "GIT_CONFIG_SYSTEM"):
+        if os.environ.get(name):
+            files.append(Path(os.environ[name]))
+    return files
+
+
+def _modified(path: Path) -> Optional[int]:
+    try:
+        return path.stat().st_mtime_ns
+    except OSError:
+        return None
+
+
+@contextmanager
+def _environment(env: Dict[str, str]) -> Iterator[None]:
+    """Replace the `GIT_*` environment with the client's for a command."""
+    saved = dict(os.environ)
+    for name in git_environment():
+        del os.environ[name]
+    os.environ.update(env)
+    try:
+        yield
+    finally:
+        os.environ.clear()
+        os.environ.update(saved)
+
+
+@contextmanager
+def _redirected(stdout: IO[bytes], stderr: IO[bytes]) -> Iterator[None]:
+    """Redirect file descriptors 1 and 2, so git's output is captured too."""
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved = os.dup(1), os.dup(2)
+    os.dup2(stdout.fileno(), 1)
+    os.dup2(stderr.fileno(), 2)
+    try:
+        yield
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        for descriptor, original in zip((1, 2), saved):
+            os.dup2(original, descriptor)
+            os.close(original)
+
+
+@contextmanager
+def _logging_verbosity(verbosity: int) -> Iterator[None]:
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    root.handlers = []
+    configure_logging(verbosity)
+    try:
+        yield
+    finally:
+        root.handlers = handlers
+        root.setLevel(level)
+
+
+class Daemon:
+    """Runs the commands clients hand over, with warm search processes."""
+
+    def __init__(self, path: str, jobs: int) -> None:
+        self.path = path
+        self.jobs = jobs
+        self.pool: Optional[WorkerPool] = None
+        self._metadata: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Metadata] = {}
+        self._finished = False
+        self._lock = threading.Lock()
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    def bind(self) -> None:
+        if os.path.exists(self.path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+            except OSError:
+                os.unlink(self.path)
+            else:
+                raise RuntimeError(
+                    f"A hashcommit daemon is already serving {self.path}"
+                )
+            finally:
+                probe.close()
+        # Whoever can connect runs commands as this user.
+        umask = os.umask(0o177)
+        try:
+            self.socket.bind(self.path)
+        finally:
+            os.umask(umask)
+        self.socket.listen()
+
+    def close(self) -> None:
+        self.socket.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+
+    def serve_forever(self, run: Runner) -> None:
+        directory = os.getcwd()
+        if self.jobs > 1:
+            self.pool = WorkerPool(self.jobs)
+        while True:
+            # A signal landing as the last command ended may have left it
+            # unblocked.
+            _block_interrupts()
+            try:
+                client, _ = self.socket.accept()
+                with client:
+                    self.handle(Connection(client), client, run)
+            except ClientGone:
+                logging.info("The client went away")
+            except Exception:
+                logging.exception("The command failed")
+            finally:
+                os.chdir(directory)
+
+    def handle(
+        self, connection: Connection, client: socket.socket, run: Runner
+    ) -> None:
+        self._finished = False
+        _discard_pending_interrupt()
+        try:
+            request = connection.receive()
+        except (OSError, ValueError) as error:
+            logging.info(f"Ignoring a client: {error}")
+            return
+        if request.get("type") != "run" or request.get("version") != PROTOCOL_VERSION:
+            connection.send(
+                {"type": "error", "message": f"Unsupported request: {request}"}
+            )
+            return
+        logging.info(f"Running {request['argv']} in {request['cwd']}")
+        watcher = threading.Thread(target=self._watch, args=(client,), daemon=True)
+        watcher.start()
+        # Every request gets its exit frame, or the client waits forever.
+        code, stdout, stderr = 2, b"", b"Error: The hashcommit daemon failed\n"
+        try:
+            code, stdout, stderr = self.run(
+                request["argv"], request["cwd"], request["env"], run
+            )
+        finally:
+            with self._lock:
+                self._finished = True
+            self._reply(connection, client, code, stdout, stderr)
+            watcher.join()
+
+    def _reply(
+        self,
+        connection: Connection,
+        client: socket.socket,
+        code: int,
+        stdout: bytes,
+        stderr: bytes,
+    ) -> None:
+        try:
+            connection.send(
+                {
+                    "type": "exit",
+                    "code": code,
+                    "stdout": base64.b64encode(stdout).decode(),
+                    "stderr": base64.b64encode(stderr).decode(),
+                }
+            )
+            client.shutdown(socket.SHUT_RDWR)
+        except OSError as error:
+            logging.info(f"Cannot reply to the client: {error}")
+
+    def _watch(self, client: socket.socket) -> None:
+        """Interrupt the command if the client hangs up before the reply."""
+        try:
+            client.recv(1, socket.MSG_PEEK)
+        except OSError:
+            pass
+        with self._lock:
+            if not self._finished:
+                # Sent to the main thread, whose mask decides when it lands.
+                main = threading.main_thread().ident
+                assert main is not None
+                signal.pthread_kill(main, signal.SIGUSR1)
+
+    def run(
+        self, argv: List[str], cwd: str, env: Dict[str, str], run: Runner
+    ) -> Tuple[int, bytes, bytes]:
+        failure: Optional[Exception] = None
+        with tempfile.TemporaryFile() as stdout, tempfile.TemporaryFile() as stderr:
+            with _redirected(stdout, stderr), _environment(env):
+                try:
+                    os.chdir(cwd)
+                    args = parse_args(argv, default_jobs=self.jobs)
+                    if not can_forward(args):
+                        raise RuntimeError(f"The daemon does not run {args.command}")
+                    with _logging_verbosity(args.verbose):
+                        logging.info(f"Args: {args}")
+                        pool, context = self._search_pool(args), self.context(env)
+                        with _interruptible():
+                            code = run(args, pool, context)
+                except SystemExit as error:
+                    code = error.code if isinstance(error.code, int) else 1
+                except (OSError, RuntimeError) as error:
+                    print(f"Error: {error}", file=sys.stderr)
+                    code = 2
+                except Exception as error:
+                    print(f"Error: {error}", file=sys.stderr)
+                    code = 2
+                    failure = error
+            if failure is not None:
+                logging.error("The command failed", exc_info=failure)
+            stdout.seek(0)
+            stderr.seek(0)
+            return code, stdout.read(), stderr.read()
+
+    def _search_pool(self, args: HashCommitArgs) -> Optional[WorkerPool]:
+        """The warm pool, unless the command asks for another number of jobs.
+
+        Such commands start processes of their own, as they would in-process.
+        """
+        if args.jobs == self.jobs:
+            return self.pool
+        logging.info(f"Searching with {args.jobs} job(s) instead of {self.jobs}")
+        return None
+
+    def context(self, env: Dict[str, str]) -> Optional[CommitContext]:
+        """The context resolved for the current repository and identity.
+
+        Cached until a config file changes. None outside a repository.
+        """
+        result = run_subprocess(["git", "rev-parse", "--absolute-git-dir"], check=False)
+        if result.returncode != 0:
+            return None
+        git_dir = result.stdout.decode().strip()
+        key = (git_dir, tuple(sorted(env.items())))
+        config = tuple(_modified(path) for path in config_files(git_dir))
+        metadata = self._metadata.get(key)
+        if metadata is None or metadata.config != config:
+            logging.debug(f"Resolving the commit context of {git_dir}")
+            context = resolve_commit_context(
+                preserve_author=False, related_commit_hash=None
+            )
+            metadata = self._metadata[key] = Metadata(config, context)
+        return metadata.context
+
+
+def serve(path: Optional[str], jobs: int, run: Runner) -> int:
+    """Serve commands on the socket at `path` until interrupted."""
+    daemon = Daemon(path or default_socket_path(), jobs)
+    daemon.bind()
+    signal.signal(signal.SIGUSR1, _client_gone)
+    print(f"Serving on {daemon.path}", flush=True)
+    try:
+        daemon.serve_forever(run)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.close()
+    return 0
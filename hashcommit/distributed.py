@@ -0,0 +1,233 @@
+"""Searching on several machines: a coordinator hands out nonce ranges.
+
+The coordinator builds the commit template the way a local search does and
+listens on a TCP port. Workers connect, receive the template, the nonce
+scheme and the patterns, and scan the ranges of nonce indices they are
+given. They need no repository. Messages are JSON objects, one per line:
+
+- worker: `{"type": "hello", "version": 1, "jobs": 4}`
+- coordinator: `{"type": "job", "version": 1, "head": ..., ...}`
+- coordinator: `{"type": "range", "start": 0, "stop": 4194304}`
+- worker: `{"type": "result", "index": null, "attempts": 4194304}`
+- coordinator: `{"type": "done"}` once a match has been found
+
+A worker has one range at a time. The range of a worker that disconnects,
+sends garbage or stays silent for too long is handed out again. Claimed
+matches are rehashed by the coordinator before they are accepted.
+"""
+
+import base64
+import logging
+import socket
+import socketserver
+import threading
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+from .args import Address, MatchType
+from .connection import Connection
+from .engine import (
+    CHUNK_SIZE,
+    CommitTemplate,
+    CounterNonce,
+    SearchJob,
+    SearchPool,
+    SearchResult,
+    use_batch_kernel,
+)
+from .estimate import REPORT_INTERVAL
+from .pattern import PatternSet
+
+PROTOCOL_VERSION = 1
+RANGE_CHUNKS = 64
+WORKER_TIMEOUT = 300.0
+
+Range = Tuple[int, int]
+
+
+def encode_job(job: SearchJob) -> Dict[str, Any]:
+    nonces = job.nonces
+    if not isinstance(nonces, CounterNonce):
+        raise RuntimeError("Distributed searches do not support the timestamp nonce")
+    template = job.template
+    return {
+        "type": "job",
+        "version": PROTOCOL_VERSION,
+        "head": base64.b64encode(template.head).decode(),
+        "tail": base64.b64encode(template.tail).decode(),
+        "alphabet": nonces.alphabet.decode(),
+        "width": nonces.width,
+        "patterns": [pattern.text for pattern in job.pattern.patterns],
+        "match_type": job.pattern.match_type.value,
+    }
+
+
+def decode_job(message: Dict[str, Any]) -> SearchJob:
+    if message.get("version") != PROTOCOL_VERSION:
+        raise RuntimeError(
+            f"The coordinator speaks protocol version {message.get('version')}, "
+            f"this worker speaks version {PROTOCOL_VERSION}"
+        )
+    nonces = CounterNonce(message["alphabet"].encode(), message["width"])
+    template = CommitTemplate(
+        base64.b64decode(message["head"]),
+        base64.b64decode(message["tail"]),
+        nonces.width,
+    )
+    patterns = PatternSet.compile(message["patterns"], MatchType(message["match_type"]))
+    return SearchJob(
+        template, nonces, patterns, batch=use_batch_kernel(template, patterns)
+    )
+
+
+class RangeAllocator:
+    """Hands out nonce ranges to workers and takes back those of lost workers.
+
+    Ranges taken back are handed out again before any new range.
+    """
+
+    def __init__(self) -> None:
+        self.attempts = 0
+        self.match: Optional[int] = None
+        self.found = threading.Event()
+        self._lock = threading.Lock()
+        self._next = 0
+        self._returned: Deque[Range] = deque()
+
+    def assign(self, size: int) -> Optional[Range]:
+        """Return the next range to scan, or None once a match was found."""
+        with self._lock:
+            if self.found.is_set():
+                return None
+            if self._returned:
+                return self._returned.popleft()
+            start = self._next
+            self._next += size
+            return start, self._next
+
+    def complete(self, attempts: int, index: Optional[int]) -> None:
+        with self._lock:
+            self.attempts += attempts
+            if index is not None and not self.found.is_set():
+                self.match = index
+                self.found.set()
+
+    def release(self, assigned: Range) -> None:
+        with self._lock:
+            self._returned.append(assigned)
+
+
+class _WorkerHandler(socketserver.BaseRequestHandler):
+    server: "Coordinator"
+
+    def handle(self) -> None:
+        coordinator = self.server
+        ranges = coordinator.ranges
+        name = "{}:{}".format(*self.client_address[:2])
+        self.request.settimeout(WORKER_TIMEOUT)
+        connection = Connection(self.request)
+        assigned: Optional[Range] = None
+        try:
+            hello = connection.receive()
+            size = RANGE_CHUNKS * CHUNK_SIZE * max(1, int(hello.get("jobs", 1)))
+            connection.send(coordinator.job_message)
+            logging.info(f"Worker {name} joined with {hello.get('jobs')} job(s)")
+            while True:
+                assigned = ranges.assign(size)
+                if assigned is None:
+                    connection.send({"type": "done"})
+                    return
+                start, stop = assigned
+                connection.send({"type": "range", "start": start, "stop": stop})
+                report = connection.receive()
+                index = report["index"]
+                if index is not None and not coordinator.verify(index, assigned):
+                    logging.warning(f"Worker {name} claimed a wrong match: {index}")
+                    return
+                ranges.complete(int(report["attempts"]), index)
+                assigned = None
+        except (OSError, ValueError, KeyError, TypeError) as error:
+            logging.warning(f"Lost worker {name}: {error}")
+        finally:
+            if assigned is not None:
+                ranges.release(assigned)
+
+
+class Coordinator(socketserver.ThreadingTCPServer):
+    """TCP server handing the ranges of `job` to workers."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address: Address, job: SearchJob) -> None:
+        self.job = job
+        self.job_message = encode_job(job)
+        self.ranges = RangeAllocator()
+        super().__init__(address, _WorkerHandler)
+
+    def verify(self, index: int, assigned: Range) -> bool:
+        """Whether `index` lies in the assigned range and really matches."""
+        start, stop = assigned
+        if not isinstance(index, int) or not start <= index < stop:
+            return False
+        nonce = self.job.nonces.nonce(index)
+        return self.job.pattern.matches(self.job.template.digest(nonce))
+
+
+def coordinate(
+    job: SearchJob,
+    address: Address,
+    progress: Optional[Callable[[int], None]] = None,
+) -> SearchResult:
+    """Let workers connecting to `address` search for `job` and return the match.
+
+    Unlike a local search, the match is the first one reported rather than
+    the one at the lowest nonce index.
+    """
+    with Coordinator(address, job) as server:
+        host, port = server.socket.getsockname()[:2]
+        print(f"Waiting for workers on {host}:{port}", flush=True)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            while not server.ranges.found.wait(REPORT_INTERVAL):
+                if progress and server.ranges.attempts:
+                    progress(server.ranges.attempts)
+        finally:
+            server.shutdown()
+    ranges = server.ranges
+    assert ranges.match is not None
+    return job.result(ranges.match, ranges.attempts)
+
+
+def run_worker(address: Address, jobs: int = 1) -> None:
+    """Scan the ranges the coordinator at `address` hands out until it is done."""
+    host, port = address
+    try:
+        sock = socket.create_connection(address)
+    except OSError as error:
+        raise RuntimeError(
+            f"Cannot connect to the coordinator at {host}:{port}: {error.strerror}"
+        )
+    with sock:
+        connection = Connection(sock)
+        try:
+            connection.send(
+                {"type": "hello", "version": PROTOCOL_VERSION, "jobs": jobs}
+            )
+            job = decode_job(connection.receive())
+            print(f"Searching for {host}:{port} with {jobs} job(s)", flush=True)
+            # Forked processes would inherit the socket and keep the
+            # connection open after this process is killed.
+            with SearchPool(job, jobs, start_method="spawn") as pool:
+                while True:
+                    message = connection.receive()
+                    if message["type"] != "range":
+                        break
+                    index, attempts = pool.scan(message["start"], message["stop"])
+                    connection.send(
+                        {"type": "result", "index": index, "attempts": attempts}
+                    )
+        except ConnectionError:
+            logging.info("The coordinator closed the connection")
+    print("The coordinator is done")
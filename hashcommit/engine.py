@@ -0,0 +1,698 @@
+import functools
+import hashlib
+import itertools
+import multiprocessing
+import os
+import signal
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass, replace
+from datetime import datetime, timedelta
+from types import TracebackType
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+)
+
+from . import kernel
+from .args import MatchType, NoncePlacement
+from .pattern import PatternSet
+
+CHUNK_SIZE = 1 << 14
+STOP_CHECK_INTERVAL = 1 << 10
+NO_MATCH = (1 << 63) - 1
+
+NONCE_HEADER = "hashcommit"
+DENSE_ALPHABET = b"0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz-_"
+DENSE_WIDTH = 10
+WHITESPACE_ALPHABET = b" \t"
+WHITESPACE_WIDTH = 48
+
+
+def format_git_date(timestamp: datetime) -> str:
+    """Format a timestamp the way git stores it in an ident line."""
+    aware = timestamp.astimezone()
+    return f"{int(aware.timestamp())} {aware.strftime('%z')}"
+
+
+def _format_message(message: str) -> str:
+    if message and not message.endswith("\n"):
+        return message + "\n"
+    return message
+
+
+def _format_headers(
+    tree_hash: str, parent_hashes: Sequence[str], author: str
+) -> List[str]:
+    lines = [f"tree {tree_hash}"]
+    lines.extend(f"parent {parent_hash}" for parent_hash in parent_hashes)
+    lines.append(f"author {author}")
+    return lines
+
+
+def format_commit_object(
+    tree_hash: str,
+    parent_hashes: Sequence[str],
+    author: str,
+    committer: str,
+    message: str,
+    encoding: Optional[str] = None,
+) -> bytes:
+    """Build the body of a commit object exactly as `git commit-tree -m` does."""
+    lines = _format_headers(tree_hash, parent_hashes, author)
+    lines.append(f"committer {committer}")
+    if encoding:
+        lines.append(f"encoding {encoding}")
+    return ("\n".join(lines) + "\n\n" + _format_message(message)).encode("utf-8")
+
+
+def hash_commit_object(body: bytes) -> str:
+    """Return the object id git would assign to the given commit body."""
+    return hashlib.sha1(b"commit %d\0" % len(body) + body).hexdigest()
+
+
+class CommitTemplate:
+    """A commit object split around the bytes that change between candidates.
+
+    The object header and everything before the nonce are hashed once; each
+    candidate only copies that SHA-1 state and feeds the nonce and the tail.
+    """
+
+    def __init__(self, head: bytes, tail: bytes, nonce_width: int) -> None:
+        self.head = head
+        self.tail = tail
+        self.nonce_width = nonce_width
+        size = len(head) + nonce_width + len(tail)
+        self.prefix = b"commit %d\0" % size + head
+        self._state = hashlib.sha1(self.prefix)
+
+    def __reduce__(self) -> Tuple[Any, ...]:
+        return (CommitTemplate, (self.head, self.tail, self.nonce_width))
+
+    def body(self, nonce: bytes) -> bytes:
+        if len(nonce) != self.nonce_width:
+            raise ValueError(f"Nonce must be {self.nonce_width} bytes long")
+        return self.head + nonce + self.tail
+
+    def digest(self, nonce: bytes) -> bytes:
+        state = self._state.copy()
+        state.update(nonce)
+        state.update(self.tail)
+        return state.digest()
+
+    def hash(self, nonce: bytes) -> str:
+        return self.digest(nonce).hex()
+
+
+def committer_date_template(
+    tree_hash: str,
+    parent_hashes: Sequence[str],
+    author: str,
+    committer: str,
+    message: str,
+    encoding: Optional[str],
+    nonce_width: int,
+) -> CommitTemplate:
+    """Template whose nonce is the committer date (`<epoch> <tz>`)."""
+    lines = _format_headers(tree_hash, parent_hashes, author)
+    head = "\n".join(lines) + f"\ncommitter {committer} "
+    tail = "\n"
+    if encoding:
+        tail += f"encoding {encoding}\n"
+    tail += "\n" + _format_message(message)
+    return CommitTemplate(head.encode("utf-8"), tail.encode("utf-8"), nonce_width)
+
+
+class NonceScheme(ABC):
+    """Maps a candidate index to the nonce bytes placed in the template."""
+
+    @abstractmethod
+    def nonce(self, index: int) -> bytes:
+        """Return the nonce of candidate `index`."""
+
+    def iter_nonces(self, start: int, stop: int) -> Iterator[bytes]:
+        return (self.nonce(index) for index in range(start, stop))
+
+    def nonce_batch(self, start: int, stop: int) -> Any:
+        """Return the nonces for `[start, stop)` as an `(N, width)` uint8 array.
+
+        Raises ValueError when the nonces do not all have the same width.
+        """
+        joined = b"".join(self.nonce(index) for index in range(start, stop))
+        return kernel.np.frombuffer(joined, dtype=kernel.np.uint8).reshape(
+            stop - start, -1
+        )
+
+
+@dataclass(frozen=True)
+class CommitterDateNonce(NonceScheme):
+    """Walks the committer date backwards one second per candidate."""
+
+    start: datetime
+
+    def timestamp(self, index: int) -> datetime:
+        return self.start - timedelta(seconds=index + 1)
+
+    def nonce(self, index: int) -> bytes:
+        return format_git_date(self.timestamp(index)).encode()
+
+    def iter_nonces(self, start: int, stop: int) -> Iterator[bytes]:
+        first, last = self.nonce(start), self.nonce(stop - 1)
+        epoch, zone = first.split(b" ")
+        if len(first) != len(last) or not last.endswith(zone):
+            yield from super().iter_nonces(start, stop)
+            return
+        suffix = b" " + zone
+        for seconds in range(int(epoch), int(epoch) - (stop - start), -1):
+            yield b"%d%s" % (seconds, suffix)
+
+    def nonce_batch(self, start: int, stop: int) -> Any:
+        np = kernel.np
+        first, last = self.nonce(start), self.nonce(stop - 1)
+        epoch, zone = first.split(b" ")
+        if len(first) != len(last) or not last.endswith(zone):
+            return super().nonce_batch(start, stop)
+        count = stop - start
+        epochs = int(epoch) - np.arange(count, dtype=np.int64)
+        powers = 10 ** np.arange(len(epoch) - 1, -1, -1, dtype=np.int64)
+        digits = ((epochs[:, None] // powers) % 10 + ord("0")).astype(np.uint8)
+        suffix = np.frombuffer(b" " + zone, dtype=np.uint8)
+        return np.hstack((digits, np.broadcast_to(suffix, (count, len(suffix)))))
+
+
+@functools.lru_cache(maxsize=None)
+def _low_digits(alphabet: bytes, width: int) -> List[bytes]:
+    return [bytes(digits) for digits in itertools.product(alphabet, repeat=width)]
+
+
+@dataclass(frozen=True)
+class CounterNonce(NonceScheme):
+    """Encodes the candidate index as a fixed-width number over `alphabet`."""
+
+    alphabet: bytes
+    width: int
+
+    def nonce(self, index: int) -> bytes:
+        base = len(self.alphabet)
+        digits = bytearray(self.width)
+        for position in reversed(range(self.width)):
+            index, digit = divmod(index, base)
+            digits[position] = self.alphabet[digit]
+        if index:
+            raise ValueError("Nonce space exhausted")
+        return bytes(digits)
+
+    def iter_nonces(self, start: int, stop: int) -> Iterator[bytes]:
+        # Only the low digits change between neighbours; they come from a
+        # precomputed table and the high digits are encoded once per run.
+        bits = len(self.alphabet).bit_length() - 1
+        low_width = min(self.width, max(1, 12 // bits))
+        lows = _low_digits(self.alphabet, low_width)
+        index = start
+        while index < stop:
+            high, low = divmod(index, len(lows))
+            prefix = self.nonce(high * len(lows))[: self.width - low_width]
+            count = min(len(lows) - low, stop - index)
+            for suffix in lows[low : low + count]:
+                yield prefix + suffix
+            index += count
+
+    def nonce_batch(self, start: int, stop: int) -> Any:
+        np = kernel.np
+        first, last = self.nonce(start), self.nonce(stop - 1)
+        # Digits shared by the first and last nonce are shared by the whole
+        # batch, so only the low digits are computed per candidate.
+        fixed = len(os.path.commonprefix([first, last]))
+        base = len(self.alphabet)
+        indices = np.arange(start, stop, dtype=np.int64)
+        powers = base ** np.arange(self.width - fixed - 1, -1, -1, dtype=np.int64)
+        digits = np.frombuffer(self.alphabet, dtype=np.uint8)[
+            (indices[:, None] // powers) % base
+        ]
+        shared = np.frombuffer(first[:fixed], dtype=np.uint8)
+        count = stop - start
+        return np.hstack((np.broadcast_to(shared, (count, fixed)), digits))
+
+
+def _pad_to_last_block(head: str, tail: str, width: int, filler: str) -> str:
+    """Pad `head` so that the nonce, the tail and SHA-1 padding share one block.
+
+    Returns `head` unchanged when they cannot fit in a single block.
+    """
+    head_length, tail_length = len(head.encode("utf-8")), len(tail.encode("utf-8"))
+    for pad in range(64):
+        size = head_length + pad + width + tail_length
+        offset = len(b"commit %d\0" % size) + head_length + pad
+        if offset % 64 + width + tail_length + 9 <= 64:
+            return head + filler * pad
+    return head
+
+
+def nonce_template(
+    placement: NoncePlacement,
+    tree_hash: str,
+    parent_hashes: Sequence[str],
+    author: str,
+    committer: str,
+    message: str,
+    encoding: Optional[str],
+    start: datetime,
+) -> Tuple[CommitTemplate, NonceScheme]:
+    """Return the template and nonce scheme for the given nonce placement.
+
+    `committer` is the committer name and email. Except for the timestamp
+    placement, the committer date is `start` for every candidate.
+    """
+    if placement == NoncePlacement.TIMESTAMP:
+        dates = CommitterDateNonce(start)
+        template = committer_date_template(
+            tree_hash=tree_hash,
+            parent_hashes=parent_hashes,
+            author=author,
+            committer=committer,
+            message=message,
+            encoding=encoding,
+            nonce_width=len(dates.nonce(0)),
+        )
+        return template, dates
+
+    lines = _format_headers(tree_hash, parent_hashes, author)
+    lines.append(f"committer {committer} {format_git_date(start)}")
+    if encoding:
+        lines.append(f"encoding {encoding}")
+    headers = "\n".join(lines) + "\n"
+    body = message.rstrip("\n")
+
+    nonces = CounterNonce(DENSE_ALPHABET, DENSE_WIDTH)
+    if placement == NoncePlacement.HEADER:
+        head = headers + f"{NONCE_HEADER} "
+        tail = "\n\n" + _format_message(message)
+    elif placement == NoncePlacement.TRAILER:
+        head = headers + "\n" + (f"{body}\n\n" if body else "") + "--- meta: "
+        tail = " ---\n"
+    else:
+        nonces = CounterNonce(WHITESPACE_ALPHABET, WHITESPACE_WIDTH)
+        # Amending a commit found this way must not pile up nonces.
+        head = headers + "\n" + body.rstrip(" \t")
+        tail = "\n"
+    filler = chr(nonces.alphabet[0])
+    head = _pad_to_last_block(head, tail, nonces.width, filler)
+    template = CommitTemplate(head.encode("utf-8"), tail.encode("utf-8"), nonces.width)
+    return template, nonces
+
+
+@dataclass(frozen=True)
+class SearchResult:
+    nonce_index: int
+    nonce: bytes
+    commit_hash: str
+    attempts: int
+
+
+@dataclass(frozen=True)
+class SearchJob:
+    template: CommitTemplate
+    nonces: NonceScheme
+    pattern: PatternSet
+    batch: bool = False
+
+    def scan(
+        self, start: int, stop: int, best: Optional[Any] = None
+    ) -> Tuple[Optional[int], int]:
+        """Return the first matching index in `[start, stop)` and the attempts made.
+
+        When `best` is given, the scan gives up as soon as another worker has
+        found a match at a lower index.
+        """
+        if self.batch:
+            return self._scan_batches(start, stop, best)
+        return self._scan_scalar(start, stop, best)
+
+    def _scan_scalar(
+        self, start: int, stop: int, best: Optional[Any]
+    ) -> Tuple[Optional[int], int]:
+        match = self.pattern.matcher()
+        template = self.template
+        nonces = self.nonces.iter_nonces(start, stop)
+        for index, nonce in zip(range(start, stop), nonces):
+            if best is not None and index % STOP_CHECK_INTERVAL == 0:
+                if index > best.value:
+                    return None, index - start
+            if len(nonce) != template.nonce_width:
+                continue
+            if match(template.digest(nonce)):
+                _record_best(best, index)
+                return index, index - start + 1
+        return None, stop - start
+
+    def _scan_batches(
+        self, start: int, stop: int, best: Optional[Any]
+    ) -> Tuple[Optional[int], int]:
+        template = self.template
+        hasher = kernel.BatchHasher(template.head, template.tail, template.nonce_width)
+        for batch_start in range(start, stop, kernel.BATCH_SIZE):
+            if best is not None and batch_start > best.value:
+                return None, batch_start - start
+            batch_stop = min(stop, batch_start + kernel.BATCH_SIZE)
+            try:
+                nonces = self.nonces.nonce_batch(batch_start, batch_stop)
+            except ValueError:
+                index, _ = self._scan_scalar(batch_start, batch_stop, best)
+            else:
+                digests = hasher.digests(nonces)
+                hits = kernel.match_digests(digests, self.pattern)
+                found = kernel.np.flatnonzero(hits)
+                index = batch_start + int(found[0]) if len(found) else None
+                _record_best(best, index)
+            if index is not None:
+                return index, index - start + 1
+        return None, stop - start
+
+    def result(self, index: int, attempts: int) -> SearchResult:
+        nonce = self.nonces.nonce(index)
+        return SearchResult(index, nonce, self.template.hash(nonce), attempts)
+
+
+def _record_best(best: Optional[Any], index: Optional[int]) -> None:
+    if best is not None and index is not None:
+        with best.get_lock():
+            best.value = min(best.value, index)
+
+
+def use_batch_kernel(template: CommitTemplate, patterns: PatternSet) -> bool:
+    """Whether the NumPy batch kernel is installed and faster for `template`.
+
+    CONTAIN patterns are checked at every place of every row in the batch,
+    which is slower than the scalar loop's substring search.
+    """
+    if patterns.match_type == MatchType.CONTAIN:
+        return False
+    return kernel.is_available() and ends_in_last_blocks(template)
+
+
+def ends_in_last_blocks(template: CommitTemplate) -> bool:
+    """Whether the nonce and the tail fit in the last two SHA-1 blocks, so
+    that each candidate hashes at most two blocks."""
+    return kernel.fits_batch_kernel(
+        len(template.prefix), template.nonce_width, len(template.tail)
+    )
+
+
+_worker_job: Optional[SearchJob] = None
+_worker_best: Optional[Any] = None
+
+
+def _init_worker(job: Optional[SearchJob], best: Any) -> None:
+    global _worker_job, _worker_best
+    # The parent process handles Ctrl-C and stops the workers itself.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    _worker_job = job
+    _worker_best = best
+
+
+def _scan_chunk(start: int, stop: int) -> Tuple[Optional[int], int]:
+    assert _worker_job is not None
+    return _worker_job.scan(start, stop, _worker_best)
+
+
+def _scan_job_chunk(job: SearchJob, start: int, stop: int) -> Tuple[Optional[int], int]:
+    return job.scan(start, stop, _worker_best)
+
+
+class WorkerPool:
+    """Search processes kept alive across searches.
+
+    Every chunk is sent with its job, so one pool serves any number of
+    searches without starting processes again. The processes are spawned
+    rather than forked: forked ones would inherit the pipes of the git
+    processes started meanwhile and keep them from ever seeing EOF.
+    """
+
+    def __init__(self, jobs: int, start_method: str = "spawn") -> None:
+        self.jobs = jobs
+        context = multiprocessing.get_context(start_method)
+        self.best = context.Value("q", NO_MATCH)
+        self.executor = ProcessPoolExecutor(
+            max_workers=jobs,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(None, self.best),
+        )
+
+    def close(self) -> None:
+        self.best.value = -1
+        self.executor.shutdown()
+
+
+def search(
+    job: SearchJob,
+    jobs: int = 1,
+    chunk_size: int = CHUNK_SIZE,
+    progress: Optional[Callable[[int], None]] = None,
+    resume_from: int = 0,
+    pool: Optional[WorkerPool] = None,
+) -> SearchResult:
+    """Find the lowest nonce index from `resume_from` on whose commit hash matches.
+
+    With more than one job, consecutive nonce ranges are handed to a process
+    pool, started for this search unless `pool` is given. Ranges are
+    collected in order, so the winner is the same one a single process
+    would find. `progress` is called with the number of attempts so far
+    after every range without a match, so `resume_from` plus that number is
+    always a fully searched prefix.
+    """
+    chunks = itertools.count(resume_from, chunk_size)
+    if pool is not None:
+        pool.best.value = NO_MATCH
+        executor = pool.executor
+
+        def submit_to_pool(start: int) -> Future:
+            return executor.submit(_scan_job_chunk, job, start, start + chunk_size)
+
+        return _collect_chunks(
+            job, submit_to_pool, pool.best, chunks, pool.jobs, progress
+        )
+
+    if jobs == 1:
+        attempts = 0
+        for start in chunks:
+            index, scanned = job.scan(start, start + chunk_size)
+            attempts += scanned
+            if index is not None:
+                return job.result(index, attempts)
+            if progress:
+                progress(attempts)
+
+    # Spawned rather than forked, like the processes of a `WorkerPool`.
+    context = multiprocessing.get_context("spawn")
+    best = context.Value("q", NO_MATCH)
+    with ProcessPoolExecutor(
+        max_workers=jobs,
+        mp_context=context,
+        initializer=_init_worker,
+        initargs=(job, best),
+    ) as own_executor:
+
+        def submit(start: int) -> Future:
+            return own_executor.submit(_scan_chunk, start, start + chunk_size)
+
+        return _collect_chunks(job, submit, best, chunks, jobs, progress)
+
+
+@dataclass(frozen=True)
+class SearchBudget:
+    """How long a search may run before settling for the closest candidate.
+
+    Either limit may be left out. Both are checked between chunks, so the
+    search overshoots them by up to one chunk per job.
+    """
+
+    seconds: Optional[float] = None
+    attempts: Optional[int] = None
+
+    def spent(self, attempts: int, elapsed: float) -> bool:
+        return (self.attempts is not None and attempts >= self.attempts) or (
+            self.seconds is not None and elapsed >= self.seconds
+        )
+
+
+class _BudgetSpent(Exception):
+    pass
+
+
+def search_within_budget(
+    job: SearchJob,
+    budget: SearchBudget,
+    jobs: int = 1,
+    chunk_size: int = CHUNK_SIZE,
+    progress: Optional[Callable[[int], None]] = None,
+    resume_from: int = 0,
+    pool: Optional[WorkerPool] = None,
+) -> Optional[SearchResult]:
+    """Search like `search` until a match is found or `budget` is spent.
+
+    Returns the match or, once the budget is spent, the candidate matching
+    the most characters of a pattern; None if not even one was scanned.
+    The result counts all attempts made.
+
+    The search runs as a series of exact searches, each for the candidates
+    matching one character more than the best one so far. Each picks up
+    after the previous one's find, so `progress` still gets a fully
+    searched prefix.
+    """
+    started = time.monotonic()
+    attempts = 0
+    best: Optional[SearchResult] = None
+    matched = 0
+    start = resume_from
+
+    def check(stage_attempts: int) -> None:
+        nonlocal attempts
+        total = start - resume_from + stage_attempts
+        if progress:
+            progress(total)
+        if budget.spent(total, time.monotonic() - started):
+            attempts = total
+            raise _BudgetSpent()
+
+    own_pool = None
+    if pool is None and jobs > 1:
+        # Every stage would start processes of its own otherwise.
+        pool = own_pool = WorkerPool(jobs)
+    try:
+        while not budget.spent(start - resume_from, time.monotonic() - started):
+            stage = SearchJob(
+                job.template, job.nonces, job.pattern.closer_than(matched), job.batch
+            )
+            try:
+                result = search(stage, jobs, chunk_size, check, start, pool)
+            except _BudgetSpent:
+                break
+            start = result.nonce_index + 1
+            attempts = start - resume_from
+            best = replace(result, attempts=attempts)
+            digest = bytes.fromhex(result.commit_hash)
+            if job.pattern.matches(digest):
+                return best
+            matched = job.pattern.closest(digest)[1]
+    finally:
+        if own_pool is not None:
+            own_pool.close()
+    return None if best is None else replace(best, attempts=attempts)
+
+
+def _collect_chunks(
+    job: SearchJob,
+    submit: Callable[[int], Future],
+    best: Any,
+    chunks: Iterator[int],
+    jobs: int,
+    progress: Optional[Callable[[int], None]],
+) -> SearchResult:
+    """Keep `2 * jobs` chunks in flight and collect them in order."""
+    attempts = 0
+    pending: Deque[Future] = deque(
+        submit(start) for start in itertools.islice(chunks, 2 * jobs)
+    )
+    try:
+        while True:
+            index, scanned = pending.popleft().result()
+            attempts += scanned
+            if index is not None:
+                return job.result(index, attempts)
+            if progress:
+                progress(attempts)
+            pending.append(submit(next(chunks)))
+    finally:
+        best.value = -1
+        for future in pending:
+            future.cancel()
+        # Chunks still running give up at once; waiting for them leaves a
+        # reused pool idle for the next search.
+        wait(pending)
+
+
+class SearchPool:
+    """Processes scanning ranges of nonce indices handed in one at a time.
+
+    Used where the ranges come from elsewhere, such as a coordinator. The
+    processes are started once and kept across ranges. `start_method`
+    picks how they are started, see `multiprocessing.get_context`.
+    """
+
+    def __init__(
+        self,
+        job: SearchJob,
+        jobs: int = 1,
+        chunk_size: int = CHUNK_SIZE,
+        start_method: Optional[str] = None,
+    ) -> None:
+        self.job = job
+        self.jobs = jobs
+        self.chunk_size = chunk_size
+        context = multiprocessing.get_context(start_method)
+        self._best = context.Value("q", NO_MATCH)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        if jobs > 1:
+            self._executor = ProcessPoolExecutor(
+                max_workers=jobs,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(job, self._best),
+            )
+
+    def __enter__(self) -> "SearchPool":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._best.value = -1
+            self._executor.shutdown()
+
+    def scan(self, start: int, stop: int) -> Tuple[Optional[int], int]:
+        """Return the first matching index in `[start, stop)` and the attempts made."""
+        starts = range(start, stop, self.chunk_size)
+        if self._executor is None:
+            attempts = 0
+            for chunk_start in starts:
+                chunk_stop = min(stop, chunk_start + self.chunk_size)
+                index, scanned = self.job.scan(chunk_start, chunk_stop)
+                attempts += scanned
+                if index is not None:
+                    return index, attempts
+            return None, attempts
+
+        self._best.value = NO_MATCH
+        futures = [
+            self._executor.submit(
+                _scan_chunk, chunk_start, min(stop, chunk_start + self.chunk_size)
+            )
+            for chunk_start in starts
+        ]
+        attempts = 0
+        for future in futures:
+            index, scanned = future.result()
+            attempts += scanned
+            if index is not None:
+                for pending in futures:
+                    pending.cancel()
+                return index, attempts
+        return None, attempts
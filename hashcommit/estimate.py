@@ -0,0 +1,152 @@
+"""How long a search is expected to take, and how it is going.
+
+A candidate commit hash is 40 uniformly random hex digits, so every
+attempt succeeds independently with the same probability and the number
+of attempts until a match is geometrically distributed.
+"""
+
+import math
+import sys
+import time
+from typing import List, Optional, TextIO
+
+from .engine import CHUNK_SIZE, SearchJob
+from .pattern import HashPattern, PatternSet
+
+REPORT_INTERVAL = 1.0
+CALIBRATION_SECONDS = 1.0
+
+
+def pattern_probability(pattern: HashPattern) -> float:
+    """Chance that a single candidate hash matches `pattern`.
+
+    Wildcards match anything. BEGIN and END fix the position of the
+    pattern; CONTAIN may match at any of its places, which are treated as
+    independent.
+    """
+    single = 16.0**-pattern.fixed_digits
+    if len(pattern.masks) == 1 or single >= 1:
+        return single
+    return -math.expm1(len(pattern.masks) * math.log1p(-single))
+
+
+def match_probability(patterns: PatternSet) -> float:
+    """Chance that a single candidate hash matches any of `patterns`.
+
+    The patterns are treated as independent, so the expected attempts
+    shrink in proportion to the number of acceptable patterns.
+    """
+    probabilities = [pattern_probability(p) for p in patterns.patterns]
+    if len(probabilities) == 1 or max(probabilities) >= 1:
+        return max(probabilities)
+    misses = sum(math.log1p(-probability) for probability in probabilities)
+    return -math.expm1(misses)
+
+
+def expected_attempts(patterns: PatternSet) -> float:
+    return 1 / match_probability(patterns)
+
+
+def success_probability(attempts: int, probability: float) -> float:
+    """Chance of having found a match within `attempts` candidates."""
+    if probability >= 1:
+        # Patterns of wildcards match every candidate.
+        return 1.0 if attempts > 0 else 0.0
+    return -math.expm1(attempts * math.log1p(-probability))
+
+
+def attempts_for_confidence(confidence: float, probability: float) -> float:
+    """Attempts needed to find a match with the given chance."""
+    if probability >= 1:
+        return 1.0
+    return math.log1p(-confidence) / math.log1p(-probability)
+
+
+def format_duration(seconds: float) -> str:
+    if seconds < 60:
+        return f"{seconds:.1f}s"
+    units = [("y", 365 * 86400), ("d", 86400), ("h", 3600), ("m", 60), ("s", 1)]
+    parts: List[str] = []
+    remaining = int(seconds)
+    for suffix, size in units:
+        if remaining >= size or parts:
+            parts.append(f"{remaining // size}{suffix}")
+            remaining %= size
+        if len(parts) == 2:
+            break
+    return " ".join(parts)
+
+
+def format_estimate(patterns: PatternSet, rate: float, jobs: int) -> str:
+    """Describe the expected search time at `rate` candidates per second."""
+    probability = match_probability(patterns)
+    lines = [
+        f"Expected attempts: {1 / probability:,.0f}",
+        f"Hash rate: {rate:,.0f} candidates/s ({jobs} job(s))",
+        f"Expected time: {format_duration(1 / probability / rate)}",
+    ]
+    for confidence in (0.5, 0.9, 0.99):
+        attempts = attempts_for_confidence(confidence, probability)
+        lines.append(
+            f"{confidence:.0%} chance within: {format_duration(attempts / rate)}"
+        )
+    return "\n".join(lines)
+
+
+def calibrate(job: SearchJob, duration: float) -> float:
+    """Return the candidates per second one process scans for `job`."""
+    scanned = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < duration:
+        _, count = job.scan(scanned, scanned + CHUNK_SIZE)
+        scanned += count
+        elapsed = time.perf_counter() - start
+    return scanned / elapsed
+
+
+class ProgressReporter:
+    """Prints the hash rate, attempts and chance of success while mining.
+
+    The line is redrawn at most once per `interval` seconds. Attempts of an
+    interrupted run that is being resumed count as `previous_attempts`.
+    """
+
+    def __init__(
+        self,
+        probability: float,
+        stream: Optional[TextIO] = None,
+        interval: float = REPORT_INTERVAL,
+        previous_attempts: int = 0,
+    ) -> None:
+        self.probability = probability
+        self.previous_attempts = previous_attempts
+        self.stream = stream or sys.stderr
+        self.interval = interval
+        self.started = time.perf_counter()
+        self._last_report = self.started
+        self._reported = False
+
+    def __call__(self, attempts: int) -> None:
+        now = time.perf_counter()
+        if now - self._last_report < self.interval:
+            return
+        self._last_report = now
+        elapsed = now - self.started
+        rate = attempts / elapsed
+        total = self.previous_attempts + attempts
+        chance = success_probability(total, self.probability)
+        self.stream.write(
+            f"\r{total:,} attempts, {rate:,.0f} candidates/s, "
+            f"{chance:.1%} chance of success so far, "
+            f"{format_duration(elapsed)} of "
+            f"{format_duration(1 / self.probability / rate)} expected "
+        )
+        self.stream.flush()
+        self._reported = True
+
+    def finish(self) -> None:
+        """End the progress line so later output starts on a new line."""
+        if self._reported:
+            self.stream.write("\n")
+            self.stream.flush()
@@ -1,9 +1,21 @@
+import logging
 import os
 import subprocess
-from typing import Dict, Optional
+from dataclasses import dataclass, replace
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
 
+from .gitio import Commit, object_reader, object_writer, split_name_email
+from .objectstore import Unsupported
+from .signing import SigningConfig
 from .utils import run_subprocess
 
+EMPTY_TREE_HASH = "4b825dc642cb6eb9a060e54bf8d69288fbbfecd9"
+
+
+def format_timestamp(timestamp: datetime) -> str:
+    return timestamp.astimezone().strftime("%a %b %d %H:%M:%S %Y %z")
+
 
 def is_in_git_repo() -> bool:
     return (
@@ -14,25 +26,47 @@ def is_in_git_repo() -> bool:
     )
 
 
-def does_repo_have_any_commits() -> bool:
-    return run_subprocess(["git", "rev-parse", "HEAD"], check=False).returncode == 0
+def is_ancestor(ancestor: str, rev: str = "HEAD") -> bool:
+    store = object_reader().store
+    if store is not None:
+        try:
+            return store.is_ancestor(ancestor, rev)
+        except Unsupported as error:
+            logging.debug(f"Checking ancestry with git: {error}")
+    result = run_subprocess(
+        ["git", "merge-base", "--is-ancestor", ancestor, rev], check=False
+    )
+    return result.returncode == 0
 
 
 def extract_stdout(result: subprocess.CompletedProcess) -> str:
     return str(result.stdout.decode().strip())
 
 
+def read_commit(commit: Optional[str] = None) -> Commit:
+    rev = commit or "HEAD"
+    result = object_reader().read_commit(rev)
+    if result is None:
+        raise ValueError(f"Not a commit: {rev}")
+    return result
+
+
+def read_commit_object(commit: str) -> bytes:
+    """Return the raw content of the commit object `commit`."""
+    result = object_reader().read(commit)
+    if result is None or result[1] != "commit":
+        raise ValueError(f"Not a commit: {commit}")
+    return result[2]
+
+
 def create_git_env(
     timestamp: str, preserve_author: bool, related_commit_hash: Optional[str]
 ) -> Dict[str, str]:
     env = os.environ.copy()
 
-    if does_repo_have_any_commits():
-        args = ["git", "show", "-s", "--format=%ad"]
-        if related_commit_hash:
-            args.append(related_commit_hash)
-        result = run_subprocess(args)
-        author_date = extract_stdout(result)
+    related_commit = object_reader().read_commit(related_commit_hash or "HEAD")
+    if related_commit is not None:
+        author_date = related_commit.author_date
     else:
         author_date = timestamp
 
@@ -42,14 +76,9 @@ def create_git_env(
         env.pop("GIT_COMMITTER_NAME", None)
         env.pop("GIT_COMMITTER_EMAIL", None)
 
-        args = ["git", "show", "-s", "--format=%an|%ae|%cn|%ce"]
-        if related_commit_hash:
-            args.append(related_commit_hash)
-        result = run_subprocess(args)
-
-        author_name, author_email, committer_name, committer_email = extract_stdout(
-            result
-        ).split("|")
+        commit = read_commit(related_commit_hash)
+        author_name, author_email = split_name_email(commit.author_name_email)
+        committer_name, committer_email = split_name_email(commit.committer_name_email)
 
         env["GIT_AUTHOR_NAME"] = author_name
         env["GIT_AUTHOR_EMAIL"] = author_email
@@ -64,33 +93,16 @@ def create_git_env(
 
 
 def get_tree_hash(commit: Optional[str] = None) -> str:
-    args = ["git", "show", "-s", "--format=%T"]
     if commit:
-        args.append(commit)
-        result = run_subprocess(args)
-        return extract_stdout(result)
+        return read_commit(commit).tree
 
     result = run_subprocess(["git", "write-tree"])
     return extract_stdout(result)
 
 
 def get_head_hash() -> Optional[str]:
-    try:
-        result = run_subprocess(["git", "rev-parse", "HEAD"])
-        return extract_stdout(result)
-    except subprocess.CalledProcessError:
-        return None
-
-
-def get_parent_head_hash() -> Optional[str]:
-    try:
-        result = run_subprocess(["git", "rev-parse", "HEAD^"])
-        value = extract_stdout(result)
-        if not value:
-            raise ValueError("Empty HEAD^ hash")
-        return value
-    except subprocess.CalledProcessError:
-        return None
+    commit = object_reader().read_commit("HEAD")
+    return commit.oid if commit else None
 
 
 def will_commits_be_signed() -> bool:
@@ -98,25 +110,191 @@ def will_commits_be_signed() -> bool:
     return result.returncode == 0 and extract_stdout(result) == "true"
 
 
+def get_signing_config(committer: str) -> Optional[SigningConfig]:
+    """Return how commits get signed, or None if they are not signed."""
+    if not will_commits_be_signed():
+        return None
+    result = run_subprocess(
+        ["git", "config", "--get-regexp", r"^(gpg\..*|user\.signingkey)$"],
+        check=False,
+    )
+    return signing_config_from(parse_config(extract_stdout(result)), committer)
+
+
+def parse_config(output: str) -> Dict[str, str]:
+    """Map the keys listed by `git config --get-regexp`, lowercased, to values."""
+    config: Dict[str, str] = {}
+    for line in output.splitlines():
+        key, _, value = line.partition(" ")
+        config[key.lower()] = value
+    return config
+
+
+def signing_config_from(config: Dict[str, str], committer: str) -> SigningConfig:
+    """Return how commits get signed with the `gpg.*` and `user.*` `config`."""
+    sign_format = config.get("gpg.format", "openpgp")
+    default_program = "gpgsm" if sign_format == "x509" else "gpg"
+    program = config.get(f"gpg.{sign_format}.program", default_program)
+    if sign_format == "openpgp":
+        program = config.get("gpg.program", program)
+    return SigningConfig(
+        format=sign_format,
+        program=program,
+        key=config.get("user.signingkey", committer),
+    )
+
+
+@dataclass(frozen=True)
+class CommitContext:
+    """Identity, dates and signing configuration resolved once per run.
+
+    `fixed_author_date` tells whether the author date comes from another
+    commit rather than from the clock, like the committer date.
+    """
+
+    env: Dict[str, str]
+    author: str
+    committer: str
+    encoding: Optional[str]
+    signing: Optional[SigningConfig]
+    timestamp: datetime
+    fixed_author_date: bool = True
+
+
 def run_commit_tree(
     tree_hash: str,
     content: str,
     timestamp: str,
-    head_hash: Optional[str],
-    preserve_author: bool,
-    related_commit_hash: Optional[str],
+    parent_hashes: Sequence[str],
+    context: CommitContext,
 ) -> str:
     args = ["git", "commit-tree", tree_hash, "-m", content]
-    if head_hash:
-        args.extend(["-p", head_hash])
-    if will_commits_be_signed():
+    for parent_hash in parent_hashes:
+        args.extend(["-p", parent_hash])
+    if context.signing:
         args.append("-S")
+    result = run_subprocess(args, env={**context.env, "GIT_COMMITTER_DATE": timestamp})
+    return extract_stdout(result)
+
+
+def get_commit_idents(env: Dict[str, str]) -> Tuple[str, str]:
+    """Return the full author ident and the committer name/email for `env`."""
+    author = extract_stdout(run_subprocess(["git", "var", "GIT_AUTHOR_IDENT"], env=env))
+    committer = extract_stdout(
+        run_subprocess(["git", "var", "GIT_COMMITTER_IDENT"], env=env)
+    )
+    committer_name_email = committer.rsplit(" ", 2)[0]
+    return author, committer_name_email
+
+
+def get_commit_encoding() -> Optional[str]:
+    result = run_subprocess(["git", "config", "i18n.commitEncoding"], check=False)
+    return commit_encoding_from(
+        extract_stdout(result) if result.returncode == 0 else None
+    )
+
+
+def commit_encoding_from(encoding: Optional[str]) -> Optional[str]:
+    """The encoding header for `i18n.commitEncoding`, None for UTF-8."""
+    if encoding is None or encoding.lower() in ("utf-8", "utf8"):
+        return None
+    return encoding
+
+
+def write_commit_object(body: bytes) -> str:
+    return object_writer().write(body)
+
+
+def update_head(commit_hash: str, reflog_message: str) -> None:
+    run_subprocess(["git", "update-ref", "-m", reflog_message, "HEAD", commit_hash])
+
+
+def resolve_commit_context(
+    preserve_author: bool, related_commit_hash: Optional[str]
+) -> CommitContext:
+    timestamp = datetime.now()
+    formatted = format_timestamp(timestamp)
+    env = create_git_env(
+        timestamp=formatted,
+        preserve_author=preserve_author,
+        related_commit_hash=related_commit_hash,
+    )
+    author, committer = get_commit_idents(env)
+    return CommitContext(
+        env=env,
+        author=author,
+        committer=committer,
+        encoding=get_commit_encoding(),
+        signing=get_signing_config(committer),
+        timestamp=timestamp,
+        fixed_author_date=env["GIT_AUTHOR_DATE"] != formatted,
+    )
+
+
+def refresh_commit_context(context: CommitContext) -> CommitContext:
+    """`context` with its dates, including the author date, moved to now."""
+    timestamp = datetime.now()
+    formatted = format_timestamp(timestamp)
+    raw_date = f"{int(timestamp.timestamp())} {timestamp.astimezone():%z}"
+    return replace(
+        context,
+        env={
+            **context.env,
+            "GIT_AUTHOR_DATE": formatted,
+            "GIT_COMMITTER_DATE": formatted,
+        },
+        author=f"{context.author.rsplit(' ', 2)[0]} {raw_date}",
+        timestamp=timestamp,
+        fixed_author_date=False,
+    )
+
+
+def derive_commit_context(
+    context: CommitContext, commit: Commit, preserve_author: bool
+) -> CommitContext:
+    """Context for recreating `commit`, reusing everything `context` resolved.
+
+    Like `create_git_env`, the author date comes from `commit`, and so do the
+    author and committer name and email when `preserve_author` is set.
+    """
+    if preserve_author:
+        author, committer = commit.author_name_email, commit.committer_name_email
+    else:
+        author, committer = context.author.rsplit(" ", 2)[0], context.committer
+    env = {**context.env, "GIT_AUTHOR_DATE": commit.author_date}
+    for prefix, name_email in (("GIT_AUTHOR", author), ("GIT_COMMITTER", committer)):
+        env[f"{prefix}_NAME"], env[f"{prefix}_EMAIL"] = split_name_email(name_email)
+    return replace(
+        context,
+        env=env,
+        author=f"{author} {commit.author_date}",
+        committer=committer,
+        fixed_author_date=True,
+    )
+
+
+def list_commits(rev: str = "HEAD") -> List[str]:
+    """Return the commits reachable from `rev`, oldest first."""
+    return [oid for oid, _ in list_commit_parents(rev)]
+
+
+def list_commit_parents(rev: str = "HEAD") -> List[Tuple[str, Tuple[str, ...]]]:
+    """Return the commits reachable from `rev` with their parents, oldest first.
+
+    Parents come before their children, and the parents of each commit are
+    in the order they are stored in.
+    """
+    store = object_reader().store
+    if store is not None:
+        try:
+            return store.walk(rev)
+        except Unsupported as error:
+            logging.debug(f"Walking {rev} with git: {error}")
     result = run_subprocess(
-        args,
-        env=create_git_env(
-            timestamp=timestamp,
-            preserve_author=preserve_author,
-            related_commit_hash=related_commit_hash,
-        ),
+        ["git", "rev-list", "--reverse", "--topo-order", "--parents", rev]
     )
-    return extract_stdout(result)
+    commits = []
+    for line in extract_stdout(result).splitlines():
+        oid, *parents = line.split()
+        commits.append((oid, tuple(parents)))
+    return commits
@@ -0,0 +1,271 @@
+"""Long-lived git processes for object reads and writes.
+
+Instead of forking git for every question, object reads come from the
+repository's files through the object store, or from one `git cat-file
+--batch` for what it does not read. New commit objects are hashed and
+compressed in-process and written as loose objects, or within
+`packed_writes` into one packfile.
+"""
+
+import atexit
+import logging
+import os
+import subprocess
+import tempfile
+import zlib
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import IO, Iterator, List, Optional, Sequence, Tuple, Union
+
+from .engine import hash_commit_object
+from .objectstore import ObjectStore, Unsupported, open_object_store
+from .pack import PackWriter
+from .utils import run_subprocess
+
+
+def split_name_email(name_email: str) -> Tuple[str, str]:
+    """Split `Name <email>` into its parts."""
+    name, _, email = name_email.rpartition(" <")
+    return name, email.rstrip(">")
+
+
+@dataclass(frozen=True)
+class Commit:
+    oid: str
+    tree: str
+    parents: Tuple[str, ...]
+    author: str
+    committer: str
+    message: str
+
+    @property
+    def author_name_email(self) -> str:
+        return self.author.rsplit(" ", 2)[0]
+
+    @property
+    def author_date(self) -> str:
+        return " ".join(self.author.rsplit(" ", 2)[1:])
+
+    @property
+    def committer_name_email(self) -> str:
+        return self.committer.rsplit(" ", 2)[0]
+
+
+def parse_commit(oid: str, content: bytes) -> Commit:
+    head, _, message = content.decode("utf-8", errors="replace").partition("\n\n")
+    headers: List[Tuple[str, str]] = []
+    for line in head.split("\n"):
+        if line.startswith(" ") and headers:
+            key, value = headers[-1]
+            headers[-1] = (key, value + "\n" + line[1:])
+        else:
+            key, _, value = line.partition(" ")
+            headers.append((key, value))
+    values = dict(headers)
+    return Commit(
+        oid=oid,
+        tree=values["tree"],
+        parents=tuple(value for key, value in headers if key == "parent"),
+        author=values["author"],
+        committer=values["committer"],
+        message=message,
+    )
+
+
+SIGNATURE_HEADERS = (b"gpgsig", b"gpgsig-sha256")
+
+
+def replace_parents(content: bytes, parents: Sequence[str]) -> bytes:
+    """Return the commit object `content` with `parents` as its parents.
+
+    Everything else is kept byte for byte, except signatures, which the new
+    parents would invalidate.
+    """
+    head, separator, message = content.partition(b"\n\n")
+    lines: List[bytes] = []
+    skipping = False
+    for line in head.split(b"\n"):
+        if line.startswith(b" "):
+            if not skipping:
+                lines.append(line)
+            continue
+        key = line.partition(b" ")[0]
+        skipping = key in SIGNATURE_HEADERS
+        if skipping or key == b"parent":
+            continue
+        lines.append(line)
+        if key == b"tree":
+            lines.extend(b"parent " + parent.encode() for parent in parents)
+    return b"\n".join(lines) + separator + message
+
+
+class GitObjectReader:
+    """Answers object reads from the object store, or else through one
+    `git cat-file --batch` process started when it is first needed.
+    """
+
+    def __init__(self) -> None:
+        self.store: Optional[ObjectStore] = open_object_store()
+        self._process: Optional[subprocess.Popen] = None
+
+    def read(self, rev: str) -> Optional[Tuple[str, str, bytes]]:
+        """Return `(oid, type, content)` for `rev`, or None if it does not exist."""
+        if self.store is not None:
+            try:
+                oid = self.store.resolve(rev)
+                if oid is None:
+                    return None
+                object_type, content = self.store.read(oid)
+                return oid, object_type, content
+            except Unsupported as error:
+                logging.debug(f"Reading {rev} with git: {error}")
+        stdin, stdout = self._pipes()
+        stdin.write(rev.encode() + b"\n")
+        stdin.flush()
+        header = stdout.readline().decode().split()
+        if len(header) != 3:
+            return None
+        oid, object_type, size = header
+        content = stdout.read(int(size))
+        stdout.read(1)
+        return oid, object_type, content
+
+    def read_commit(self, rev: str) -> Optional[Commit]:
+        result = self.read(rev)
+        if result is None or result[1] != "commit":
+            return None
+        return parse_commit(result[0], result[2])
+
+    def _pipes(self) -> Tuple[IO[bytes], IO[bytes]]:
+        if self._process is None:
+            self._process = subprocess.Popen(
+                ["git", "cat-file", "--batch"],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+            )
+        assert self._process.stdin and self._process.stdout
+        return self._process.stdin, self._process.stdout
+
+    def close(self) -> None:
+        if self.store is not None:
+            self.store.close()
+        if self._process is not None:
+            stdin, _ = self._pipes()
+            stdin.close()
+            self._process.wait()
+            self._process = None
+
+
+class LooseObjectWriter:
+    """Stores commit objects as loose objects in `objects_dir`, the way
+    `git hash-object -w` does, without handing their bytes to git."""
+
+    def __init__(self, objects_dir: Path) -> None:
+        self.objects_dir = objects_dir
+
+    def write(self, body: bytes) -> str:
+        """Store the commit object `body` and return its hash."""
+        oid = hash_commit_object(body)
+        path = self.objects_dir / oid[:2] / oid[2:]
+        if path.exists():
+            return oid
+        path.parent.mkdir(parents=True, exist_ok=True)
+        descriptor, name = tempfile.mkstemp(prefix="tmp_obj_", dir=path.parent)
+        try:
+            with os.fdopen(descriptor, "wb") as handle:
+                handle.write(zlib.compress(b"commit %d\0" % len(body) + body))
+                handle.flush()
+                os.fsync(handle.fileno())
+            # Like git, make the object read-only and move it in whole.
+            os.chmod(name, 0o444)
+            os.replace(name, path)
+        except BaseException:
+            if os.path.exists(name):
+                os.unlink(name)
+            raise
+        return oid
+
+    def close(self) -> None:
+        pass
+
+
+_reader: Optional[GitObjectReader] = None
+_writer: Optional[LooseObjectWriter] = None
+_pack: Optional[PackWriter] = None
+_directory: Optional[str] = None
+
+
+def _check_directory() -> None:
+    """Restart the git processes when the working directory has changed.
+
+    They, and the object store, answer for the repository they were
+    started in.
+    """
+    global _directory
+    directory = os.getcwd()
+    if directory != _directory:
+        close_git_io()
+        _directory = directory
+
+
+def object_reader() -> GitObjectReader:
+    global _reader
+    _check_directory()
+    if _reader is None:
+        _reader = GitObjectReader()
+    return _reader
+
+
+def object_writer() -> Union[LooseObjectWriter, PackWriter]:
+    global _writer
+    _check_directory()
+    if _pack is not None:
+        return _pack
+    if _writer is None:
+        _writer = LooseObjectWriter(objects_directory())
+    return _writer
+
+
+def objects_directory() -> Path:
+    """The directory git stores the repository's objects in."""
+    store = object_reader().store
+    if store is not None:
+        return store.objects
+    result = run_subprocess(["git", "rev-parse", "--git-path", "objects"])
+    return Path(result.stdout.decode().strip())
+
+
+@contextmanager
+def packed_writes() -> Iterator[None]:
+    """Store the commit objects written in the block in one packfile.
+
+    The objects are only in the repository once the block is over, and not
+    at all if it raises. Nested blocks share the outer pack.
+    """
+    global _pack
+    if _pack is not None:
+        yield
+        return
+    pack = PackWriter(objects_directory())
+    _pack = pack
+    try:
+        yield
+    except BaseException:
+        pack.abort()
+        raise
+    finally:
+        _pack = None
+    pack.close()
+
+
+@atexit.register
+def close_git_io() -> None:
+    """Stop the long-lived git process and forget the repository's objects."""
+    global _reader, _writer
+    if _reader is not None:
+        _reader.close()
+        _reader = None
+    if _writer is not None:
+        _writer.close()
+        _writer = None
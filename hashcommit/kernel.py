@@ -0,0 +1,173 @@
+"""Batch SHA-1 over many commit candidates at once, backed by NumPy.
+
+NumPy is optional. When it is not installed `np` is None and the search
+hashes candidates one by one with hashlib instead.
+"""
+
+import importlib
+import struct
+from typing import Any, List, Sequence, Tuple, Union
+
+from .pattern import PatternSet
+
+np: Any
+try:
+    np = importlib.import_module("numpy")
+except ImportError:  # pragma: no cover - exercised only without NumPy
+    np = None
+
+BATCH_SIZE = 1 << 14
+
+_INITIAL_STATE = (0x67452301, 0xEFCDAB89, 0x98BADCFE, 0x10325476, 0xC3D2E1F0)
+_ROUND_CONSTANTS = (0x5A827999, 0x6ED9EBA1, 0x8F1BBCDC, 0xCA62C1D6)
+_MASK = 0xFFFFFFFF
+
+# A word is either a plain int shared by the whole batch or a uint32 array
+# holding one value per candidate; NumPy broadcasting mixes the two.
+Word = Union[int, Any]
+
+
+def is_available() -> bool:
+    return np is not None
+
+
+def fits_batch_kernel(prefix_length: int, nonce_width: int, tail_length: int) -> bool:
+    """Whether the nonce and everything after it fit in the last two blocks.
+
+    Past that point the batch kernel compresses too many blocks per
+    candidate to beat hashlib.
+    """
+    variable = prefix_length % 64 + nonce_width + tail_length + 9
+    return variable <= 128
+
+
+def _rotl(value: int, count: int) -> int:
+    return ((value << count) | (value >> (32 - count))) & _MASK
+
+
+def sha1_compress(state: Tuple[int, ...], block: bytes) -> Tuple[int, ...]:
+    """Run the SHA-1 compression function on a single 64-byte block."""
+    words = list(struct.unpack(">16I", block))
+    for t in range(16, 80):
+        words.append(
+            _rotl(words[t - 3] ^ words[t - 8] ^ words[t - 14] ^ words[t - 16], 1)
+        )
+    a, b, c, d, e = state
+    for t in range(80):
+        if t < 20:
+            f = (b & c) | (~b & d)
+        elif t < 40 or t >= 60:
+            f = b ^ c ^ d
+        else:
+            f = (b & c) | (b & d) | (c & d)
+        temp = (_rotl(a, 5) + f + e + _ROUND_CONSTANTS[t // 20] + words[t]) & _MASK
+        a, b, c, d, e = temp, a, _rotl(b, 30), c, d
+    return tuple((x + y) & _MASK for x, y in zip(state, (a, b, c, d, e)))
+
+
+def sha1_midstate(data: bytes) -> Tuple[int, ...]:
+    """Return the SHA-1 state after hashing `data`, a whole number of blocks."""
+    if len(data) % 64:
+        raise ValueError("Midstate data must be a multiple of 64 bytes")
+    state: Tuple[int, ...] = _INITIAL_STATE
+    for offset in range(0, len(data), 64):
+        state = sha1_compress(state, data[offset : offset + 64])
+    return state
+
+
+def _sha1_padding(message_length: int) -> bytes:
+    zeros = (55 - message_length) % 64
+    return b"\x80" + b"\0" * zeros + struct.pack(">Q", message_length * 8)
+
+
+def _vrotl(value: Word, count: int) -> Word:
+    if isinstance(value, int):
+        return _rotl(value, count)
+    return (value << np.uint32(count)) | (value >> np.uint32(32 - count))
+
+
+def _vcompress(state: Sequence[Word], words: List[Word]) -> Tuple[Word, ...]:
+    words = list(words)
+    for t in range(16, 80):
+        words.append(
+            _vrotl(words[t - 3] ^ words[t - 8] ^ words[t - 14] ^ words[t - 16], 1)
+        )
+    a, b, c, d, e = state
+    for t in range(80):
+        if t < 20:
+            f = (b & c) | ((b ^ _MASK) & d)
+        elif t < 40 or t >= 60:
+            f = b ^ c ^ d
+        else:
+            f = (b & c) | (b & d) | (c & d)
+        temp = _vadd(_vrotl(a, 5), f, e, _ROUND_CONSTANTS[t // 20], words[t])
+        a, b, c, d, e = temp, a, _vrotl(b, 30), c, d
+    return tuple(_vadd(x, y) for x, y in zip(state, (a, b, c, d, e)))
+
+
+def _vadd(*values: Word) -> Word:
+    scalar = sum(value for value in values if isinstance(value, int)) & _MASK
+    arrays = [value for value in values if not isinstance(value, int)]
+    if not arrays:
+        return scalar
+    total = arrays[0] + np.uint32(scalar)
+    for array in arrays[1:]:
+        total += array
+    return total
+
+
+class BatchHasher:
+    """Hashes a batch of nonces placed between a fixed head and tail.
+
+    Every full block before the nonce is compressed once in pure Python.
+    Message words that do not overlap the nonce stay plain ints, so the
+    rounds before the nonce are computed once for the whole batch.
+    """
+
+    def __init__(self, head: bytes, tail: bytes, nonce_width: int) -> None:
+        size = len(head) + nonce_width + len(tail)
+        data = b"commit %d\0" % size + head
+        full = len(data) - len(data) % 64
+        self.nonce_width = nonce_width
+        self._state = sha1_midstate(data[:full])
+        self._nonce_offset = len(data) - full
+        message_length = len(data) + nonce_width + len(tail)
+        self._rest = (
+            data[full:] + b"\0" * nonce_width + tail + _sha1_padding(message_length)
+        )
+
+    def _words(self, nonces: Any) -> List[Word]:
+        columns = nonces.astype(np.uint32)
+        words: List[Word] = []
+        for offset in range(0, len(self._rest), 4):
+            word: Word = int.from_bytes(self._rest[offset : offset + 4], "big")
+            for position in range(offset, offset + 4):
+                column = position - self._nonce_offset
+                if 0 <= column < self.nonce_width:
+                    shift = np.uint32(8 * (3 - (position - offset)))
+                    word = word | (columns[:, column] << shift)
+            words.append(word)
+        return words
+
+    def digests(self, nonces: Any) -> Any:
+        """Return an `(N, 20)` uint8 array of digests for `(N, width)` nonces."""
+        words = self._words(nonces)
+        state: Tuple[Word, ...] = self._state
+        for offset in range(0, len(words), 16):
+            state = _vcompress(state, words[offset : offset + 16])
+        count = len(nonces)
+        columns = [np.broadcast_to(np.uint32(word), count) for word in state]
+        return np.stack(columns, axis=1).astype(">u4").view(np.uint8)
+
+
+def match_digests(digests: Any, pattern: PatternSet) -> Any:
+    """Return a boolean array telling which digests match any pattern.
+
+    Each place of the pattern only looks at the digest bytes it covers.
+    """
+    hits = np.zeros(len(digests), dtype=bool)
+    for start, mask, value in pattern.byte_masks():
+        columns = digests[:, start : start + len(mask)]
+        masked = columns & np.frombuffer(mask, dtype=np.uint8)
+        hits |= (masked == np.frombuffer(value, dtype=np.uint8)).all(axis=1)
+    return hits
@@ -0,0 +1,507 @@
+"""Reading refs and objects straight from the repository's files.
+
+`ObjectStore` resolves HEAD and refs, including `packed-refs`, inflates
+loose objects and finds objects in packfiles through their memory-mapped
+`.idx` files, resolving deltas, so that looking up and walking commits
+needs no git process. It only answers what it is sure git would answer the
+same way: anything else raises `Unsupported`, and the caller asks git.
+
+Repositories with replaced objects, SHA-256 object names or another ref
+storage are left to git entirely. So are abbreviated object names and
+revision syntax beyond `~` and `^`, objects it cannot find, which may live
+in alternates, and walks of shallow or grafted histories or of more than
+`WALK_LIMIT` commits. Packs written after it looked are found on the next
+miss.
+"""
+
+import mmap
+import os
+import re
+import struct
+import zlib
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+WALK_LIMIT = 10000
+
+OBJECT_TYPES = {1: "commit", 2: "tree", 3: "blob", 4: "tag"}
+OFS_DELTA = 6
+REF_DELTA = 7
+
+PER_WORKTREE_REFS = ("refs/bisect/", "refs/rewritten/", "refs/worktree/")
+REF_PREFIXES = ("refs/", "refs/tags/", "refs/heads/", "refs/remotes/")
+
+_FULL_OID = re.compile(r"[0-9a-f]{40}")
+_ABBREVIATED_OID = re.compile(r"[0-9a-fA-F]{4,40}")
+_PSEUDOREF = re.compile(r"[A-Z_]+")
+_REF_NAME = re.compile(r"[A-Za-z0-9_+./-]+")
+_NAVIGATION = re.compile(r"(\^|~)([0-9]*)$")
+_EXTENSION = re.compile(r"^\s*(objectformat|refstorage)\s*=\s*(\S+)", re.I | re.M)
+# Settings that change which repository or objects git would look at.
+_UNSUPPORTED_ENVIRONMENT = (
+    "GIT_CEILING_DIRECTORIES",
+    "GIT_COMMON_DIR",
+    "GIT_GRAFT_FILE",
+    "GIT_NAMESPACE",
+    "GIT_OBJECT_DIRECTORY",
+    "GIT_REPLACE_REF_BASE",
+)
+
+
+class Unsupported(Exception):
+    """The object store cannot answer this; ask git instead."""
+
+
+def apply_delta(base: bytes, delta: bytes) -> bytes:
+    """Rebuild an object from its delta against `base`."""
+
+    def varint(position: int) -> Tuple[int, int]:
+        value = shift = 0
+        while True:
+            byte = delta[position]
+            position += 1
+            value |= (byte & 0x7F) << shift
+            shift += 7
+            if not byte & 0x80:
+                return value, position
+
+    base_size, position = varint(0)
+    result_size, position = varint(position)
+    if base_size != len(base):
+        raise ValueError("Delta base has the wrong size")
+    result = bytearray()
+    while position < len(delta):
+        opcode = delta[position]
+        position += 1
+        if opcode & 0x80:
+            offset = size = 0
+            for bit in range(4):
+                if opcode & (1 << bit):
+                    offset |= delta[position] << (8 * bit)
+                    position += 1
+            for bit in range(3):
+                if opcode & (0x10 << bit):
+                    size |= delta[position] << (8 * bit)
+                    position += 1
+            result += base[offset : offset + (size or 0x10000)]
+        elif opcode:
+            result += delta[position : position + opcode]
+            position += opcode
+        else:
+            raise ValueError("Invalid delta opcode")
+    if len(result) != result_size:
+        raise ValueError("Delta result has the wrong size")
+    return bytes(result)
+
+
+def _map(path: Path) -> mmap.mmap:
+    with path.open("rb") as handle:
+        return mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class Pack:
+    """One packfile and its version 2 index."""
+
+    def __init__(self, index_path: Path) -> None:
+        self._index = _map(index_path)
+        self._pack = _map(index_path.with_suffix(".pack"))
+        if self._index[:8] != b"\377tOc\0\0\0\2" or self._pack[:4] != b"PACK":
+            self.close()
+            raise Unsupported(f"Unsupported pack format: {index_path}")
+        self._fanout = struct.unpack_from(">256I", self._index, 8)
+        count = self._fanout[255]
+        self._names = 8 + 256 * 4
+        self._offsets = self._names + 24 * count
+        self._large_offsets = self._offsets + 4 * count
+
+    def close(self) -> None:
+        self._index.close()
+        self._pack.close()
+
+    def find(self, oid: bytes) -> Optional[int]:
+        """Return the offset of the object `oid` in the pack, if it is there."""
+        low = self._fanout[oid[0] - 1] if oid[0] else 0
+        high = self._fanout[oid[0]]
+        while low < high:
+            middle = (low + high) // 2
+            start = self._names + 20 * middle
+            name = self._index[start : start + 20]
+            if name < oid:
+                low = middle + 1
+            elif name > oid:
+                high = middle
+            else:
+                (offset,) = struct.unpack_from(
+                    ">I", self._index, self._offsets + 4 * middle
+                )
+                if offset & 0x80000000:
+                    position = self._large_offsets + 8 * (offset & 0x7FFFFFFF)
+                    (offset,) = struct.unpack_from(">Q", self._index, position)
+                return int(offset)
+        return None
+
+    def entry(self, offset: int) -> Tuple[int, bytes, Optional[int], Optional[bytes]]:
+        """Return the type and data at `offset`, and the base if it is a delta.
+
+        The base is the offset of an earlier entry for offset deltas, and the
+        object name for reference deltas.
+        """
+        byte = self._pack[offset]
+        object_type = (byte >> 4) & 7
+        size = byte & 0x0F
+        shift = 4
+        position = offset + 1
+        while byte & 0x80:
+            byte = self._pack[position]
+            position += 1
+            size |= (byte & 0x7F) << shift
+            shift += 7
+        base_offset = base_oid = None
+        if object_type == OFS_DELTA:
+            byte = self._pack[position]
+            position += 1
+            distance = byte & 0x7F
+            while byte & 0x80:
+                byte = self._pack[position]
+                position += 1
+                distance = ((distance + 1) << 7) | (byte & 0x7F)
+            base_offset = offset - distance
+        elif object_type == REF_DELTA:
+            base_oid = self._pack[position : position + 20]
+            position += 20
+        return object_type, self._inflate(position, size), base_offset, base_oid
+
+    def _inflate(self, position: int, size: int) -> bytes:
+        decompressor = zlib.decompressobj()
+        chunks = []
+        chunk_size = size + 64
+        while not decompressor.eof:
+            data = self._pack[position : position + chunk_size]
+            if not data:
+                raise ValueError("Truncated pack entry")
+            chunks.append(decompressor.decompress(data))
+            position += len(data)
+            chunk_size = max(chunk_size, 65536)
+        content = b"".join(chunks)
+        if len(content) != size:
+            raise ValueError("Pack entry has the wrong size")
+        return content
+
+
+class ObjectStore:
+    """Read-only access to the refs and objects of one repository."""
+
+    def __init__(self, git_dir: Path, common_dir: Path) -> None:
+        self.git_dir = git_dir
+        self.common_dir = common_dir
+        self.objects = common_dir / "objects"
+        self._packs: Optional[List[Pack]] = None
+        self._packs_scanned: Optional[int] = None
+        self._packed_refs: Optional[Tuple[float, Dict[str, str]]] = None
+
+    def close(self) -> None:
+        for pack in self._packs or []:
+            pack.close()
+        self._packs = None
+
+    def read(self, oid: str) -> Tuple[str, bytes]:
+        """Return the type and content of the object named `oid`."""
+        loose = self.objects / oid[:2] / oid[2:]
+        try:
+            data = zlib.decompress(loose.read_bytes())
+        except FileNotFoundError:
+            return self._read_packed(bytes.fromhex(oid))
+        except (OSError, zlib.error) as error:
+            raise Unsupported(f"Cannot read {oid}: {error}")
+        header, _, content = data.partition(b"\0")
+        object_type, _, size = header.decode().partition(" ")
+        if int(size) != len(content):
+            raise Unsupported(f"Object {oid} has the wrong size")
+        return object_type, content
+
+    def _read_packed(self, oid: bytes, rescan: bool = True) -> Tuple[str, bytes]:
+        for pack in self._open_packs():
+            offset = pack.find(oid)
+            if offset is not None:
+                try:
+                    return self._read_entry(pack, offset)
+                except (IndexError, ValueError, zlib.error) as error:
+                    raise Unsupported(f"Cannot read {oid.hex()}: {error}")
+        if rescan and self._pack_directory_modified() != self._packs_scanned:
+            # A pack was written or removed since the packs were opened.
+            self.close()
+            return self._read_packed(oid, rescan=False)
+        raise Unsupported(f"Object {oid.hex()} is not in a pack")
+
+    def _read_entry(self, pack: Pack, offset: int) -> Tuple[str, bytes]:
+        deltas = []
+        while True:
+            object_type, data, base_offset, base_oid = pack.entry(offset)
+            if object_type in OBJECT_TYPES:
+                base_type, content = OBJECT_TYPES[object_type], data
+                break
+            deltas.append(data)
+            if base_offset is not None:
+                offset = base_offset
+            elif base_oid is not None:
+                base_type, content = self.read(base_oid.hex())
+                break
+            else:
+                raise ValueError(f"Unknown pack entry type {object_type}")
+        for delta in reversed(deltas):
+            content = apply_delta(content, delta)
+        return base_type, content
+
+    def _pack_directory_modified(self) -> Optional[int]:
+        try:
+            return (self.objects / "pack").stat().st_mtime_ns
+        except OSError:
+            return None
+
+    def _open_packs(self) -> List[Pack]:
+        if self._packs is None:
+            self._packs_scanned = self._pack_directory_modified()
+            self._packs = []
+            for index in sorted((self.objects / "pack").glob("*.idx")):
+                if index.with_suffix(".pack").exists():
+                    self._packs.append(Pack(index))
+        return self._packs
+
+    def read_ref(self, name: str, depth: int = 0) -> Optional[str]:
+        """Return the object `name` points to, following symbolic refs."""
+        if depth > 5:
+            raise Unsupported(f"Too many levels of symbolic refs: {name}")
+        per_worktree = not name.startswith("refs/") or name.startswith(
+            PER_WORKTREE_REFS
+        )
+        path = (self.git_dir if per_worktree else self.common_dir) / name
+        try:
+            value = path.read_text().strip()
+        except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+            return self._read_packed_refs().get(name)
+        except (OSError, UnicodeDecodeError) as error:
+            raise Unsupported(f"Cannot read {name}: {error}")
+        if value.startswith("ref:"):
+            return self.read_ref(value[4:].strip(), depth + 1)
+        # FETCH_HEAD lists the fetched branches after the first object name.
+        oid = value[:40]
+        if not _FULL_OID.fullmatch(oid):
+            raise Unsupported(f"Cannot parse {name}")
+        return oid
+
+    def _read_packed_refs(self) -> Dict[str, str]:
+        path = self.common_dir / "packed-refs"
+        try:
+            modified = path.stat().st_mtime
+        except FileNotFoundError:
+            return {}
+        if self._packed_refs is None or self._packed_refs[0] != modified:
+            refs = {}
+            for line in path.read_text().splitlines():
+                if line and line[0] not in "#^":
+                    oid, _, name = line.partition(" ")
+                    refs[name] = oid
+            self._packed_refs = modified, refs
+        return self._packed_refs[1]
+
+    def has_replaced_objects(self) -> bool:
+        if any(name.startswith("refs/replace/") for name in self._read_packed_refs()):
+            return True
+        return any(
+            path.is_file() for path in (self.common_dir / "refs" / "replace").rglob("*")
+        )
+
+    def resolve(self, rev: str) -> Optional[str]:
+        """Return the object `rev` names, or None if there is no such ref.
+
+        Handles object names, ref names as `git rev-parse` looks them up and
+        any number of `~<n>` and `^<n>` suffixes.
+        """
+        name = rev
+        navigation = []
+        while True:
+            match = _NAVIGATION.search(name)
+            if match is None:
+                break
+            navigation.append(match.groups())
+            name = name[: match.start()]
+        if _FULL_OID.fullmatch(name):
+            oid: Optional[str] = name
+        else:
+            oid = self._resolve_name(name)
+        for operator, count in reversed(navigation):
+            if oid is None:
+                return None
+            if operator == "~":
+                oid = self._parent(oid, 0)
+                for _ in range(int(count or 1)):
+                    if oid is None:
+                        break
+                    oid = self._parent(oid, 1)
+            else:
+                oid = self._parent(oid, int(count or 1))
+        return oid
+
+    def _resolve_name(self, name: str) -> Optional[str]:
+        if (
+            not _REF_NAME.fullmatch(name)
+            or ".." in name
+            or name.endswith((".", "/", ".lock"))
+        ):
+            raise Unsupported(f"Unsupported revision: {name}")
+        candidates = [prefix + name for prefix in REF_PREFIXES]
+        candidates.append(f"refs/remotes/{name}/HEAD")
+        if name.startswith("refs/") or _PSEUDOREF.fullmatch(name):
+            candidates.insert(0, name)
+        for candidate in candidates:
+            oid = self.read_ref(candidate)
+            if oid is not None:
+                return oid
+        if _ABBREVIATED_OID.fullmatch(name):
+            raise Unsupported(f"Abbreviated object names are left to git: {name}")
+        return None
+
+    def _parent(self, oid: str, number: int) -> Optional[str]:
+        """The `number`th parent of the commit `oid` points to, 0 for itself."""
+        object_type, content = self.read(oid)
+        while object_type == "tag":
+            oid = content[7:47].decode()
+            object_type, content = self.read(oid)
+        if object_type != "commit":
+            raise Unsupported(f"Not a commit: {oid}")
+        if number == 0:
+            return oid
+        parents = commit_parents(content)
+        return parents[number - 1] if number <= len(parents) else None
+
+    def walk(self, rev: str) -> List[Tuple[str, Tuple[str, ...]]]:
+        """Return what `git rev-list --reverse --topo-order --parents rev` would.
+
+        `rev` is a revision or a range `exclude..include`.
+        """
+        if (self.common_dir / "shallow").exists() or (
+            self.common_dir / "info" / "grafts"
+        ).exists():
+            raise Unsupported("Shallow or grafted history")
+        exclude, separator, include = rev.rpartition("..")
+        if separator and "..." in rev:
+            raise Unsupported(f"Unsupported range: {rev}")
+        excluded = set(self._ancestors(exclude)) if separator else set()
+        commits = self._ancestors(include or "HEAD", excluded)
+        # Like rev-list, emit a commit once all of its children are out,
+        # visiting the most recently freed parents first.
+        children: Dict[str, int] = {oid: 0 for oid in commits}
+        for parents in commits.values():
+            for parent in parents:
+                if parent in children:
+                    children[parent] += 1
+        stack = [oid for oid, count in children.items() if count == 0]
+        order = []
+        while stack:
+            oid = stack.pop()
+            order.append((oid, commits[oid]))
+            for parent in commits[oid]:
+                if parent in children:
+                    children[parent] -= 1
+                    if children[parent] == 0:
+                        stack.append(parent)
+        order.reverse()
+        return order
+
+    def is_ancestor(self, ancestor: str, rev: str) -> bool:
+        """Whether the commit `ancestor` is reachable from `rev`."""
+        oid = self.resolve(ancestor)
+        if oid is None:
+            raise Unsupported(f"Unknown revision: {ancestor}")
+        return self._parent(oid, 0) in self._ancestors(rev)
+
+    def _ancestors(
+        self, rev: str, excluded: Optional[Set[str]] = None
+    ) -> Dict[str, Tuple[str, ...]]:
+        """The commits reachable from `rev` and not in `excluded`, with parents."""
+        tip = self.resolve(rev)
+        if tip is None:
+            raise Unsupported(f"Unknown revision: {rev}")
+        tip = self._parent(tip, 0)
+        assert tip is not None
+        excluded = excluded or set()
+        commits: Dict[str, Tuple[str, ...]] = {}
+        pending = [tip] if tip not in excluded else []
+        while pending:
+            oid = pending.pop()
+            if oid in commits:
+                continue
+            if len(commits) == WALK_LIMIT:
+                raise Unsupported(f"More than {WALK_LIMIT} commits to walk")
+            object_type, content = self.read(oid)
+            if object_type != "commit":
+                raise Unsupported(f"Not a commit: {oid}")
+            commits[oid] = commit_parents(content)
+            pending.extend(
+                parent
+                for parent in commits[oid]
+                if parent not in commits and parent not in excluded
+            )
+        return commits
+
+
+def commit_parents(content: bytes) -> Tuple[str, ...]:
+    """The parents of the commit object `content`, in the order they are stored."""
+    parents = []
+    for line in content.split(b"\n\n", 1)[0].split(b"\n"):
+        if line.startswith(b"parent "):
+            parents.append(line[7:].decode())
+        elif parents:
+            break
+    return tuple(parents)
+
+
+def find_git_dir(directory: Path) -> Optional[Path]:
+    """The git directory `git` would use in `directory`, if it is plain to see."""
+    if os.environ.get("GIT_DIR"):
+        return directory / os.environ["GIT_DIR"]
+    device = directory.stat().st_dev
+    for candidate in (directory, *directory.parents):
+        if candidate.stat().st_dev != device:
+            return None
+        dot_git = candidate / ".git"
+        if dot_git.is_file():
+            content = dot_git.read_text()
+            if not content.startswith("gitdir:"):
+                return None
+            return candidate / content[7:].strip()
+        if dot_git.is_dir():
+            return dot_git
+        if (candidate / "HEAD").is_file() and (candidate / "objects").is_dir():
+            return candidate
+    return None
+
+
+def open_object_store(directory: str = ".") -> Optional[ObjectStore]:
+    """The object store of the repository at `directory`.
+
+    None if git would look elsewhere than the plain repository layout, or
+    stores objects or refs in a way the object store does not read.
+    """
+    if any(os.environ.get(name) for name in _UNSUPPORTED_ENVIRONMENT):
+        return None
+    try:
+        git_dir = find_git_dir(Path(directory).absolute())
+        if git_dir is None:
+            return None
+        # Whether git trusts a repository of another user is its call.
+        if hasattr(os, "geteuid") and git_dir.stat().st_uid != os.geteuid():
+            return None
+        common_dir = git_dir
+        if (git_dir / "commondir").is_file():
+            common_dir = git_dir / (git_dir / "commondir").read_text().strip()
+        config = (common_dir / "config").read_text(errors="replace")
+    except OSError:
+        return None
+    for _, value in _EXTENSION.findall(config):
+        if value.lower() not in ("sha1", "files"):
+            return None
+    store = ObjectStore(git_dir.resolve(), common_dir.resolve())
+    if not os.environ.get("GIT_NO_REPLACE_OBJECTS") and store.has_replaced_objects():
+        return None
+    return store
@@ -0,0 +1,155 @@
+"""Storing many new commit objects as one packfile.
+
+Rewriting a history creates a commit object for every rewritten commit.
+Written one by one, they would become as many loose object files, left
+for `git gc` to pack. `PackWriter` streams them into a single packfile
+instead and, when closed, writes its version 2 index next to it, fsyncing
+each file once. Git reads the pack as soon as its index appears.
+"""
+
+import hashlib
+import os
+import struct
+import tempfile
+import zlib
+from pathlib import Path
+from types import TracebackType
+from typing import Dict, List, Optional, Tuple, Type
+
+from .engine import hash_commit_object
+
+PACK_SIGNATURE = b"PACK\0\0\0\2"
+INDEX_SIGNATURE = b"\377tOc\0\0\0\2"
+COMMIT_TYPE = 1
+
+
+def entry_header(object_type: int, size: int) -> bytes:
+    """The type and size header of a pack entry."""
+    header = bytearray()
+    byte = (object_type << 4) | (size & 0x0F)
+    size >>= 4
+    while size:
+        header.append(byte | 0x80)
+        byte = size & 0x7F
+        size >>= 7
+    header.append(byte)
+    return bytes(header)
+
+
+def _sync_directory(path: Path) -> None:
+    try:
+        descriptor = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(descriptor)
+    except OSError:
+        pass
+    finally:
+        os.close(descriptor)
+
+
+class PackWriter:
+    """Writes commit objects into one new packfile in `objects_dir`.
+
+    Used as a context manager, the pack is finished when the block ends and
+    dropped if it raises.
+    """
+
+    def __init__(self, objects_dir: Path) -> None:
+        self.pack_dir = objects_dir / "pack"
+        self.pack_dir.mkdir(parents=True, exist_ok=True)
+        descriptor, name = tempfile.mkstemp(prefix="tmp_pack_", dir=self.pack_dir)
+        self._path = Path(name)
+        self._file = os.fdopen(descriptor, "w+b")
+        # The object count is filled in when the pack is finished.
+        self._file.write(PACK_SIGNATURE + struct.pack(">I", 0))
+        self._entries: Dict[bytes, Tuple[int, int]] = {}
+
+    def __enter__(self) -> "PackWriter":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write(self, body: bytes) -> str:
+        """Add the commit object `body` to the pack and return its hash."""
+        oid = hash_commit_object(body)
+        name = bytes.fromhex(oid)
+        if name not in self._entries:
+            entry = entry_header(COMMIT_TYPE, len(body)) + zlib.compress(body)
+            self._entries[name] = self._file.tell(), zlib.crc32(entry)
+            self._file.write(entry)
+        return oid
+
+    def close(self) -> Optional[Path]:
+        """Finish the pack and move it into place. Returns its path, if any."""
+        if not self._entries:
+            self.abort()
+            return None
+        self._file.seek(8)
+        self._file.write(struct.pack(">I", len(self._entries)))
+        self._file.seek(0)
+        digest = hashlib.sha1()
+        for chunk in iter(lambda: self._file.read(65536), b""):
+            digest.update(chunk)
+        checksum = digest.digest()
+        self._file.write(checksum)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+        descriptor, index_name = tempfile.mkstemp(prefix="tmp_idx_", dir=self.pack_dir)
+        with os.fdopen(descriptor, "wb") as index:
+            index.write(self._index(checksum))
+            index.flush()
+            os.fsync(index.fileno())
+
+        # Like git, make the pack read-only and move the index in last.
+        name = self.pack_dir / f"pack-{checksum.hex()}"
+        for temporary, suffix in ((self._path, ".pack"), (Path(index_name), ".idx")):
+            os.chmod(temporary, 0o444)
+            os.replace(temporary, name.with_suffix(suffix))
+        _sync_directory(self.pack_dir)
+        return name.with_suffix(".pack")
+
+    def abort(self) -> None:
+        """Drop the pack and everything written to it."""
+        self._file.close()
+        self._path.unlink()
+
+    def _index(self, checksum: bytes) -> bytes:
+        names = sorted(self._entries)
+        counts = [0] * 256
+        for name in names:
+            counts[name[0]] += 1
+        fanout = []
+        total = 0
+        for count in counts:
+            total += count
+            fanout.append(total)
+        offsets: List[bytes] = []
+        large_offsets: List[bytes] = []
+        for name in names:
+            offset = self._entries[name][0]
+            if offset < 0x80000000:
+                offsets.append(struct.pack(">I", offset))
+            else:
+                offsets.append(struct.pack(">I", 0x80000000 | len(large_offsets)))
+                large_offsets.append(struct.pack(">Q", offset))
+        index = b"".join(
+            [INDEX_SIGNATURE, struct.pack(">256I", *fanout), *names]
+            + [struct.pack(">I", self._entries[name][1]) for name in names]
+            + offsets
+            + large_offsets
+            + [checksum]
+        )
+        return index + hashlib.sha1(index).digest()
@@ -0,0 +1,377 @@
+"""Target patterns compiled to masks over the raw 20-byte digest.
+
+A pattern is a string of hex digits and `?` wildcards. Every place the
+pattern may sit in the digest becomes a `(mask, value)` pair of 160-bit
+integers, so checking a candidate does not hex-encode its digest. CONTAIN
+patterns, which have many places, are also compiled into one regular
+expression over the raw digest bytes; only plain hex CONTAIN patterns are
+searched for in the hex digest, which is faster.
+
+A `PatternSet` holds several acceptable patterns, checked in one pass.
+Searches that may settle for less than a match score candidates by how
+many characters of a pattern they match.
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from .args import HASH_LENGTH, MatchType
+
+WILDCARD = "?"
+DIGEST_SIZE = HASH_LENGTH // 2
+MAX_KEY_WIDTH = 3
+
+
+@dataclass(frozen=True)
+class HashPattern:
+    text: str
+    match_type: MatchType
+    masks: Tuple[Tuple[int, int], ...]
+
+    @classmethod
+    def compile(cls, text: str, match_type: MatchType) -> "HashPattern":
+        text = text.lower()
+        if not 0 < len(text) <= HASH_LENGTH:
+            raise ValueError(f"Pattern must be 1 to {HASH_LENGTH} characters long")
+        if match_type == MatchType.BEGIN:
+            offsets = range(1)
+        elif match_type == MatchType.END:
+            offsets = range(HASH_LENGTH - len(text), HASH_LENGTH - len(text) + 1)
+        else:
+            offsets = range(HASH_LENGTH - len(text) + 1)
+        return cls(text, match_type, tuple(_mask(text, offset) for offset in offsets))
+
+    @property
+    def fixed_digits(self) -> int:
+        """Number of hex digits that are not wildcards."""
+        return len(self.text) - self.text.count(WILDCARD)
+
+    def matcher(self) -> Callable[[bytes], bool]:
+        """Return a function telling whether a raw digest matches.
+
+        With a single place, the first byte the pattern covers is checked
+        before the whole mask, so most candidates are rejected by one small
+        integer compare. Several places are checked by one regular
+        expression over the raw bytes, with a branch per nibble alignment.
+        Plain hex patterns without wildcards are the exception: CPython's
+        substring search on the hex digest beats any check of the raw bytes
+        written in Python, as the `micro/matcher` benchmarks show. Patterns
+        with wildcards whose every alignment has a run of fixed bytes are
+        first searched for those runs alone: a regular expression of plain
+        bytes runs several times faster than one with byte classes.
+        """
+        if len(self.masks) > 1:
+            if WILDCARD not in self.text:
+                text = self.text
+                return lambda digest: text in digest.hex()
+            return contain_matcher(self.text)
+        ((mask, value),) = self.masks
+        ((start, byte_masks, byte_values),) = self.byte_masks()
+        if not byte_masks:
+            return lambda digest: True
+        first_mask, first_value = byte_masks[0], byte_values[0]
+        return (
+            lambda digest: digest[start] & first_mask == first_value
+            and int.from_bytes(digest, "big") & mask == value
+        )
+
+    def matches(self, digest: bytes) -> bool:
+        return self.matcher()(digest)
+
+    def matches_hex(self, commit_hash: str) -> bool:
+        return self.matches(bytes.fromhex(commit_hash))
+
+    def matched_length(self, digest: bytes) -> int:
+        """Number of characters of the pattern `digest` matches.
+
+        That is the longest matched prefix of the pattern for BEGIN, the
+        longest matched suffix for END and the longest substring found
+        anywhere in the hash for CONTAIN. Wildcards match any digit.
+        """
+        digits = [None if digit == WILDCARD else int(digit, 16) for digit in self.text]
+        if self.match_type == MatchType.BEGIN:
+            return _common_length(digits, digest, range(HASH_LENGTH))
+        if self.match_type == MatchType.END:
+            return _common_length(digits[::-1], digest, range(HASH_LENGTH - 1, -1, -1))
+        return max(
+            _common_length(digits[start:], digest, range(offset, HASH_LENGTH))
+            for start in range(len(digits))
+            for offset in range(HASH_LENGTH)
+        )
+
+    def byte_masks(self) -> List[Tuple[int, bytes, bytes]]:
+        """Return `(start, mask, value)` for each place, trimmed to the bytes
+        the place touches."""
+        places = []
+        for mask, value in self.masks:
+            mask_bytes = mask.to_bytes(DIGEST_SIZE, "big")
+            value_bytes = value.to_bytes(DIGEST_SIZE, "big")
+            start = len(mask_bytes) - len(mask_bytes.lstrip(b"\0"))
+            stop = len(mask_bytes.rstrip(b"\0"))
+            places.append((start, mask_bytes[start:stop], value_bytes[start:stop]))
+        return places
+
+
+def contain_matcher(text: str) -> Callable[[bytes], bool]:
+    """Return a function telling whether a raw digest contains `text`
+    anywhere, without hex-encoding it."""
+    search = _places_regex(text).search
+    runs = [
+        max(_fixed_runs(padded), key=len)
+        for padded in _alignments(text, MatchType.CONTAIN)
+    ]
+    if not all(runs):
+        return lambda digest: search(digest) is not None
+    prefilter = re.compile(b"|".join(re.escape(run) for run in runs)).search
+    return lambda digest: prefilter(digest) is not None and search(digest) is not None
+
+
+def _nibble(digest: bytes, position: int) -> int:
+    """The hex digit at `position` of the hash whose raw digest is `digest`."""
+    byte = digest[position >> 1]
+    return byte & 0xF if position & 1 else byte >> 4
+
+
+def _common_length(
+    digits: Sequence[Optional[int]], digest: bytes, positions: range
+) -> int:
+    """Length of the start of `digits`, None for wildcards, that the digits
+    of `digest` at `positions` match."""
+    for length, (digit, position) in enumerate(zip(digits, positions)):
+        if digit is not None and digit != _nibble(digest, position):
+            return length
+    return min(len(digits), len(positions))
+
+
+def _mask(text: str, offset: int) -> Tuple[int, int]:
+    mask = value = 0
+    for position, digit in enumerate(text, start=offset):
+        if digit == WILDCARD:
+            continue
+        shift = 4 * (HASH_LENGTH - 1 - position)
+        mask |= 0xF << shift
+        value |= int(digit, 16) << shift
+    return mask, value
+
+
+def _byte_class(high: str, low: str) -> bytes:
+    """Regular expression for one digest byte given its two pattern nibbles."""
+    highs = range(16) if high == WILDCARD else [int(high, 16)]
+    lows = range(16) if low == WILDCARD else [int(low, 16)]
+    if len(highs) == len(lows) == 16:
+        return b"."
+    members = b"".join(b"\\x%02x" % (h << 4 | lo) for h in highs for lo in lows)
+    return members if len(highs) == len(lows) == 1 else b"[" + members + b"]"
+
+
+def _aligned(text: str, padding: int) -> str:
+    """Pad `text` with wildcards to whole bytes, starting `padding` nibbles in."""
+    padded = WILDCARD * padding + text
+    return padded + WILDCARD * (len(padded) % 2)
+
+
+def _alignments(text: str, match_type: MatchType) -> List[str]:
+    """The byte-aligned forms `text` takes in the places it may sit."""
+    odd_end = (HASH_LENGTH - len(text)) % 2
+    if match_type == MatchType.BEGIN:
+        return [_aligned(text, 0)]
+    if match_type == MatchType.END:
+        return [_aligned(text, odd_end)]
+    return [
+        _aligned(text, padding)
+        for padding in range(min(2, HASH_LENGTH + 1 - len(text)))
+    ]
+
+
+def _places_regex(text: str) -> "re.Pattern[bytes]":
+    """Compile a regular expression matching `text` at any nibble offset.
+
+    A pattern at an odd offset starts in the low nibble of a byte, so it
+    gets a second branch padded with a leading wildcard.
+    """
+    branches = []
+    for padded in _alignments(text, MatchType.CONTAIN):
+        pairs = zip(padded[::2], padded[1::2])
+        branches.append(b"".join(_byte_class(high, low) for high, low in pairs))
+    return re.compile(b"|".join(branches), re.DOTALL)
+
+
+def _fixed_runs(padded: str) -> List[bytes]:
+    """Split a byte-aligned pattern into runs of bytes without wildcards."""
+    runs = [b""]
+    for offset in range(0, len(padded), 2):
+        pair = padded[offset : offset + 2]
+        if WILDCARD in pair:
+            runs.append(b"")
+        else:
+            runs[-1] += bytes.fromhex(pair)
+    return runs
+
+
+@dataclass(frozen=True)
+class PatternSet:
+    """Acceptable patterns sharing a match type; any one of them will do.
+
+    The patterns are indexed in a table keyed on digest bytes they fix:
+    the bytes at the anchor for BEGIN and END, a run of fixed bytes for
+    CONTAIN. A candidate is only checked against the patterns whose key it
+    contains, so most are rejected by one dict lookup per place. Sets with
+    too few fixed bytes to index fall back to a table on the anchor byte or
+    to one regular expression.
+    """
+
+    patterns: Tuple[HashPattern, ...]
+    match_type: MatchType
+
+    @classmethod
+    def compile(
+        cls, texts: Union[str, Iterable[str]], match_type: MatchType
+    ) -> "PatternSet":
+        if isinstance(texts, str):
+            texts = [texts]
+        unique = dict.fromkeys(text.lower() for text in texts)
+        if not unique:
+            raise ValueError("At least one pattern is required")
+        patterns = tuple(HashPattern.compile(text, match_type) for text in unique)
+        return cls(patterns, match_type)
+
+    def __len__(self) -> int:
+        return len(self.patterns)
+
+    def matcher(self) -> Callable[[bytes], bool]:
+        """Return a function telling whether a raw digest matches any pattern."""
+        if len(self.patterns) == 1:
+            return self.patterns[0].matcher()
+        keys = {pattern: self._keys(pattern) for pattern in self.patterns}
+        width = min(len(key) for pattern_keys in keys.values() for key in pattern_keys)
+        if self.match_type == MatchType.CONTAIN:
+            return self._window_matcher(keys) if width >= 2 else self._regex_matcher()
+        if width == 0:
+            return self._anchor_byte_matcher()
+
+        width = min(width, MAX_KEY_WIDTH)
+        table: Dict[bytes, List[Callable[[bytes], bool]]] = {}
+        for pattern, (key,) in keys.items():
+            key = key[len(key) - width :] if self.match_type == MatchType.END else key
+            table.setdefault(key[:width], []).append(pattern.matcher())
+        lookup = {key: tuple(matches) for key, matches in table.items()}.get
+        start = 0 if self.match_type == MatchType.BEGIN else DIGEST_SIZE - width
+        stop = start + width
+
+        def matches(digest: bytes) -> bool:
+            candidates = lookup(digest[start:stop])
+            return candidates is not None and any(match(digest) for match in candidates)
+
+        return matches
+
+    def _window_matcher(
+        self, keys: Dict[HashPattern, List[bytes]]
+    ) -> Callable[[bytes], bool]:
+        """Match CONTAIN patterns keyed on pairs of adjacent digest bytes.
+
+        The pairs of a digest are checked against all keys by one
+        `isdisjoint` call; only a shared pair leads to a full check.
+        """
+        table: Dict[Tuple[int, ...], List[Callable[[bytes], bool]]] = {}
+        for pattern, pattern_keys in keys.items():
+            match = pattern.matcher()
+            for key in dict.fromkeys(tuple(key[:2]) for key in pattern_keys):
+                table.setdefault(key, []).append(match)
+        lookup = {key: tuple(matches) for key, matches in table.items()}.get
+        pairs = frozenset(table)
+
+        def matches(digest: bytes) -> bool:
+            if pairs.isdisjoint(zip(digest, digest[1:])):
+                return False
+            return any(
+                match(digest)
+                for pair in zip(digest, digest[1:])
+                for match in lookup(pair, ())
+            )
+
+        return matches
+
+    def _regex_matcher(self) -> Callable[[bytes], bool]:
+        regex = b"|".join(_places_regex(p.text).pattern for p in self.patterns)
+        search = re.compile(regex, re.DOTALL).search
+        return lambda digest: search(digest) is not None
+
+    def _keys(self, pattern: HashPattern) -> List[bytes]:
+        """Bytes without wildcards that a matching digest must contain.
+
+        Anchored patterns are keyed on the fixed bytes at their anchor.
+        CONTAIN patterns are keyed on their longest run of fixed bytes in
+        each nibble alignment.
+        """
+        alignments = _alignments(pattern.text, self.match_type)
+        if self.match_type == MatchType.BEGIN:
+            return [_fixed_runs(alignments[0])[0]]
+        if self.match_type == MatchType.END:
+            return [_fixed_runs(alignments[0])[-1]]
+        return [max(_fixed_runs(padded), key=len) for padded in alignments]
+
+    def _anchor_byte_matcher(self) -> Callable[[bytes], bool]:
+        """Match against the patterns accepting the value of the anchor byte."""
+        index = 0 if self.match_type == MatchType.BEGIN else DIGEST_SIZE - 1
+        shift = 8 * (DIGEST_SIZE - 1 - index)
+        table: List[List[Callable[[bytes], bool]]] = [[] for _ in range(256)]
+        for pattern in self.patterns:
+            ((mask, value),) = pattern.masks
+            byte_mask, byte_value = (mask >> shift) & 0xFF, (value >> shift) & 0xFF
+            match = pattern.matcher()
+            for byte in range(256):
+                if byte & byte_mask == byte_value:
+                    table[byte].append(match)
+        candidates_by_byte = [tuple(candidates) for candidates in table]
+
+        def matches(digest: bytes) -> bool:
+            candidates = candidates_by_byte[digest[index]]
+            return bool(candidates) and any(match(digest) for match in candidates)
+
+        return matches
+
+    def matching(self, digest: bytes) -> Optional[HashPattern]:
+        """Return the first pattern matching `digest`, if any."""
+        for pattern in self.patterns:
+            if pattern.matches(digest):
+                return pattern
+        return None
+
+    def matches(self, digest: bytes) -> bool:
+        return self.matching(digest) is not None
+
+    def closest(self, digest: bytes) -> Tuple[HashPattern, int]:
+        """Return the pattern `digest` matches most characters of, and how many."""
+        return max(
+            ((pattern, pattern.matched_length(digest)) for pattern in self.patterns),
+            key=lambda scored: scored[1],
+        )
+
+    def closer_than(self, matched: int) -> "PatternSet":
+        """Return the patterns matching the digests that match more than
+        `matched` characters of one of these.
+
+        Each pattern is cut to its first `matched + 1` characters for BEGIN
+        and its last ones for END; for CONTAIN, each of its substrings of
+        that length becomes a pattern. Patterns no longer than that stay
+        whole.
+        """
+        length = matched + 1
+        texts: List[str] = []
+        for pattern in self.patterns:
+            text = pattern.text
+            if self.match_type == MatchType.BEGIN:
+                texts.append(text[:length])
+            elif self.match_type == MatchType.END:
+                texts.append(text[-length:])
+            else:
+                starts = range(max(1, len(text) - length + 1))
+                texts.extend(text[start : start + length] for start in starts)
+        return PatternSet.compile(texts, self.match_type)
+
+    def matches_hex(self, commit_hash: str) -> bool:
+        return self.matches(bytes.fromhex(commit_hash))
+
+    def byte_masks(self) -> List[Tuple[int, bytes, bytes]]:
+        return [place for pattern in self.patterns for place in pattern.byte_masks()]
@@ -0,0 +1,79 @@
+import logging
+from typing import Dict, Optional
+
+from .args import MatchType, NoncePlacement
+from .commit import FoundCommit, find_commit_content, resolve_context
+from .engine import WorkerPool
+from .git import (
+    CommitContext,
+    derive_commit_context,
+    list_commits,
+    read_commit,
+    update_head,
+)
+from .gitio import packed_writes
+
+
+def rewrite_history(
+    digits: int,
+    preserve_author: bool,
+    jobs: int = 1,
+    nonce_placement: Optional[NoncePlacement] = None,
+    pool: Optional[WorkerPool] = None,
+    quiet: bool = False,
+    context: Optional[CommitContext] = None,
+) -> Dict[str, FoundCommit]:
+    """Rewrite the current branch so that commit hashes begin with 0, 1, 2...
+
+    The history is walked once, parents before children, so each commit is
+    mined exactly once against its already rewritten parents, merges
+    included. The new commits are stored in one packfile and HEAD is moved
+    once at the end. Returns the new commits by old commit hash.
+
+    Unless `pool` is given, one pool of search processes serves all the
+    commits. The searches are short, so they keep no checkpoints and
+    solutions.
+    """
+    commits = list_commits()
+    if not commits:
+        raise RuntimeError("No commits to rewrite")
+    if len(commits) > 10**digits:
+        raise RuntimeError(
+            f"{len(commits)} commits do not fit in {digits}-digit sequence numbers"
+        )
+
+    context = resolve_context(
+        preserve_author=False, related_commit_hash=None, base=context
+    )
+    rewritten: Dict[str, FoundCommit] = {}
+    own_pool = None
+    if pool is None and jobs > 1:
+        pool = own_pool = WorkerPool(jobs)
+    try:
+        with packed_writes():
+            for number, old_hash in enumerate(commits):
+                commit = read_commit(old_hash)
+                parent_hashes = [
+                    rewritten[parent].commit_hash for parent in commit.parents
+                ]
+                desired_hash = f"{number:0{digits}d}"
+                logging.info(f"Rewriting {old_hash} as {desired_hash}")
+                rewritten[old_hash] = find_commit_content(
+                    desired_hash=desired_hash,
+                    message=commit.message,
+                    match_type=MatchType.BEGIN,
+                    tree_hash=commit.tree,
+                    parent_hashes=parent_hashes,
+                    context=derive_commit_context(context, commit, preserve_author),
+                    jobs=jobs,
+                    nonce_placement=nonce_placement,
+                    pool=pool,
+                    quiet=quiet,
+                    remember=False,
+                )
+    finally:
+        if own_pool is not None:
+            own_pool.close()
+
+    update_head(rewritten[commits[-1]].commit_hash, "hashcommit: rewrite history")
+    return rewritten
@@ -0,0 +1,97 @@
+import itertools
+import subprocess
+from dataclasses import dataclass
+from typing import Callable, Optional, Tuple
+
+from .engine import (
+    DENSE_ALPHABET,
+    DENSE_WIDTH,
+    CommitTemplate,
+    CounterNonce,
+    SearchJob,
+    SearchResult,
+    hash_commit_object,
+)
+
+ARMOR_COMMENT = b"Comment: "
+
+
+@dataclass(frozen=True)
+class SigningConfig:
+    """How git would sign commits in this repository."""
+
+    format: str
+    program: str
+    key: str
+
+    @property
+    def in_process(self) -> bool:
+        """Whether candidates can be signed without `git commit-tree -S`."""
+        return self.format in ("openpgp", "x509")
+
+    @property
+    def has_armor_headers(self) -> bool:
+        """Whether signatures are ASCII armored with room for armor headers."""
+        return self.format == "openpgp"
+
+
+def sign_payload(payload: bytes, signing: SigningConfig) -> bytes:
+    """Return an armored detached signature, as git's `sign_buffer` does."""
+    result = subprocess.run(
+        [signing.program, "--status-fd=2", "-bsau", signing.key],
+        input=payload,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    if result.returncode != 0 or b"[GNUPG:] SIG_CREATED " not in result.stderr:
+        raise RuntimeError(
+            f"gpg failed to sign the data: {result.stderr.decode().strip()}"
+        )
+    return result.stdout
+
+
+def add_signature(body: bytes, signature: bytes) -> bytes:
+    """Insert a `gpgsig` header into a commit body."""
+    headers, _, message = body.partition(b"\n\n")
+    lines = signature.rstrip(b"\n").split(b"\n")
+    return headers + b"\ngpgsig " + b"\n ".join(lines) + b"\n\n" + message
+
+
+def signature_template(
+    payload: bytes, signature: bytes
+) -> Tuple[CommitTemplate, CounterNonce]:
+    """Template whose nonce is a `Comment:` armor header of `signature`.
+
+    Verification ignores armor headers, so one signature of `payload` stays
+    valid for every candidate.
+    """
+    headers, _, message = add_signature(payload, signature).partition(b"\n\n")
+    begin, _, rest = headers.partition(b"-----BEGIN PGP SIGNATURE-----\n")
+    if not rest:
+        raise RuntimeError("The signature is not an ASCII-armored PGP signature")
+    nonces = CounterNonce(DENSE_ALPHABET, DENSE_WIDTH)
+    head = begin + b"-----BEGIN PGP SIGNATURE-----\n " + ARMOR_COMMENT
+    tail = b"\n" + rest + b"\n\n" + message
+    return CommitTemplate(head, tail, nonces.width), nonces
+
+
+def search_signed(
+    job: SearchJob,
+    signing: SigningConfig,
+    progress: Optional[Callable[[int], None]] = None,
+) -> Tuple[SearchResult, bytes]:
+    """Sign candidates one by one until a signed commit hash matches.
+
+    Returns the search result and the body of the signed winning commit.
+    """
+    match = job.pattern.matcher()
+    for index in itertools.count():
+        nonce = job.nonces.nonce(index)
+        payload = job.template.body(nonce)
+        body = add_signature(payload, sign_payload(payload, signing))
+        commit_hash = hash_commit_object(body)
+        if match(bytes.fromhex(commit_hash)):
+            return SearchResult(index, nonce, commit_hash, index + 1), body
+        if progress:
+            progress(index + 1)
+    raise AssertionError("unreachable")
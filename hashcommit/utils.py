@@ -3,11 +3,15 @@ from typing import Dict, List, Optional
 
 
 def run_subprocess(
-    args: List[str], env: Optional[Dict] = None, check: bool = True
+    args: List[str],
+    env: Optional[Dict] = None,
+    check: bool = True,
+    input: Optional[bytes] = None,
 ) -> subprocess.CompletedProcess:
     return subprocess.run(
         args,
         env=env,
+        input=input,
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
         check=check,
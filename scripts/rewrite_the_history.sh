@@ -29,19 +29,4 @@ done
 
 shift $((OPTIND -1))
 
-format="%0${digits}g"
-
-current_branch_name=$(git rev-parse --abbrev-ref HEAD)
-commits=$(git rev-list --count HEAD)
-
-for i in $(seq -f "$format" 0 $((commits - 1)))
-do
-    hash=$(git rev-list --reverse HEAD | sed -n $((10#$i + 1))p)
-    command="hashcommit --overwrite --hash $i --commit $hash -vv"
-    echo "\$ $command"
-    time eval $command
-done
-
-current_head=$(git rev-parse HEAD)
-git branch $current_branch_name $current_head --force
-git checkout $current_branch_name
+exec hashcommit rewrite --digits "$digits"
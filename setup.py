@@ -11,6 +11,9 @@ setup(
         ],
     },
     install_requires=[],
+    extras_require={
+        'numpy': ['numpy'],
+    },
     author='Bartosz Woźniak',
     author_email='bwozniakdev@protonmail.com',
     description='A tool to generate a Git commit with a specific hash part.',
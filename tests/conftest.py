@@ -1,3 +1,6 @@
+import shutil
+import subprocess
+import tempfile
 from pathlib import Path
 from typing import Generator
 
@@ -24,3 +27,28 @@ def initialized_git_repo(empty_git_repo: Path) -> Generator[Path, None, None]:
     assert not result.stderr, result.stderr
     assert run_git_command(["log"], cwd=empty_git_repo).stdout
     yield empty_git_repo
+
+
+@pytest.fixture
+def signed_git_repo(
+    initialized_git_repo: Path, monkeypatch: pytest.MonkeyPatch
+) -> Generator[Path, None, None]:
+    """Fixture to create a git repository that signs commits with a new GPG key."""
+    if shutil.which("gpg") is None:
+        pytest.skip("gpg is not installed")
+    # gpg-agent sockets live in GNUPGHOME, whose path length is limited.
+    gnupg_home = tempfile.mkdtemp(prefix="gpg")
+    monkeypatch.setenv("GNUPGHOME", gnupg_home)
+    subprocess.run(
+        ["gpg", "--batch", "--passphrase", "", "--quick-gen-key"]
+        + ["Test User <test@user.com>", "ed25519", "sign", "never"],
+        capture_output=True,
+        check=True,
+    )
+    run_git_command(["config", "commit.gpgSign", "true"], cwd=initialized_git_repo)
+    run_git_command(
+        ["config", "user.signingkey", "test@user.com"], cwd=initialized_git_repo
+    )
+    yield initialized_git_repo
+    subprocess.run(["gpgconf", "--kill", "gpg-agent"], capture_output=True)
+    shutil.rmtree(gnupg_home, ignore_errors=True)
@@ -0,0 +1,107 @@
+import asyncio
+from pathlib import Path
+
+import pytest
+from utils import create_merge_history, get_git_log, get_history, run_git_command
+
+from hashcommit import AsyncHashCommitSession
+
+
+def count_objects(repo: Path) -> str:
+    return str(run_git_command(["count-objects", "-v"], cwd=repo).stdout.decode())
+
+
+def test_creating_and_amending_commits(
+    initialized_git_repo: Path, capfd: pytest.CaptureFixture
+) -> None:
+    async def work() -> None:
+        async with AsyncHashCommitSession(initialized_git_repo, jobs=1) as session:
+            created = await session.create("00", "created")
+            assert created.commit_hash.startswith("00")
+            assert created.attempts > 0
+            amended = await session.amend("11", message="amended")
+            assert amended.commit_hash.startswith("11")
+
+    asyncio.run(work())
+
+    log = get_git_log(initialized_git_repo)
+    assert log[0].hash.startswith("11")
+    assert [commit.message for commit in log] == ["amended\n", "Initial commit\n"]
+    assert capfd.readouterr() == ("", "")
+
+
+def test_creating_commits_with_empty_messages(initialized_git_repo: Path) -> None:
+    async def work() -> str:
+        async with AsyncHashCommitSession(initialized_git_repo, jobs=1) as session:
+            found = await session.create("0", "")
+        return found.commit_hash
+
+    commit_hash = asyncio.run(work())
+
+    assert get_git_log(initialized_git_repo)[0].hash == commit_hash
+
+
+def test_overwriting_past_commits(initialized_git_repo: Path) -> None:
+    create_merge_history(initialized_git_repo)
+    history = get_history(initialized_git_repo)
+
+    async def work() -> str:
+        async with AsyncHashCommitSession(initialized_git_repo, jobs=2) as session:
+            found = await session.amend("0", commit="HEAD~1", message="renamed")
+        return found.commit_hash
+
+    commit_hash = asyncio.run(work())
+
+    assert get_git_log(initialized_git_repo)[1].hash == commit_hash
+    assert commit_hash.startswith("0")
+    assert get_history(initialized_git_repo) == {
+        "merge": ["renamed", "side"],
+        "renamed": history["main"],
+        "side": history["side"],
+        "Initial commit": [],
+    }
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_cancelling_a_search(initialized_git_repo: Path, jobs: int) -> None:
+    head = get_git_log(initialized_git_repo)[0].hash
+    objects = count_objects(initialized_git_repo)
+    refs = run_git_command(["for-each-ref"], cwd=initialized_git_repo).stdout
+
+    async def work() -> None:
+        async with AsyncHashCommitSession(initialized_git_repo, jobs=jobs) as session:
+            task = asyncio.ensure_future(session.create("0" * 16, "never"))
+            # The event loop keeps running during the search.
+            await asyncio.sleep(0.25)
+            assert not task.done()
+            task.cancel()
+            # Awaiting the task waits for the search thread to stop.
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            assert task.cancelled()
+            if session._pool is not None:
+                # The search processes were told to give up their chunks.
+                assert session._pool.best.value == -1
+            assert get_git_log(initialized_git_repo)[0].hash == head
+            assert count_objects(initialized_git_repo) == objects
+            assert (
+                run_git_command(["for-each-ref"], cwd=initialized_git_repo).stdout
+                == refs
+            )
+
+            found = await session.create("0", "after")
+            assert found.commit_hash.startswith("0")
+
+    asyncio.run(work())
+    log = get_git_log(initialized_git_repo)
+    assert [commit.message for commit in log] == ["after\n", "Initial commit\n"]
+    assert log[1].hash == head
+
+
+def test_not_a_repository(tmp_path: Path) -> None:
+    async def work() -> None:
+        async with AsyncHashCommitSession(tmp_path):
+            pass
+
+    with pytest.raises(RuntimeError, match="Not a git repository"):
+        asyncio.run(work())
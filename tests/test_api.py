@@ -0,0 +1,82 @@
+import os
+from pathlib import Path
+
+import pytest
+from utils import configure_git, create_merge_history, get_git_log, get_history
+
+from hashcommit import HashCommitSession
+
+
+def test_creating_commits_returns_results(
+    empty_git_repo: Path, capfd: pytest.CaptureFixture
+) -> None:
+    configure_git(empty_git_repo, "Test User", "test@user.com")
+
+    with HashCommitSession(empty_git_repo, jobs=1) as session:
+        first = session.create("00", "first")
+        second = session.create(["11", "22"], "second")
+
+    log = get_git_log(empty_git_repo)
+    assert [commit.hash for commit in log] == [second.commit_hash, first.commit_hash]
+    assert first.commit_hash.startswith("00")
+    assert second.commit_hash[:2] in ("11", "22")
+    assert [commit.message for commit in log] == ["second\n", "first\n"]
+    assert first.attempts > 0 and first.elapsed >= 0
+    assert capfd.readouterr() == ("", "")
+
+
+def test_creating_commits_with_empty_messages(initialized_git_repo: Path) -> None:
+    with HashCommitSession(initialized_git_repo, jobs=1) as session:
+        found = session.create("0", "")
+
+    log = get_git_log(initialized_git_repo)
+    assert log[0].hash == found.commit_hash
+    assert log[0].message == ""
+
+
+def test_amending_commits(initialized_git_repo: Path) -> None:
+    create_merge_history(initialized_git_repo)
+    history = get_history(initialized_git_repo)
+
+    with HashCommitSession(initialized_git_repo, jobs=2) as session:
+        last = session.amend("0", message="merged")
+        main = session.amend("1", commit="HEAD~1")
+
+    log = get_git_log(initialized_git_repo)
+    assert log[0].message == "merged\n"
+    assert log[1].hash == main.commit_hash
+    assert main.commit_hash.startswith("1")
+    assert last.commit_hash.startswith("0")
+    assert get_history(initialized_git_repo) == {
+        "merged" if subject == "merge" else subject: parents
+        for subject, parents in history.items()
+    }
+
+
+def test_one_pool_serves_every_search(initialized_git_repo: Path) -> None:
+    with HashCommitSession(initialized_git_repo, jobs=2) as session:
+        session.create("0", "commit 0")
+        processes = set(session._pool.executor._processes)  # type: ignore
+        for number in range(1, 3):
+            session.create(f"{number}", f"commit {number}")
+        assert set(session._pool.executor._processes) == processes  # type: ignore
+
+        result = session.rewrite(digits=1)
+
+    log = get_git_log(initialized_git_repo)
+    assert [commit.hash[0] for commit in reversed(log)] == ["0", "1", "2", "3"]
+    assert sorted(result.commits.values()) == sorted(commit.hash for commit in log)
+    assert result.attempts >= len(log)
+
+
+def test_sessions_run_in_their_own_repository(
+    initialized_git_repo: Path, tmp_path: Path
+) -> None:
+    directory = os.getcwd()
+    with HashCommitSession(initialized_git_repo, jobs=1) as session:
+        found = session.create("0", "test")
+    assert os.getcwd() == directory
+    assert get_git_log(initialized_git_repo)[0].hash == found.commit_hash
+
+    with pytest.raises(RuntimeError, match="Not a git repository"):
+        HashCommitSession(tmp_path)
@@ -1,5 +1,6 @@
 from utils import run_hashcommit_command
 
+from hashcommit.args import MatchType, NoncePlacement, parse_args
 from hashcommit.version import VERSION
 
 
@@ -18,3 +19,18 @@ def test_version() -> None:
     stdout = result.stdout.decode().strip()
     assert stdout.startswith("hashcommit ")
     assert stdout.endswith(VERSION)
+
+
+def test_options_before_the_subcommand_are_kept() -> None:
+    args = parse_args(["-vv", "--jobs", "3", "--gc", "--nonce", "trailer", "rewrite"])
+    assert (args.verbose, args.jobs, args.gc) == (2, 3, True)
+    assert args.nonce == NoncePlacement.TRAILER
+
+    args = parse_args(["--hash", "ab", "--message", "x", "coordinator", "-v"])
+    assert (args.hash, args.message, args.verbose) == (["ab"], "x", 1)
+    assert args.match_type == MatchType.BEGIN
+
+
+def test_options_after_the_subcommand() -> None:
+    args = parse_args(["rewrite", "-j", "2", "--no-preserve-author"])
+    assert (args.jobs, args.no_preserve_author, args.verbose) == (2, True, 0)
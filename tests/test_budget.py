@@ -0,0 +1,86 @@
+import re
+from pathlib import Path
+
+import pytest
+from utils import get_git_log, run_hashcommit_command
+
+from hashcommit.args import MatchType
+from hashcommit.pattern import HashPattern
+
+TARGET = "c0ffee4242c0ffee"
+
+
+@pytest.mark.parametrize("match_type", list(MatchType))
+def test_committing_the_closest_candidate(
+    initialized_git_repo: Path, match_type: MatchType
+) -> None:
+    result = run_hashcommit_command(
+        [
+            *("--hash", TARGET, "--message", "closest"),
+            *("--match-type", match_type.value, "--max-attempts", "20000"),
+        ],
+        cwd=initialized_git_repo,
+    )
+
+    head = get_git_log(initialized_git_repo)[0]
+    assert head.message == "closest\n"
+    stdout = result.stdout.decode()
+    assert f"closest commit hash: {head.hash}\n" in stdout
+    report = re.search(rf"Matched (\d+) of 16 characters of {TARGET}", stdout)
+    assert report is not None
+    matched = int(report.group(1))
+    pattern = HashPattern.compile(TARGET, match_type)
+    assert pattern.matched_length(bytes.fromhex(head.hash)) == matched > 0
+
+
+def test_committing_the_closest_candidate_leaves_no_checkpoint(
+    initialized_git_repo: Path,
+) -> None:
+    run_hashcommit_command(
+        ["--hash", TARGET, "--message", "closest", "--max-attempts", "20000"],
+        cwd=initialized_git_repo,
+    )
+
+    state = initialized_git_repo / ".git" / "hashcommit"
+    assert not list(state.glob("checkpoints/*.json"))
+
+
+def test_exact_matches_within_the_budget(initialized_git_repo: Path) -> None:
+    result = run_hashcommit_command(
+        ["--hash", "0", "--message", "exact", "--time-budget", "60"],
+        cwd=initialized_git_repo,
+    )
+
+    head = get_git_log(initialized_git_repo)[0]
+    assert head.hash.startswith("0")
+    assert result.stdout.decode() == f"Found matching commit hash: {head.hash}\n"
+
+
+def test_strict_budgets_leave_the_repository_alone(
+    initialized_git_repo: Path,
+) -> None:
+    args = ["--hash", TARGET, "--overwrite", "--max-attempts", "20000", "--strict"]
+    before = get_git_log(initialized_git_repo)
+
+    result = run_hashcommit_command(
+        args + ["-j", "1"], cwd=initialized_git_repo, expected_returncode=2
+    )
+
+    assert "No match within the search budget" in result.stderr.decode()
+    assert get_git_log(initialized_git_repo) == before
+    # The next search carries on after the candidates already tried.
+    result = run_hashcommit_command(
+        args + ["-j", "1"], cwd=initialized_git_repo, expected_returncode=2
+    )
+    resumed = re.match(r"Resuming the search after ([\d,]+)", result.stdout.decode())
+    assert resumed is not None
+    assert int(resumed.group(1).replace(",", "")) >= 20000
+
+
+def test_strict_needs_a_budget(initialized_git_repo: Path) -> None:
+    result = run_hashcommit_command(
+        ["--hash", "0", "--message", "test", "--strict"],
+        cwd=initialized_git_repo,
+        expected_returncode=1,
+    )
+    assert "--strict requires" in result.stderr.decode()
@@ -0,0 +1,84 @@
+import json
+from pathlib import Path
+
+import pytest
+from utils import get_git_log, run_git_command, run_hashcommit_command
+
+from hashcommit import cache
+from hashcommit.cache import Solution, load_solution, store_solution
+
+OVERWRITE = ["--overwrite", "--hash", "0000", "-j", "1"]
+
+
+def solutions_file(repo: Path) -> Path:
+    return repo / ".git" / "hashcommit" / "solutions.json"
+
+
+def test_repeated_search_reuses_the_solution(initialized_git_repo: Path) -> None:
+    first = run_hashcommit_command(OVERWRITE, cwd=initialized_git_repo)
+    found = get_git_log(initialized_git_repo)[0].hash
+    run_git_command(["reset", "-q", "--hard", "HEAD@{1}"], cwd=initialized_git_repo)
+
+    second = run_hashcommit_command(OVERWRITE, cwd=initialized_git_repo)
+
+    assert first.stdout.decode().startswith(f"Found matching commit hash: {found}\n")
+    assert second.stdout.decode().startswith(
+        "Reusing the solution of an earlier search\n"
+        f"Found matching commit hash: {found}\n"
+    )
+    assert get_git_log(initialized_git_repo)[0].hash == found
+
+
+def test_solutions_are_not_reused_for_another_author_date(
+    initialized_git_repo: Path,
+) -> None:
+    run_hashcommit_command(OVERWRITE, cwd=initialized_git_repo)
+    run_git_command(["reset", "-q", "--hard", "HEAD@{1}"], cwd=initialized_git_repo)
+    date = "1700000000 +0100"
+    run_git_command(
+        ["commit", "-q", "--amend", "--allow-empty", "--no-edit", f"--date={date}"],
+        cwd=initialized_git_repo,
+    )
+
+    result = run_hashcommit_command(OVERWRITE, cwd=initialized_git_repo)
+
+    assert "Reusing" not in result.stdout.decode()
+    author_date = run_git_command(
+        ["show", "-s", "--format=%ad", "--date=raw"], cwd=initialized_git_repo
+    )
+    assert author_date.stdout.decode().strip() == date
+
+
+def test_corrupt_solution_is_not_trusted(initialized_git_repo: Path) -> None:
+    run_hashcommit_command(OVERWRITE, cwd=initialized_git_repo)
+    run_git_command(["reset", "-q", "--hard", "HEAD@{1}"], cwd=initialized_git_repo)
+    path = solutions_file(initialized_git_repo)
+    solutions = json.loads(path.read_text())
+    for solution in solutions.values():
+        solution["nonce_index"] += 1
+    path.write_text(json.dumps(solutions))
+
+    result = run_hashcommit_command(OVERWRITE, cwd=initialized_git_repo)
+
+    assert "Reusing" not in result.stdout.decode()
+    assert "Ignoring a cached solution" in result.stderr.decode()
+    assert get_git_log(initialized_git_repo)[0].hash.startswith("0000")
+
+
+def test_least_recently_used_solutions_are_evicted(
+    initialized_git_repo: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.chdir(initialized_git_repo)
+    monkeypatch.setattr(cache, "SOLUTION_CACHE_SIZE", 2)
+    solution = Solution("2024-01-01T00:00:00", "A <a@a> 0 +0000", None, 0, "0" * 40)
+
+    store_solution("first", solution)
+    store_solution("second", solution)
+    assert load_solution("first") == solution
+    store_solution("third", solution)
+
+    assert list(json.loads(solutions_file(initialized_git_repo).read_text())) == [
+        "first",
+        "third",
+    ]
+    assert load_solution("second") is None
@@ -0,0 +1,79 @@
+import json
+import signal
+import subprocess
+import time
+from pathlib import Path
+from typing import List
+
+import pytest
+from utils import get_git_log
+
+from hashcommit.checkpoint import Checkpoint, Checkpointer, load_checkpoint
+
+HARD_SEARCH = ["hashcommit", "--hash", "0" * 12, "--message", "test", "-j", "1"]
+
+
+def interrupt_search(cwd: Path, signum: int) -> subprocess.CompletedProcess:
+    process = subprocess.Popen(
+        HARD_SEARCH, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    time.sleep(2)
+    process.send_signal(signum)
+    stdout, stderr = process.communicate(timeout=30)
+    return subprocess.CompletedProcess(HARD_SEARCH, process.returncode, stdout, stderr)
+
+
+def read_checkpoints(repo: Path) -> List[dict]:
+    directory = repo / ".git" / "hashcommit" / "checkpoints"
+    return [json.loads(path.read_text()) for path in directory.glob("*.json")]
+
+
+@pytest.mark.parametrize(
+    "signum, returncode", [(signal.SIGINT, 3), (signal.SIGTERM, 128 + signal.SIGTERM)]
+)
+def test_interrupted_search_saves_a_checkpoint(
+    initialized_git_repo: Path, signum: int, returncode: int
+) -> None:
+    result = interrupt_search(initialized_git_repo, signum)
+
+    assert result.returncode == returncode
+    (checkpoint,) = read_checkpoints(initialized_git_repo)
+    assert checkpoint["completed"] > 0
+    assert len(get_git_log(initialized_git_repo)) == 1
+
+
+def test_resuming_an_interrupted_search(initialized_git_repo: Path) -> None:
+    interrupt_search(initialized_git_repo, signal.SIGINT)
+    (first,) = read_checkpoints(initialized_git_repo)
+
+    result = interrupt_search(initialized_git_repo, signal.SIGINT)
+
+    stdout = result.stdout.decode()
+    assert stdout.startswith(f"Resuming the search after {first['completed']:,}")
+    (second,) = read_checkpoints(initialized_git_repo)
+    assert second["completed"] > first["completed"]
+    assert {**second, "completed": 0} == {**first, "completed": 0}
+
+
+def test_every_save_records_the_searched_prefix(
+    initialized_git_repo: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.chdir(initialized_git_repo)
+    checkpoint = Checkpoint(
+        key="0" * 40,
+        template="1" * 40,
+        timestamp="2024-05-23T17:06:24",
+        author="A <a@b> 1716476784 +0200",
+        signature=None,
+        completed=100,
+    )
+    checkpointer = Checkpointer(checkpoint, interval=0)
+    saved = []
+
+    for attempts in (1000, 2000, 3000):
+        checkpointer(attempts)
+        loaded = load_checkpoint(checkpoint.key)
+        assert loaded is not None
+        saved.append(loaded.completed)
+
+    assert saved == [1100, 2100, 3100]
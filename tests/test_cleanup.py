@@ -28,3 +28,26 @@ def test_not_leaving_unreachable_commits(empty_git_repo: Path) -> None:
         cwd=empty_git_repo,
     )
     assert not get_unreachable_commits(empty_git_repo)
+
+
+def count_loose_objects(repo: Path) -> int:
+    result = run_git_command(["count-objects"], cwd=repo)
+    return int(result.stdout.decode().split()[0])
+
+
+def test_writing_only_the_winning_commit(initialized_git_repo: Path) -> None:
+    loose_objects = count_loose_objects(initialized_git_repo)
+
+    run_hashcommit_command(
+        ["--message", "f00", "--hash", "000"],
+        cwd=initialized_git_repo,
+    )
+    assert count_loose_objects(initialized_git_repo) == loose_objects + 1
+
+
+def test_running_garbage_collection_on_request(initialized_git_repo: Path) -> None:
+    run_hashcommit_command(
+        ["--message", "f00", "--hash", "a", "--gc"],
+        cwd=initialized_git_repo,
+    )
+    assert count_loose_objects(initialized_git_repo) == 0
@@ -0,0 +1,190 @@
+import json
+import os
+import signal
+import socket
+import subprocess
+import time
+from pathlib import Path
+from typing import Dict, Generator, Tuple
+
+import pytest
+from utils import get_git_log, run_hashcommit_command
+
+Daemon = Tuple[Dict[str, str], Path]
+
+
+@pytest.fixture
+def daemon(tmp_path: Path) -> Generator[Daemon, None, None]:
+    """A daemon serving on a socket of its own, and the clients' environment."""
+    path = tmp_path / "hashcommit.sock"
+    env = dict(os.environ, HASHCOMMIT_SOCKET=str(path))
+    log = tmp_path / "daemon.log"
+    with log.open("w") as stderr:
+        process = subprocess.Popen(
+            ["hashcommit", "serve", "-j", "2", "-v"],
+            cwd=tmp_path,
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=stderr,
+            text=True,
+        )
+    assert process.stdout is not None
+    assert process.stdout.readline() == f"Serving on {path}\n"
+    yield env, log
+    process.send_signal(signal.SIGINT)
+    assert process.wait(timeout=30) == 0
+    assert not path.exists()
+
+
+def test_commands_run_in_the_daemon(daemon: Daemon, initialized_git_repo: Path) -> None:
+    env, log = daemon
+    result = run_hashcommit_command(
+        ["--hash", "00", "--message", "served"], env=env, cwd=initialized_git_repo
+    )
+
+    head = get_git_log(initialized_git_repo)[0]
+    assert head.hash.startswith("00")
+    assert head.message == "served\n"
+    assert result.stdout.decode() == f"Found matching commit hash: {head.hash}\n"
+    assert "Running" in log.read_text()
+
+    run_hashcommit_command(
+        ["--hash", "11", "--overwrite", "-j", "1"], env=env, cwd=initialized_git_repo
+    )
+    assert get_git_log(initialized_git_repo)[0].hash.startswith("11")
+    assert log.read_text().count("Running") == 2
+
+
+def test_commands_choose_their_number_of_jobs(
+    daemon: Daemon, initialized_git_repo: Path
+) -> None:
+    env, _ = daemon
+    result = run_hashcommit_command(
+        ["--hash", "00", "--message", "default", "-v"],
+        env=env,
+        cwd=initialized_git_repo,
+    )
+    assert "instead of 2" not in result.stderr.decode()
+
+    result = run_hashcommit_command(
+        ["--hash", "00", "--message", "three jobs", "-v", "-j", "3"],
+        env=env,
+        cwd=initialized_git_repo,
+    )
+    assert "Searching with 3 job(s) instead of 2" in result.stderr.decode()
+    head = get_git_log(initialized_git_repo)[0]
+    assert head.hash.startswith("00")
+    assert head.message == "three jobs\n"
+
+
+def test_errors_are_reported_to_the_client(daemon: Daemon, tmp_path: Path) -> None:
+    env, log = daemon
+    directory = tmp_path / "not-a-repo"
+    directory.mkdir()
+    result = run_hashcommit_command(
+        ["--hash", "00", "--message", "test"],
+        env=env,
+        cwd=directory,
+        expected_returncode=1,
+    )
+    assert "fatal" in result.stderr.decode()
+    assert "Running" in log.read_text()
+
+
+def test_failures_in_the_command_are_reported_to_the_client(
+    daemon: Daemon, initialized_git_repo: Path
+) -> None:
+    env, log = daemon
+    result = subprocess.run(
+        ["hashcommit", "--hash", "0", "--overwrite", "--commit", "nonexistent"],
+        capture_output=True,
+        env=env,
+        cwd=initialized_git_repo,
+        timeout=30,
+    )
+    assert result.returncode == 2
+    assert "Error: Not a commit: nonexistent" in result.stderr.decode()
+    assert "The command failed" in log.read_text()
+
+    # The daemon serves the next client.
+    run_hashcommit_command(
+        ["--hash", "0", "--message", "after"], env=env, cwd=initialized_git_repo
+    )
+    assert get_git_log(initialized_git_repo)[0].message == "after\n"
+
+
+def test_clients_that_go_away_interrupt_their_search(
+    daemon: Daemon, initialized_git_repo: Path
+) -> None:
+    env, _ = daemon
+    client = subprocess.Popen(
+        ["hashcommit", "--hash", "0" * 12, "--message", "test", "-j", "1"],
+        cwd=initialized_git_repo,
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    time.sleep(2)
+    client.kill()
+    client.wait()
+
+    directory = initialized_git_repo / ".git" / "hashcommit" / "checkpoints"
+    deadline = time.monotonic() + 30
+    while not list(directory.glob("*.json")) and time.monotonic() < deadline:
+        time.sleep(0.1)
+    (path,) = directory.glob("*.json")
+    assert json.loads(path.read_text())["completed"] > 0
+
+    # The daemon serves the next client, with its own output.
+    result = run_hashcommit_command(
+        ["--hash", "0", "--message", "after"], env=env, cwd=initialized_git_repo
+    )
+    head = get_git_log(initialized_git_repo)[0]
+    assert head.message == "after\n"
+    assert result.stdout.decode() == f"Found matching commit hash: {head.hash}\n"
+
+
+def test_only_one_daemon_serves_a_socket(daemon: Daemon) -> None:
+    env, _ = daemon
+    result = run_hashcommit_command(["serve"], env=env, expected_returncode=2)
+    assert "already serving" in result.stderr.decode()
+
+
+def test_commands_run_in_process_without_a_daemon(
+    initialized_git_repo: Path, tmp_path: Path
+) -> None:
+    # A socket left behind by a daemon that is gone.
+    path = tmp_path / "stale.sock"
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(str(path))
+    stale.close()
+
+    env = dict(os.environ, HASHCOMMIT_SOCKET=str(path))
+    run_hashcommit_command(
+        ["--hash", "0", "--message", "in-process"], env=env, cwd=initialized_git_repo
+    )
+    assert get_git_log(initialized_git_repo)[0].hash.startswith("0")
+
+
+def test_sockets_of_other_users_are_not_trusted(
+    initialized_git_repo: Path, tmp_path: Path
+) -> None:
+    path = tmp_path / "shared.sock"
+    impostor = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    impostor.bind(str(path))
+    impostor.listen()
+    path.chmod(0o666)
+
+    env = dict(os.environ, HASHCOMMIT_SOCKET=str(path))
+    with impostor:
+        result = run_hashcommit_command(
+            ["--hash", "0", "--message", "in-process"],
+            env=env,
+            cwd=initialized_git_repo,
+        )
+        impostor.setblocking(False)
+        with pytest.raises(BlockingIOError):
+            impostor.accept()
+
+    assert "not private to this user" in result.stderr.decode()
+    assert get_git_log(initialized_git_repo)[0].hash.startswith("0")
@@ -0,0 +1,145 @@
+import socket
+import subprocess
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Generator, Tuple
+
+import pytest
+from utils import get_git_log, run_hashcommit_command
+
+from hashcommit.args import DEFAULT_PORT, MatchType, NoncePlacement, address
+from hashcommit.distributed import Connection, Coordinator, RangeAllocator
+from hashcommit.engine import SearchJob, nonce_template
+from hashcommit.pattern import PatternSet
+
+
+def test_workers_find_the_commit(initialized_git_repo: Path, tmp_path: Path) -> None:
+    coordinator = subprocess.Popen(
+        ["hashcommit", "coordinator", "--listen", "127.0.0.1:0"]
+        + ["--hash", "000", "--message", "distributed"],
+        cwd=initialized_git_repo,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    assert coordinator.stdout is not None
+    waiting = coordinator.stdout.readline()
+    address = waiting.rsplit(" ", 1)[1].strip()
+
+    # Workers need no repository.
+    workers = [
+        subprocess.Popen(
+            ["hashcommit", "worker", address, "-j", jobs],
+            cwd=tmp_path,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        for jobs in ("1", "2")
+    ]
+    stdout, stderr = coordinator.communicate(timeout=60)
+    for worker in workers:
+        worker.communicate(timeout=60)
+        assert worker.returncode == 0
+
+    assert coordinator.returncode == 0, stderr
+    head = get_git_log(initialized_git_repo)[0]
+    assert stdout == f"Found matching commit hash: {head.hash}\n"
+    assert head.hash.startswith("000")
+    assert head.message == "distributed\n"
+
+
+def test_ranges_of_lost_workers_are_handed_out_again() -> None:
+    ranges = RangeAllocator()
+    first, second = ranges.assign(10), ranges.assign(10)
+    assert (first, second) == ((0, 10), (10, 20))
+
+    ranges.release((0, 10))
+    assert ranges.assign(5) == (0, 10)
+    assert ranges.assign(5) == (20, 25)
+
+    ranges.complete(10, None)
+    ranges.complete(5, 22)
+    assert ranges.attempts == 15
+    assert ranges.match == 22
+    assert ranges.assign(10) is None
+
+
+@pytest.fixture
+def coordinator() -> Generator[Coordinator, None, None]:
+    template, nonces = nonce_template(
+        placement=NoncePlacement.HEADER,
+        tree_hash="4b825dc642cb6eb9a060e54bf8d69288fbbfecd9",
+        parent_hashes=[],
+        author="Author <author@user.com> 1700000000 +0000",
+        committer="Committer <committer@user.com>",
+        message="test",
+        encoding=None,
+        start=datetime(2024, 1, 1),
+    )
+    job = SearchJob(template, nonces, PatternSet.compile("00", MatchType.BEGIN))
+    with Coordinator(("127.0.0.1", 0), job) as server:
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        yield server
+        server.shutdown()
+
+
+def connect(server: Coordinator) -> Connection:
+    sock = socket.create_connection(server.socket.getsockname()[:2], timeout=10)
+    connection = Connection(sock)
+    connection.send({"type": "hello", "version": 1, "jobs": 1})
+    assert connection.receive()["type"] == "job"
+    return connection
+
+
+def test_wrong_matches_are_rejected(coordinator: Coordinator) -> None:
+    cheater = connect(coordinator)
+    first = cheater.receive()
+    assert (first["type"], first["start"]) == ("range", 0)
+    cheater.send({"type": "result", "index": first["stop"], "attempts": 1})
+    with pytest.raises(ConnectionError):
+        cheater.receive()
+
+    honest = connect(coordinator)
+    again = honest.receive()
+    assert (again["start"], again["stop"]) == (first["start"], first["stop"])
+    assert coordinator.ranges.match is None
+
+
+def test_timestamp_nonce_is_not_distributed(initialized_git_repo: Path) -> None:
+    result = run_hashcommit_command(
+        ["coordinator", "--listen", "127.0.0.1:0", "--hash", "00"]
+        + ["--message", "test", "--nonce", "timestamp"],
+        cwd=initialized_git_repo,
+        expected_returncode=2,
+    )
+    assert result.stderr.decode() == (
+        "Error: Distributed searches do not support the timestamp nonce\n"
+    )
+
+
+def test_worker_without_coordinator(tmp_path: Path) -> None:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    result = run_hashcommit_command(
+        ["worker", f"127.0.0.1:{port}"], cwd=tmp_path, expected_returncode=2
+    )
+    assert result.stderr.decode().startswith(
+        f"Error: Cannot connect to the coordinator at 127.0.0.1:{port}"
+    )
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("runner.local:1234", ("runner.local", 1234)),
+        ("runner.local", ("runner.local", DEFAULT_PORT)),
+        (":80", ("0.0.0.0", 80)),
+        ("[::1]:80", ("::1", 80)),
+    ],
+)
+def test_parsing_addresses(value: str, expected: Tuple[str, int]) -> None:
+    assert address(value) == expected
@@ -0,0 +1,171 @@
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+import pytest
+from utils import run_git_command
+
+from hashcommit.args import MatchType
+from hashcommit.engine import (
+    DENSE_ALPHABET,
+    DENSE_WIDTH,
+    CommitterDateNonce,
+    CounterNonce,
+    NonceScheme,
+    SearchBudget,
+    SearchJob,
+    committer_date_template,
+    format_commit_object,
+    format_git_date,
+    hash_commit_object,
+    search,
+    search_within_budget,
+)
+from hashcommit.pattern import PatternSet
+
+
+@pytest.mark.parametrize("message", ["test", "multi\nline\n", ""])
+def test_commit_object_matches_git_commit_tree(
+    initialized_git_repo: Path, message: str
+) -> None:
+    timestamp = datetime(2024, 5, 23, 17, 6, 24)
+    date = format_git_date(timestamp)
+    env = {
+        **os.environ,
+        "GIT_AUTHOR_NAME": "Author",
+        "GIT_AUTHOR_EMAIL": "author@user.com",
+        "GIT_AUTHOR_DATE": date,
+        "GIT_COMMITTER_NAME": "Committer",
+        "GIT_COMMITTER_EMAIL": "committer@user.com",
+        "GIT_COMMITTER_DATE": date,
+    }
+    tree_hash = run_git_command(["write-tree"], cwd=initialized_git_repo)
+    head_hash = run_git_command(["rev-parse", "HEAD"], cwd=initialized_git_repo)
+    tree, head = tree_hash.stdout.decode().strip(), head_hash.stdout.decode().strip()
+
+    result = run_git_command(
+        ["commit-tree", tree, "-p", head, "-m", message],
+        env=env,
+        cwd=initialized_git_repo,
+    )
+
+    body = format_commit_object(
+        tree_hash=tree,
+        parent_hashes=[head],
+        author=f"Author <author@user.com> {date}",
+        committer=f"Committer <committer@user.com> {date}",
+        message=message,
+    )
+    assert hash_commit_object(body) == result.stdout.decode().strip()
+
+
+@pytest.mark.parametrize("encoding", [None, "ISO-8859-2"])
+def test_commit_template_matches_full_object(encoding: Optional[str]) -> None:
+    tree_hash = "4b825dc642cb6eb9a060e54bf8d69288fbbfecd9"
+    author = "Author <author@user.com> 1716476784 +0200"
+    message = "release notes\n" * 100
+    template = committer_date_template(
+        tree_hash=tree_hash,
+        parent_hashes=[],
+        author=author,
+        committer="Committer <committer@user.com>",
+        message=message,
+        encoding=encoding,
+        nonce_width=16,
+    )
+
+    for nonce in [b"1716476784 +0200", b"1716476783 +0200"]:
+        body = format_commit_object(
+            tree_hash=tree_hash,
+            parent_hashes=[],
+            author=author,
+            committer="Committer <committer@user.com> " + nonce.decode(),
+            message=message,
+            encoding=encoding,
+        )
+        assert template.body(nonce) == body
+        assert template.hash(nonce) == hash_commit_object(body)
+
+
+@pytest.mark.parametrize("match_type", list(MatchType))
+def test_parallel_search_finds_the_same_winner(match_type: MatchType) -> None:
+    nonces = CommitterDateNonce(datetime(2024, 5, 23, 17, 6, 24))
+    template = committer_date_template(
+        tree_hash="4b825dc642cb6eb9a060e54bf8d69288fbbfecd9",
+        parent_hashes=[],
+        author="Author <author@user.com> 1716476784 +0200",
+        committer="Committer <committer@user.com>",
+        message="test",
+        encoding=None,
+        nonce_width=len(nonces.nonce(0)),
+    )
+    job = SearchJob(template, nonces, PatternSet.compile("ab", match_type))
+
+    serial = search(job, jobs=1, chunk_size=64)
+    parallel = search(job, jobs=3, chunk_size=64)
+
+    assert serial.commit_hash == parallel.commit_hash
+    assert serial.nonce_index == parallel.nonce_index
+    assert job.pattern.matches_hex(parallel.commit_hash)
+    assert parallel.attempts >= serial.attempts == serial.nonce_index + 1
+
+
+@pytest.mark.parametrize("match_type", list(MatchType))
+def test_budgeted_search_settles_for_the_closest_candidate(
+    match_type: MatchType,
+) -> None:
+    nonces = CommitterDateNonce(datetime(2024, 5, 23, 17, 6, 24))
+    template = committer_date_template(
+        tree_hash="4b825dc642cb6eb9a060e54bf8d69288fbbfecd9",
+        parent_hashes=[],
+        author="Author <author@user.com> 1716476784 +0200",
+        committer="Committer <committer@user.com>",
+        message="test",
+        encoding=None,
+        nonce_width=len(nonces.nonce(0)),
+    )
+    job = SearchJob(template, nonces, PatternSet.compile("c0ffee42", match_type))
+    budget = SearchBudget(attempts=2000)
+
+    serial = search_within_budget(job, budget, jobs=1, chunk_size=64)
+    parallel = search_within_budget(job, budget, jobs=3, chunk_size=64)
+
+    assert serial is not None and parallel is not None
+    assert serial == parallel
+    assert 2000 <= serial.attempts < 2000 + 64
+    # No candidate scanned comes closer than the one returned.
+    digests = [template.digest(nonces.nonce(index)) for index in range(2000)]
+    best = max(job.pattern.closest(digest)[1] for digest in digests)
+    assert job.pattern.closest(bytes.fromhex(serial.commit_hash))[1] == best
+    assert serial.nonce_index < 2000
+
+
+@pytest.mark.parametrize(
+    "nonces",
+    [CounterNonce(DENSE_ALPHABET, DENSE_WIDTH), CounterNonce(b" \t", 20)],
+)
+def test_counter_nonces_are_dense_and_sequential(nonces: CounterNonce) -> None:
+    start, stop = 4090, 8200
+    expected = [nonces.nonce(index) for index in range(start, stop)]
+
+    assert list(nonces.iter_nonces(start, stop)) == expected
+    assert len(set(expected)) == len(expected)
+    assert {len(nonce) for nonce in expected} == {nonces.width}
+    assert set(b"".join(expected)) <= set(nonces.alphabet)
+
+
+def test_committer_date_nonces_are_sequential() -> None:
+    nonces = CommitterDateNonce(datetime(2024, 5, 23, 17, 6, 24))
+
+    assert list(nonces.iter_nonces(10, 5000)) == [
+        nonces.nonce(index) for index in range(10, 5000)
+    ]
+
+
+def test_nonce_schemes_must_map_indices_to_nonces() -> None:
+    class Incomplete(NonceScheme):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()  # type: ignore[abstract]
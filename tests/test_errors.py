@@ -1,6 +1,7 @@
 import os
 from pathlib import Path
 
+import pytest
 from utils import run_hashcommit_command
 
 
@@ -29,3 +30,55 @@ def test_running_outside_of_git_repository(tmp_path: Path) -> None:
         ["--message", "test", "--hash", "a"], cwd=tmp_path, expected_returncode=1
     )
     assert result.stderr.decode().startswith("fatal: not a git repository")
+
+
+def test_providing_invalid_jobs_count(initialized_git_repo: Path) -> None:
+    result = run_hashcommit_command(
+        ["--hash", "a", "--message", "test", "--jobs", "0"],
+        cwd=initialized_git_repo,
+        expected_returncode=2,
+    )
+    assert "--jobs: must be at least 1" in result.stderr.decode()
+
+
+def test_signature_nonce_without_signing(initialized_git_repo: Path) -> None:
+    result = run_hashcommit_command(
+        ["--hash", "a", "--message", "test", "--nonce", "signature"],
+        cwd=initialized_git_repo,
+        expected_returncode=2,
+    )
+    assert "requires commits signed with OpenPGP" in result.stderr.decode()
+
+
+@pytest.mark.parametrize(
+    "desired_hash, error",
+    [
+        ("xyz", "--hash: must be hexadecimal digits or ? wildcards, got 'xyz'"),
+        ("a" * 41, "--hash: must be at most 40 characters, got 41"),
+    ],
+)
+def test_providing_an_impossible_hash(
+    initialized_git_repo: Path, desired_hash: str, error: str
+) -> None:
+    result = run_hashcommit_command(
+        ["--hash", desired_hash, "--message", "test"],
+        cwd=initialized_git_repo,
+        expected_returncode=2,
+    )
+    assert error in result.stderr.decode()
+
+
+def test_providing_an_invalid_hash_file(
+    initialized_git_repo: Path, tmp_path: Path
+) -> None:
+    hash_file = tmp_path / "patterns.txt"
+    hash_file.write_text("abc\nxyz\n")
+
+    result = run_hashcommit_command(
+        ["--hash-file", str(hash_file), "--message", "test"],
+        cwd=initialized_git_repo,
+        expected_returncode=2,
+    )
+    assert "pattern must be hexadecimal digits or ? wildcards, got 'xyz'" in (
+        result.stderr.decode()
+    )
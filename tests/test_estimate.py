@@ -0,0 +1,119 @@
+import io
+from pathlib import Path
+
+import pytest
+from utils import get_git_log, run_hashcommit_command
+
+from hashcommit.args import MatchType
+from hashcommit.estimate import (
+    ProgressReporter,
+    attempts_for_confidence,
+    expected_attempts,
+    format_duration,
+    match_probability,
+    success_probability,
+)
+from hashcommit.pattern import PatternSet
+
+
+@pytest.mark.parametrize("match_type", [MatchType.BEGIN, MatchType.END])
+def test_anchored_targets_need_16_to_the_n_attempts(match_type: MatchType) -> None:
+    assert expected_attempts(PatternSet.compile("a", match_type)) == 16
+    assert expected_attempts(PatternSet.compile("abcd", match_type)) == 16**4
+
+
+def test_contained_targets_can_match_at_any_position() -> None:
+    pattern = PatternSet.compile("a" * 40, MatchType.CONTAIN)
+    assert match_probability(pattern) == 16.0**-40
+    pattern = PatternSet.compile("abc", MatchType.CONTAIN)
+    assert expected_attempts(pattern) == pytest.approx(16**3 / 38, 0.01)
+
+
+def test_every_acceptable_pattern_shortens_the_search() -> None:
+    patterns = PatternSet.compile(["abc", "def", "123", "456"], MatchType.BEGIN)
+    assert expected_attempts(patterns) == pytest.approx(16**3 / 4, 0.01)
+
+
+def test_wildcards_do_not_count_towards_difficulty() -> None:
+    pattern = PatternSet.compile("c0??ee", MatchType.BEGIN)
+    assert expected_attempts(pattern) == 16**4
+
+
+def test_success_probability() -> None:
+    probability = match_probability(PatternSet.compile("ab", MatchType.BEGIN))
+    assert success_probability(0, probability) == 0
+    attempts = attempts_for_confidence(0.5, probability)
+    assert success_probability(round(attempts), probability) == pytest.approx(0.5, 0.01)
+
+
+@pytest.mark.parametrize("match_type", list(MatchType))
+def test_wildcards_only_match_every_candidate(match_type: MatchType) -> None:
+    patterns = PatternSet.compile(["??", "abc"], match_type)
+    assert match_probability(patterns) == 1
+    assert success_probability(0, 1) == 0
+    assert success_probability(1, 1) == 1
+
+
+def test_searching_for_wildcards_only(initialized_git_repo: Path) -> None:
+    run_hashcommit_command(
+        ["--hash", "??", "--match-type", "contain", "--message", "any", "-j", "1"],
+        cwd=initialized_git_repo,
+    )
+    assert get_git_log(initialized_git_repo)[0].message == "any\n"
+
+
+@pytest.mark.parametrize(
+    "seconds, expected",
+    [(0.25, "0.2s"), (59.9, "59.9s"), (61, "1m 1s"), (3600, "1h 0m"), (90000, "1d 1h")],
+)
+def test_format_duration(seconds: float, expected: str) -> None:
+    assert format_duration(seconds) == expected
+
+
+def test_progress_reporter() -> None:
+    stream = io.StringIO()
+    progress = ProgressReporter(1 / 16, stream=stream, interval=0)
+
+    progress(16)
+    progress.finish()
+
+    output = stream.getvalue()
+    assert output.startswith("\r16 attempts, ")
+    assert "64.4% chance of success so far" in output
+    assert output.endswith("\n")
+
+
+def test_progress_reporter_without_reports() -> None:
+    stream = io.StringIO()
+    progress = ProgressReporter(1 / 16, stream=stream)
+
+    progress(16)
+    progress.finish()
+
+    assert stream.getvalue() == ""
+
+
+def test_estimate_does_not_touch_the_repository(initialized_git_repo: Path) -> None:
+    git_log = get_git_log(initialized_git_repo)
+
+    result = run_hashcommit_command(
+        ["--hash", "ABC", "--message", "test", "--estimate", "-j", "1"],
+        cwd=initialized_git_repo,
+    )
+
+    stdout = result.stdout.decode()
+    assert stdout.startswith("Expected attempts: 4,096\n")
+    assert "candidates/s (1 job(s))" in stdout
+    assert "99% chance within: " in stdout
+    assert get_git_log(initialized_git_repo) == git_log
+
+
+def test_estimating_a_pattern_of_wildcards(initialized_git_repo: Path) -> None:
+    result = run_hashcommit_command(
+        ["--hash", "?", "--message", "test", "--estimate", "-j", "1"],
+        cwd=initialized_git_repo,
+    )
+
+    stdout = result.stdout.decode()
+    assert stdout.startswith("Expected attempts: 1\n")
+    assert "99% chance within: " in stdout
@@ -1,7 +1,16 @@
+import time
 from pathlib import Path
+from typing import List
 
 import pytest
-from utils import configure_git, get_git_log, run_hashcommit_command
+from utils import (
+    configure_git,
+    create_merge_history,
+    get_git_log,
+    get_history,
+    run_git_command,
+    run_hashcommit_command,
+)
 
 
 def test_specifying_a_message(initialized_git_repo: Path) -> None:
@@ -140,6 +149,103 @@ def test_overwriting_a_commit_from_the_past(
     assert git_log[2].author == "User0"
 
 
+def test_overwriting_a_commit_in_the_past_keeps_descendants(
+    initialized_git_repo: Path,
+) -> None:
+    for number in range(3):
+        (initialized_git_repo / f"file{number}").write_text(f"{number}\n")
+        run_git_command(["add", "."], cwd=initialized_git_repo)
+        run_git_command(
+            ["commit", "-m", f"test{number}", "--date", f"{1700000000 + number} +0200"],
+            cwd=initialized_git_repo,
+        )
+    (initialized_git_repo / "file0").write_text("staged\n")
+    run_git_command(["add", "file0"], cwd=initialized_git_repo)
+    (initialized_git_repo / "file1").write_text("unstaged\n")
+    details = ["log", "--format=%T %an %ae %ad %cn %ce %cd %B", "HEAD~2"]
+    before = run_git_command(details, cwd=initialized_git_repo).stdout
+    status = run_git_command(["status", "--porcelain"], cwd=initialized_git_repo)
+    target = get_git_log(initialized_git_repo)[2].hash
+
+    run_hashcommit_command(
+        ["--hash", "00", "--overwrite", "--commit", target], cwd=initialized_git_repo
+    )
+
+    git_log = get_git_log(initialized_git_repo)
+    assert git_log[2].hash.startswith("00")
+    assert [commit.message for commit in git_log] == [
+        "test2\n",
+        "test1\n",
+        "test0\n",
+        "Initial commit\n",
+    ]
+    after = run_git_command(details, cwd=initialized_git_repo).stdout
+    assert after.splitlines()[1:] == before.splitlines()[1:]
+    assert (
+        run_git_command(["status", "--porcelain"], cwd=initialized_git_repo).stdout
+        == status.stdout
+    )
+    reflog = run_git_command(
+        ["reflog", "--format=%gs", "-1", "HEAD"], cwd=initialized_git_repo
+    )
+    assert reflog.stdout.decode() == f"hashcommit: overwrite {target}\n"
+
+
+def test_overwriting_a_commit_outside_of_history(initialized_git_repo: Path) -> None:
+    run_git_command(["checkout", "-q", "-b", "side"], cwd=initialized_git_repo)
+    run_git_command(["commit", "--allow-empty", "-m", "side"], cwd=initialized_git_repo)
+    side = get_git_log(initialized_git_repo)[0].hash
+    run_git_command(["checkout", "-q", "-"], cwd=initialized_git_repo)
+
+    result = run_hashcommit_command(
+        ["--hash", "0", "--overwrite", "--commit", side],
+        cwd=initialized_git_repo,
+        expected_returncode=2,
+    )
+    assert result.stderr.decode() == f"Error: {side} is not an ancestor of HEAD\n"
+
+
+def test_overwriting_a_commit_below_a_merge(initialized_git_repo: Path) -> None:
+    create_merge_history(initialized_git_repo)
+    before = get_history(initialized_git_repo)
+    root = get_git_log(initialized_git_repo)[-1].hash
+
+    run_hashcommit_command(
+        ["--hash", "00", "--overwrite", "--commit", root], cwd=initialized_git_repo
+    )
+
+    assert (
+        get_history(initialized_git_repo)
+        == before
+        == {
+            "merge": ["main", "side"],
+            "main": ["Initial commit"],
+            "side": ["Initial commit"],
+            "Initial commit": [],
+        }
+    )
+    # The rewritten root is newer than "side", so the log may list it first.
+    roots = run_git_command(
+        ["rev-list", "--max-parents=0", "HEAD"], cwd=initialized_git_repo
+    )
+    assert roots.stdout.decode().startswith("00")
+    commits = run_git_command(["rev-list", "HEAD"], cwd=initialized_git_repo)
+    assert len(commits.stdout.split()) == 4
+
+
+@pytest.mark.parametrize("commit", [[], ["--commit", "HEAD"]])
+def test_overwriting_a_merge(initialized_git_repo: Path, commit: List[str]) -> None:
+    create_merge_history(initialized_git_repo)
+    before = get_history(initialized_git_repo)
+
+    run_hashcommit_command(
+        ["--hash", "00", "--overwrite"] + commit, cwd=initialized_git_repo
+    )
+
+    assert get_history(initialized_git_repo) == before
+    assert get_git_log(initialized_git_repo)[0].hash.startswith("00")
+
+
 def test_overwriting_a_first_commit(initialized_git_repo: Path) -> None:
     run_hashcommit_command(
         ["--hash", "0", "--message", "test0"],
@@ -167,3 +273,92 @@ def test_overwriting_a_first_commit(initialized_git_repo: Path) -> None:
 
     assert git_log[1].message.startswith("Initial commit")
     assert git_log[1].hash.startswith("1")
+
+
+@pytest.mark.parametrize("jobs", ["1", "2"])
+def test_searching_with_multiple_jobs(initialized_git_repo: Path, jobs: str) -> None:
+    run_hashcommit_command(
+        ["--hash", "00", "--message", "test", "--jobs", jobs],
+        cwd=initialized_git_repo,
+    )
+
+    git_log = get_git_log(initialized_git_repo)
+    assert len(git_log) == 2
+    assert git_log[0].hash.startswith("00")
+
+
+@pytest.mark.parametrize("nonce", ["header", "trailer", "whitespace", "timestamp"])
+def test_nonce_placements(initialized_git_repo: Path, nonce: str) -> None:
+    before = int(time.time())
+    run_hashcommit_command(
+        ["--hash", "0", "--message", "test", "--nonce", nonce],
+        cwd=initialized_git_repo,
+    )
+
+    git_log = get_git_log(initialized_git_repo)
+    assert len(git_log) == 2
+    assert git_log[0].hash.startswith("0")
+    assert git_log[0].message.startswith("test")
+    run_git_command(["fsck", "--strict"], cwd=initialized_git_repo)
+
+    committer_date = run_git_command(
+        ["show", "-s", "--format=%ct", git_log[0].hash], cwd=initialized_git_repo
+    )
+    if nonce == "timestamp":
+        assert int(committer_date.stdout) < before
+    else:
+        assert int(committer_date.stdout) >= before
+    if nonce in ("header", "timestamp"):
+        assert git_log[0].message == "test\n"
+    if nonce == "trailer":
+        assert git_log[0].message.startswith("test\n\n--- meta: ")
+    if nonce == "whitespace":
+        assert git_log[0].message.rstrip() == "test"
+
+
+@pytest.mark.parametrize(
+    "message, header", [("short", True), ("A longer message.\n\n" + "x" * 200, False)]
+)
+def test_default_nonce_placement(
+    initialized_git_repo: Path, message: str, header: bool
+) -> None:
+    run_hashcommit_command(
+        ["--hash", "0", "--message", message], cwd=initialized_git_repo
+    )
+
+    commit = run_git_command(
+        ["cat-file", "commit", "HEAD"], cwd=initialized_git_repo
+    ).stdout.decode()
+    assert ("\nhashcommit " in commit) == header
+    assert get_git_log(initialized_git_repo)[0].message.rstrip() == message
+
+
+def test_matching_a_wildcard_pattern(initialized_git_repo: Path) -> None:
+    run_hashcommit_command(
+        ["--hash", "0?1", "--message", "test"],
+        cwd=initialized_git_repo,
+    )
+
+    git_log = get_git_log(initialized_git_repo)
+    assert git_log[0].hash[0] == "0"
+    assert git_log[0].hash[2] == "1"
+
+
+def test_accepting_any_of_several_patterns(
+    initialized_git_repo: Path, tmp_path: Path
+) -> None:
+    hash_file = tmp_path / "patterns.txt"
+    hash_file.write_text("# team prefixes\nbad\n\ncafe  # reserved\n")
+
+    result = run_hashcommit_command(
+        ["--hash", "0a", "--hash", "1b", "--hash-file", str(hash_file)]
+        + ["--message", "test"],
+        cwd=initialized_git_repo,
+    )
+
+    git_log = get_git_log(initialized_git_repo)
+    matched = result.stdout.decode().splitlines()[-1]
+    assert matched.startswith("Matched pattern: ")
+    pattern = matched.split(": ")[1]
+    assert pattern in ["0a", "1b", "bad", "cafe"]
+    assert git_log[0].hash.startswith(pattern)
@@ -0,0 +1,105 @@
+from pathlib import Path
+
+import pytest
+from utils import get_git_log, run_git_command
+
+from hashcommit.engine import format_commit_object, hash_commit_object
+from hashcommit.gitio import (
+    GitObjectReader,
+    LooseObjectWriter,
+    parse_commit,
+    replace_parents,
+)
+
+
+def test_reading_commits_through_one_process(
+    initialized_git_repo: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.chdir(initialized_git_repo)
+    head = get_git_log(initialized_git_repo)[0]
+    reader = GitObjectReader()
+    try:
+        commit = reader.read_commit("HEAD")
+        assert commit is not None
+        assert commit.oid == head.hash
+        assert commit.parents == ()
+        assert commit.author_name_email == "Test User <test@user.com>"
+        assert commit.message == "Initial commit\n"
+        assert reader.read_commit(commit.tree) is None
+        assert reader.read("0" * 40) is None
+        assert reader.read_commit(head.hash) == commit
+    finally:
+        reader.close()
+
+
+def test_writing_loose_commits(
+    initialized_git_repo: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.chdir(initialized_git_repo)
+    tree = run_git_command(["write-tree"]).stdout.decode().strip()
+    writer = LooseObjectWriter(initialized_git_repo / ".git" / "objects")
+    for message in ["first", "second", "first"]:
+        body = format_commit_object(
+            tree_hash=tree,
+            parent_hashes=[],
+            author="A <a@b> 1 +0000",
+            committer="A <a@b> 1 +0000",
+            message=message,
+        )
+        oid = writer.write(body)
+        assert oid == hash_commit_object(body)
+        shown = run_git_command(["cat-file", "commit", oid]).stdout
+        assert shown == body
+    run_git_command(["fsck", "--strict"])
+
+
+def test_parsing_multiline_headers() -> None:
+    content = (
+        b"tree 4b825dc642cb6eb9a060e54bf8d69288fbbfecd9\n"
+        b"author A <a@b> 1 +0000\n"
+        b"committer C <c@d> 2 +0100\n"
+        b"gpgsig -----BEGIN PGP SIGNATURE-----\n"
+        b" \n"
+        b" -----END PGP SIGNATURE-----\n"
+        b"\n"
+        b"subject\n\nbody\n"
+    )
+
+    commit = parse_commit("f" * 40, content)
+
+    assert commit.committer_name_email == "C <c@d>"
+    assert commit.author_date == "1 +0000"
+    assert commit.message == "subject\n\nbody\n"
+
+
+def test_replacing_parents() -> None:
+    content = (
+        b"tree 4b825dc642cb6eb9a060e54bf8d69288fbbfecd9\n"
+        b"parent " + b"1" * 40 + b"\n"
+        b"parent " + b"2" * 40 + b"\n"
+        b"author A <a@b> 1 +0000\n"
+        b"committer C <c@d> 2 +0100\n"
+        b"encoding ISO-8859-2\n"
+        b"gpgsig -----BEGIN PGP SIGNATURE-----\n"
+        b" \n"
+        b" -----END PGP SIGNATURE-----\n"
+        b"mergetag object " + b"3" * 40 + b"\n"
+        b" type commit\n"
+        b"\n"
+        b"subject\n\n\nbody\n"
+    )
+
+    replaced = replace_parents(content, ["a" * 40, "2" * 40])
+
+    assert replaced == (
+        b"tree 4b825dc642cb6eb9a060e54bf8d69288fbbfecd9\n"
+        b"parent " + b"a" * 40 + b"\n"
+        b"parent " + b"2" * 40 + b"\n"
+        b"author A <a@b> 1 +0000\n"
+        b"committer C <c@d> 2 +0100\n"
+        b"encoding ISO-8859-2\n"
+        b"mergetag object " + b"3" * 40 + b"\n"
+        b" type commit\n"
+        b"\n"
+        b"subject\n\n\nbody\n"
+    )
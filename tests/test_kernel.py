@@ -0,0 +1,117 @@
+import hashlib
+from datetime import datetime
+
+import pytest
+
+from hashcommit import kernel
+from hashcommit.args import MatchType
+from hashcommit.engine import (
+    DENSE_ALPHABET,
+    DENSE_WIDTH,
+    CommitTemplate,
+    CommitterDateNonce,
+    CounterNonce,
+    SearchJob,
+    committer_date_template,
+    search,
+    use_batch_kernel,
+)
+from hashcommit.pattern import PatternSet
+
+np = pytest.importorskip("numpy")
+
+
+@pytest.mark.parametrize("length", [0, 55, 56, 64, 300])
+def test_midstate_matches_hashlib(length: int) -> None:
+    data = bytes(i % 256 for i in range(length))
+    padded = data + kernel._sha1_padding(len(data))
+
+    state = kernel.sha1_midstate(padded)
+
+    digest = b"".join(word.to_bytes(4, "big") for word in state)
+    assert digest == hashlib.sha1(data).digest()
+
+
+@pytest.mark.parametrize("head_length", [0, 40, 53, 61, 200])
+@pytest.mark.parametrize("tail_length", [0, 5, 120])
+def test_batch_digests_match_hashlib(head_length: int, tail_length: int) -> None:
+    head = bytes(i % 251 for i in range(head_length))
+    tail = b"t" * tail_length
+    template = CommitTemplate(head, tail, 16)
+    hasher = kernel.BatchHasher(head, tail, 16)
+    nonces = [b"%016d" % i for i in range(300)]
+    batch = np.frombuffer(b"".join(nonces), dtype=np.uint8).reshape(len(nonces), 16)
+
+    digests = hasher.digests(batch)
+
+    assert [bytes(row) for row in digests] == [
+        template.digest(nonce) for nonce in nonces
+    ]
+
+
+@pytest.mark.parametrize("match_type", list(MatchType))
+@pytest.mark.parametrize("desired_hash", ["a", "0f", "abc", "a?c", "?0?"])
+def test_batch_matching_agrees_with_scalar_matching(
+    match_type: MatchType, desired_hash: str
+) -> None:
+    digests = np.frombuffer(
+        b"".join(hashlib.sha1(b"%d" % i).digest() for i in range(2000)),
+        dtype=np.uint8,
+    ).reshape(-1, 20)
+
+    pattern = PatternSet.compile(desired_hash, match_type)
+    hits = kernel.match_digests(digests, pattern)
+
+    expected = [pattern.matches(hashlib.sha1(b"%d" % i).digest()) for i in range(2000)]
+    assert hits.tolist() == expected
+
+
+@pytest.mark.parametrize("match_type", list(MatchType))
+def test_batch_search_finds_the_same_winner(match_type: MatchType) -> None:
+    nonces = CommitterDateNonce(datetime(2024, 5, 23, 17, 6, 24))
+    template = committer_date_template(
+        tree_hash="4b825dc642cb6eb9a060e54bf8d69288fbbfecd9",
+        parent_hashes=[],
+        author="Author <author@user.com> 1716476784 +0200",
+        committer="Committer <committer@user.com>",
+        message="test",
+        encoding=None,
+        nonce_width=len(nonces.nonce(0)),
+    )
+
+    pattern = PatternSet.compile("abc", match_type)
+    scalar = search(SearchJob(template, nonces, pattern))
+    batch = search(SearchJob(template, nonces, pattern, batch=True))
+
+    assert batch == scalar
+
+
+@pytest.mark.parametrize(
+    "match_type, batch",
+    [(MatchType.BEGIN, True), (MatchType.END, True), (MatchType.CONTAIN, False)],
+)
+def test_batch_kernel_is_used_for_anchored_patterns(
+    match_type: MatchType, batch: bool
+) -> None:
+    nonces = CommitterDateNonce(datetime(2024, 5, 23, 17, 6, 24))
+    template = committer_date_template(
+        tree_hash="4b825dc642cb6eb9a060e54bf8d69288fbbfecd9",
+        parent_hashes=[],
+        author="Author <author@user.com> 1716476784 +0200",
+        committer="Committer <committer@user.com>",
+        message="test",
+        encoding=None,
+        nonce_width=len(nonces.nonce(0)),
+    )
+
+    assert use_batch_kernel(template, PatternSet.compile("abc", match_type)) == batch
+
+
+def test_counter_nonce_batches_match_scalar_nonces() -> None:
+    nonces = CounterNonce(DENSE_ALPHABET, DENSE_WIDTH)
+
+    batch = nonces.nonce_batch(5000, 9000)
+
+    assert [bytes(row) for row in batch] == [
+        nonces.nonce(index) for index in range(5000, 9000)
+    ]
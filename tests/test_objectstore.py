@@ -0,0 +1,177 @@
+import os
+import shutil
+import stat
+import subprocess
+from pathlib import Path
+from typing import List, Optional
+
+import pytest
+from utils import create_merge_history, run_git_command, run_hashcommit_command
+
+from hashcommit.objectstore import ObjectStore, Unsupported, open_object_store
+
+
+def create_packed_history(repo: Path) -> None:
+    """Commit edits of one file on two branches, pack them with deltas and
+    pack the refs, then commit once more as a loose object."""
+    lines = [f"line {number} " + "x" * 40 for number in range(200)]
+    for number in range(6):
+        if number == 3:
+            run_git_command(["checkout", "-q", "-b", "topic", "HEAD~1"], cwd=repo)
+        lines[number * 7] += " edited"
+        (repo / "file").write_text("\n".join(lines))
+        run_git_command(["add", "file"], cwd=repo)
+        run_git_command(["commit", "-q", "-m", f"edit {number}"], cwd=repo)
+    run_git_command(["checkout", "-q", "-"], cwd=repo)
+    run_git_command(["merge", "-q", "--no-ff", "-m", "merge", "topic"], cwd=repo)
+    run_git_command(["tag", "light", "HEAD~2"], cwd=repo)
+    run_git_command(["tag", "-a", "-m", "annotated", "annotated", "HEAD^2"], cwd=repo)
+    run_git_command(["repack", "-adfq", "--depth=10"], cwd=repo)
+    run_git_command(["pack-refs", "--all"], cwd=repo)
+    run_git_command(["commit", "-q", "--allow-empty", "-m", "loose"], cwd=repo)
+
+
+def open_store(repo: Path) -> ObjectStore:
+    store = open_object_store(str(repo))
+    assert store is not None
+    return store
+
+
+def rev_parse(repo: Path, rev: str) -> Optional[str]:
+    result = subprocess.run(
+        ["git", "rev-parse", "-q", "--verify", rev], capture_output=True, cwd=repo
+    )
+    return result.stdout.decode().strip() or None
+
+
+def rev_list(repo: Path, rev: str) -> List[str]:
+    result = run_git_command(
+        ["rev-list", "--reverse", "--topo-order", "--parents", rev], cwd=repo
+    )
+    return str(result.stdout.decode()).splitlines()
+
+
+def test_reading_objects_like_git(initialized_git_repo: Path) -> None:
+    create_packed_history(initialized_git_repo)
+    store = open_store(initialized_git_repo)
+    objects = run_git_command(
+        ["cat-file", "--batch-all-objects", "--batch-check"], cwd=initialized_git_repo
+    ).stdout.decode()
+    try:
+        for line in objects.splitlines():
+            oid, object_type, _ = line.split()
+            content = run_git_command(
+                ["cat-file", object_type, oid], cwd=initialized_git_repo
+            ).stdout
+            assert store.read(oid) == (object_type, content)
+    finally:
+        store.close()
+
+
+@pytest.mark.parametrize(
+    "rev",
+    [
+        "HEAD",
+        "HEAD~3",
+        "HEAD^2",
+        "HEAD~1^2~1",
+        "topic",
+        "heads/topic",
+        "refs/heads/topic",
+        "light",
+        "annotated",
+        "annotated~1",
+        "annotated^0",
+        "HEAD~20",
+        "missing",
+    ],
+)
+def test_resolving_revisions_like_git(initialized_git_repo: Path, rev: str) -> None:
+    create_packed_history(initialized_git_repo)
+    store = open_store(initialized_git_repo)
+
+    assert store.resolve(rev) == rev_parse(initialized_git_repo, rev)
+
+
+@pytest.mark.parametrize(
+    "rev", ["HEAD", "topic", "topic..HEAD", "side..HEAD", "light..annotated"]
+)
+def test_walking_history_like_git(initialized_git_repo: Path, rev: str) -> None:
+    create_packed_history(initialized_git_repo)
+    create_merge_history(initialized_git_repo)
+    store = open_store(initialized_git_repo)
+
+    walked = [" ".join((oid,) + parents) for oid, parents in store.walk(rev)]
+    assert walked == rev_list(initialized_git_repo, rev)
+    assert store.is_ancestor("topic", "HEAD")
+    assert not store.is_ancestor("HEAD", "topic")
+
+
+def test_leaving_the_rest_to_git(initialized_git_repo: Path) -> None:
+    store = open_store(initialized_git_repo)
+    head = store.resolve("HEAD")
+    assert head is not None
+
+    for rev in (head[:7], "HEAD@{0}", "HEAD^{tree}", ":/Initial"):
+        with pytest.raises(Unsupported):
+            store.resolve(rev)
+    with pytest.raises(Unsupported):
+        store.read("0" * 40)
+
+    (initialized_git_repo / ".git" / "shallow").write_text(head + "\n")
+    with pytest.raises(Unsupported):
+        store.walk("HEAD")
+
+    tree = run_git_command(["write-tree"], cwd=initialized_git_repo).stdout.decode()
+    replacement = run_git_command(
+        ["commit-tree", tree.strip(), "-m", "replacement"], cwd=initialized_git_repo
+    )
+    run_git_command(
+        ["replace", head, replacement.stdout.decode().strip()], cwd=initialized_git_repo
+    )
+    assert open_object_store(str(initialized_git_repo)) is None
+
+
+def test_worktrees_share_objects_and_refs(
+    initialized_git_repo: Path, tmp_path: Path
+) -> None:
+    worktree = tmp_path / "worktree"
+    run_git_command(
+        ["worktree", "add", "-q", "-b", "other", str(worktree)],
+        cwd=initialized_git_repo,
+    )
+    run_git_command(["commit", "-q", "--allow-empty", "-m", "other"], cwd=worktree)
+    branch = run_git_command(["symbolic-ref", "HEAD"], cwd=initialized_git_repo)
+    store = open_store(worktree)
+
+    assert store.resolve("HEAD") == rev_parse(worktree, "HEAD")
+    assert store.resolve(branch.stdout.decode().strip()) == rev_parse(
+        initialized_git_repo, "HEAD"
+    )
+    assert store.resolve("HEAD~1") == rev_parse(initialized_git_repo, "HEAD")
+
+
+def test_commands_read_without_git_processes(
+    initialized_git_repo: Path, tmp_path: Path
+) -> None:
+    create_merge_history(initialized_git_repo)
+    # Log every git command hashcommit runs.
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    log = tmp_path / "git.log"
+    wrapper = bin_dir / "git"
+    wrapper.write_text(
+        f'#!/bin/sh\necho "$*" >> {log}\nexec {shutil.which("git")} "$@"\n'
+    )
+    wrapper.chmod(wrapper.stat().st_mode | stat.S_IXUSR)
+    env = dict(os.environ, PATH=f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+
+    run_hashcommit_command(
+        ["--hash", "0", "--overwrite", "--commit", "HEAD~1", "-j", "1"],
+        env=env,
+        cwd=initialized_git_repo,
+    )
+
+    commands = log.read_text()
+    for command in ("cat-file", "rev-list", "merge-base", "--git-path"):
+        assert command not in commands
@@ -0,0 +1,88 @@
+from pathlib import Path
+from typing import Dict
+
+import pytest
+from utils import (
+    create_merge_history,
+    get_history,
+    run_git_command,
+    run_hashcommit_command,
+)
+
+from hashcommit.engine import format_commit_object
+from hashcommit.objectstore import open_object_store
+from hashcommit.pack import PackWriter
+
+
+def count_objects(repo: Path) -> Dict[str, int]:
+    output = run_git_command(["count-objects", "-v"], cwd=repo).stdout.decode()
+    counts = (line.split(": ") for line in output.splitlines())
+    return {key: int(value) for key, value in counts if value.isdigit()}
+
+
+def test_writing_a_pack_git_reads(initialized_git_repo: Path) -> None:
+    objects = initialized_git_repo / ".git" / "objects"
+    tree = run_git_command(["write-tree"], cwd=initialized_git_repo).stdout
+    bodies = [
+        format_commit_object(
+            tree_hash=tree.decode().strip(),
+            parent_hashes=[],
+            author="A <a@b> 1 +0000",
+            committer="A <a@b> 1 +0000",
+            message=f"commit {number}\n" + "long message\n" * number,
+        )
+        for number in range(300)
+    ]
+    with PackWriter(objects) as pack:
+        oids = [pack.write(body) for body in bodies + bodies[:3]]
+
+    (pack_path,) = (objects / "pack").glob("*.pack")
+    index_path = pack_path.with_suffix(".idx")
+    assert not list((objects / "pack").glob("tmp_*"))
+    # git indexes the pack exactly like we did.
+    rebuilt = initialized_git_repo / "rebuilt.idx"
+    run_git_command(["index-pack", "-o", str(rebuilt), str(pack_path)])
+    assert rebuilt.read_bytes() == index_path.read_bytes()
+    run_git_command(["fsck", "--strict"], cwd=initialized_git_repo)
+
+    store = open_object_store(str(initialized_git_repo))
+    assert store is not None
+    for oid, body in zip(oids, bodies):
+        content = run_git_command(["cat-file", "commit", oid], cwd=initialized_git_repo)
+        assert content.stdout == body
+        assert store.read(oid) == ("commit", body)
+    store.close()
+
+
+def test_dropping_a_pack(initialized_git_repo: Path) -> None:
+    objects = initialized_git_repo / ".git" / "objects"
+    with pytest.raises(KeyboardInterrupt):
+        with PackWriter(objects) as pack:
+            pack.write(b"tree 4b825dc642cb6eb9a060e54bf8d69288fbbfecd9\n")
+            raise KeyboardInterrupt()
+    with PackWriter(objects):
+        pass
+    assert not list((objects / "pack").iterdir())
+
+
+def test_rewriting_writes_one_pack(initialized_git_repo: Path) -> None:
+    create_merge_history(initialized_git_repo)
+    before = count_objects(initialized_git_repo)
+
+    run_hashcommit_command(["rewrite", "-d", "1"], cwd=initialized_git_repo)
+    run_hashcommit_command(
+        ["--hash", "0", "--overwrite", "--commit", "HEAD~2"], cwd=initialized_git_repo
+    )
+
+    after = count_objects(initialized_git_repo)
+    assert after["count"] == before["count"]
+    assert after["packs"] == before["packs"] + 2
+    root = run_git_command(["rev-parse", "HEAD~2"], cwd=initialized_git_repo)
+    assert root.stdout.startswith(b"0")
+    assert get_history(initialized_git_repo) == {
+        "merge": ["main", "side"],
+        "main": ["Initial commit"],
+        "side": ["Initial commit"],
+        "Initial commit": [],
+    }
+    run_git_command(["fsck", "--strict"], cwd=initialized_git_repo)
@@ -0,0 +1,141 @@
+import hashlib
+from fnmatch import fnmatchcase
+from typing import List
+
+import pytest
+
+from hashcommit.args import MatchType
+from hashcommit.pattern import HashPattern, PatternSet, contain_matcher
+
+GLOBS = {
+    MatchType.BEGIN: "{}*",
+    MatchType.END: "*{}",
+    MatchType.CONTAIN: "*{}*",
+}
+
+
+@pytest.mark.parametrize("match_type", list(MatchType))
+@pytest.mark.parametrize("text", ["a", "0f", "abc", "a?c", "??", "c0f?e"])
+def test_pattern_agrees_with_the_hex_digest(match_type: MatchType, text: str) -> None:
+    pattern = HashPattern.compile(text, match_type)
+    glob = GLOBS[match_type].format(text)
+
+    for i in range(2000):
+        digest = hashlib.sha1(b"%d" % i).digest()
+        assert pattern.matches(digest) == fnmatchcase(digest.hex(), glob)
+
+
+@pytest.mark.parametrize("text", ["a", "0f", "abc", "a?c", "c0f?e", "?1?"])
+def test_contain_matcher_agrees_with_the_hex_digest(text: str) -> None:
+    matches = contain_matcher(text)
+    glob = GLOBS[MatchType.CONTAIN].format(text)
+
+    for i in range(2000):
+        digest = hashlib.sha1(b"%d" % i).digest()
+        assert matches(digest) == fnmatchcase(digest.hex(), glob)
+
+
+def test_odd_length_prefixes_and_suffixes() -> None:
+    digest = bytes.fromhex("c0ffee1142" + "0" * 29 + "7")
+
+    assert HashPattern.compile("c0ffe", MatchType.BEGIN).matches(digest)
+    assert HashPattern.compile("c0ffee??42", MatchType.BEGIN).matches(digest)
+    assert not HashPattern.compile("c0ffee??43", MatchType.BEGIN).matches(digest)
+    assert HashPattern.compile("007", MatchType.END).matches(digest)
+    assert HashPattern.compile("E1?42", MatchType.CONTAIN).matches(digest)
+
+
+def test_full_length_pattern() -> None:
+    commit_hash = hashlib.sha1(b"full").hexdigest()
+
+    for match_type in MatchType:
+        pattern = HashPattern.compile(commit_hash, match_type)
+        assert len(pattern.masks) == 1
+        assert pattern.matches_hex(commit_hash)
+
+
+def test_contain_has_a_place_per_offset() -> None:
+    pattern = HashPattern.compile("abc", MatchType.CONTAIN)
+
+    assert len(pattern.masks) == 38
+    assert pattern.fixed_digits == 3
+    assert [start for start, _, _ in pattern.byte_masks()][:4] == [0, 0, 1, 1]
+
+
+@pytest.mark.parametrize("text", ["", "a" * 41])
+def test_rejecting_impossible_patterns(text: str) -> None:
+    with pytest.raises(ValueError):
+        HashPattern.compile(text, MatchType.BEGIN)
+
+
+@pytest.mark.parametrize("match_type", list(MatchType))
+@pytest.mark.parametrize(
+    "texts",
+    [
+        ["a", "0f", "b?c", "??d", "ff", "0F"],
+        ["0fa", "0fb", "a?c", "c0ffe", "12?45"],
+        ["4aa5b", "9b3c?d1e2", "5d6e7f", "00000"],
+    ],
+)
+def test_pattern_set_agrees_with_its_patterns(
+    match_type: MatchType, texts: List[str]
+) -> None:
+    patterns = PatternSet.compile(texts, match_type)
+    match = patterns.matcher()
+
+    assert len(patterns) == len({text.lower() for text in texts})
+    for i in range(2000):
+        digest = hashlib.sha1(b"%d" % i).digest()
+        globs = [GLOBS[match_type].format(text) for text in texts]
+        expected = any(fnmatchcase(digest.hex(), glob) for glob in globs)
+        assert match(digest) == expected
+        matched = patterns.matching(digest)
+        assert (matched is not None) == expected
+        if matched:
+            assert fnmatchcase(digest.hex(), GLOBS[match_type].format(matched.text))
+
+
+def test_pattern_set_needs_a_pattern() -> None:
+    with pytest.raises(ValueError):
+        PatternSet.compile([], MatchType.BEGIN)
+
+
+@pytest.mark.parametrize("match_type", list(MatchType))
+def test_pattern_set_reports_the_matching_pattern(match_type: MatchType) -> None:
+    digest = bytes.fromhex("c0ffee1142" + "0" * 23 + "123456d")
+    patterns = PatternSet.compile(["deadbeef", "e11?20", "3456d"], match_type)
+
+    matched = patterns.matching(digest)
+
+    assert patterns.matcher()(digest) == (match_type != MatchType.BEGIN)
+    expected = {MatchType.BEGIN: None, MatchType.END: "3456d"}
+    assert (matched and matched.text) == expected.get(match_type, "e11?20")
+
+
+@pytest.mark.parametrize(
+    "match_type, matched",
+    [(MatchType.BEGIN, 5), (MatchType.END, 3), (MatchType.CONTAIN, 6)],
+)
+def test_scoring_partial_matches(match_type: MatchType, matched: int) -> None:
+    digest = bytes.fromhex("c0ffee1142" + "0" * 23 + "123456d")
+    patterns = PatternSet.compile(["c0f?e0", "e11420f", "ab56d"], match_type)
+
+    pattern, length = patterns.closest(digest)
+
+    assert length == matched
+    assert pattern.matched_length(digest) == length
+    assert patterns.closer_than(length - 1).matches(digest)
+    assert not patterns.closer_than(length).matches(digest)
+
+
+@pytest.mark.parametrize("match_type", list(MatchType))
+def test_closer_patterns_match_closer_digests(match_type: MatchType) -> None:
+    patterns = PatternSet.compile(["c0f?ee", "12a", "???7"], match_type)
+
+    for i in range(2000):
+        digest = hashlib.sha1(b"%d" % i).digest()
+        _, length = patterns.closest(digest)
+        for matched in range(6):
+            closer = patterns.closer_than(matched)
+            expected = length > matched or patterns.matches(digest)
+            assert closer.matcher()(digest) == expected
@@ -0,0 +1,100 @@
+from pathlib import Path
+from typing import Any, List
+
+import pytest
+from utils import (
+    configure_git,
+    create_merge_history,
+    get_git_log,
+    get_history,
+    run_git_command,
+    run_hashcommit_command,
+)
+
+from hashcommit import engine
+from hashcommit.gitio import close_git_io
+from hashcommit.rewrite import rewrite_history
+
+
+def create_commits(repo: Path, count: int) -> None:
+    for number in range(count):
+        configure_git(repo, f"User{number}", f"user{number}@user.com")
+        (repo / f"file{number}.txt").write_text(f"{number}\n")
+        run_git_command(["add", "."], cwd=repo)
+        run_git_command(["commit", "-m", f"commit {number}"], cwd=repo)
+
+
+@pytest.mark.parametrize("preserve_author", [True, False])
+def test_rewriting_the_history(
+    initialized_git_repo: Path, preserve_author: bool
+) -> None:
+    create_commits(initialized_git_repo, 3)
+    before = get_git_log(initialized_git_repo)
+    configure_git(initialized_git_repo, "UserX", "userx@user.com")
+
+    args = ["rewrite", "--digits", "1"]
+    if not preserve_author:
+        args.append("--no-preserve-author")
+    run_hashcommit_command(args, cwd=initialized_git_repo)
+
+    after = get_git_log(initialized_git_repo)
+    assert len(after) == len(before) == 4
+    for number, (old, new) in enumerate(zip(reversed(before), reversed(after))):
+        assert new.hash.startswith(str(number))
+        assert new.message == old.message
+        assert new.date == old.date
+        assert new.author == (old.author if preserve_author else "UserX")
+    branch = run_git_command(["symbolic-ref", "HEAD"], cwd=initialized_git_repo)
+    assert branch.stdout.decode().strip() in ("refs/heads/master", "refs/heads/main")
+    status = run_git_command(["status", "--porcelain"], cwd=initialized_git_repo)
+    assert not status.stdout
+
+
+def test_rewriting_too_long_history(initialized_git_repo: Path) -> None:
+    create_commits(initialized_git_repo, 10)
+
+    result = run_hashcommit_command(
+        ["rewrite", "--digits", "1"], cwd=initialized_git_repo, expected_returncode=2
+    )
+    assert "11 commits do not fit in 1-digit sequence numbers" in (
+        result.stderr.decode()
+    )
+
+
+def test_rewriting_a_history_with_merges(initialized_git_repo: Path) -> None:
+    create_merge_history(initialized_git_repo)
+    create_commits(initialized_git_repo, 1)
+    before = get_history(initialized_git_repo)
+
+    run_hashcommit_command(["rewrite", "--digits", "1"], cwd=initialized_git_repo)
+
+    assert get_history(initialized_git_repo) == before
+    order = run_git_command(
+        ["rev-list", "--reverse", "--topo-order", "HEAD"], cwd=initialized_git_repo
+    )
+    hashes = order.stdout.decode().split()
+    assert [oid[0] for oid in hashes] == [str(number) for number in range(5)]
+
+
+def test_rewriting_shares_one_process_pool(
+    initialized_git_repo: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    create_commits(initialized_git_repo, 4)
+    monkeypatch.chdir(initialized_git_repo)
+    executors: List[Any] = []
+
+    class CountedExecutor(engine.ProcessPoolExecutor):
+        def __init__(self, *args: Any, **kwargs: Any) -> None:
+            super().__init__(*args, **kwargs)
+            executors.append(self)
+
+    monkeypatch.setattr(engine, "ProcessPoolExecutor", CountedExecutor)
+    try:
+        rewritten = rewrite_history(digits=2, preserve_author=True, jobs=2, quiet=True)
+    finally:
+        close_git_io()
+
+    assert len(rewritten) == 5
+    assert len(executors) == 1
+    # The searches are too short to keep checkpoints or solutions.
+    assert not (initialized_git_repo / ".git" / "hashcommit").exists()
@@ -0,0 +1,65 @@
+from pathlib import Path
+
+from test_cleanup import count_loose_objects, get_unreachable_commits
+from utils import get_git_log, run_git_command, run_hashcommit_command
+
+
+def test_signing_a_new_commit(signed_git_repo: Path) -> None:
+    loose_objects = count_loose_objects(signed_git_repo)
+
+    run_hashcommit_command(
+        ["--hash", "0", "--message", "signed"],
+        cwd=signed_git_repo,
+    )
+
+    git_log = get_git_log(signed_git_repo)
+    assert len(git_log) == 2
+    assert git_log[0].hash.startswith("0")
+    assert git_log[0].message == "signed\n"
+    run_git_command(["verify-commit", "HEAD"], cwd=signed_git_repo)
+    assert count_loose_objects(signed_git_repo) == loose_objects + 1
+    content = run_git_command(["cat-file", "commit", "HEAD"], cwd=signed_git_repo)
+    assert b"\n Comment: " in content.stdout
+
+
+def test_signing_every_candidate(signed_git_repo: Path) -> None:
+    run_hashcommit_command(
+        ["--hash", "2", "--message", "signed", "--nonce", "header"],
+        cwd=signed_git_repo,
+    )
+
+    git_log = get_git_log(signed_git_repo)
+    assert git_log[0].hash.startswith("2")
+    assert git_log[0].message == "signed\n"
+    run_git_command(["verify-commit", "HEAD"], cwd=signed_git_repo)
+    content = run_git_command(["cat-file", "commit", "HEAD"], cwd=signed_git_repo)
+    assert b"\n Comment: " not in content.stdout
+
+
+def test_signing_an_overwritten_commit(signed_git_repo: Path) -> None:
+    run_hashcommit_command(
+        ["--hash", "1", "--overwrite"],
+        cwd=signed_git_repo,
+    )
+
+    git_log = get_git_log(signed_git_repo)
+    assert len(git_log) == 1
+    assert git_log[0].hash.startswith("1")
+    assert git_log[0].message == "Initial commit\n"
+    run_git_command(["verify-commit", "HEAD"], cwd=signed_git_repo)
+    assert not get_unreachable_commits(signed_git_repo)
+
+
+def test_signing_rewritten_descendants(signed_git_repo: Path) -> None:
+    run_git_command(["commit", "--allow-empty", "-m", "second"], cwd=signed_git_repo)
+    root = get_git_log(signed_git_repo)[1].hash
+
+    run_hashcommit_command(
+        ["--hash", "1", "--overwrite", "--commit", root], cwd=signed_git_repo
+    )
+
+    git_log = get_git_log(signed_git_repo)
+    assert git_log[1].hash.startswith("1")
+    assert git_log[0].message == "second\n"
+    run_git_command(["verify-commit", "HEAD"], cwd=signed_git_repo)
+    run_git_command(["verify-commit", "HEAD~1"], cwd=signed_git_repo)
@@ -62,3 +62,29 @@ def get_git_log(git_repo: Path) -> List[CommitData]:
 def configure_git(repo: Path, name: str, email: str) -> None:
     run_git_command(["config", "user.name", name], cwd=repo)
     run_git_command(["config", "user.email", email], cwd=repo)
+
+
+def create_merge_history(repo: Path) -> None:
+    """Commit `main` and `side` on top of HEAD on two branches, then merge them."""
+    run_git_command(["checkout", "-q", "-b", "side"], cwd=repo)
+    run_git_command(["commit", "--allow-empty", "-m", "side"], cwd=repo)
+    run_git_command(["checkout", "-q", "-"], cwd=repo)
+    run_git_command(["commit", "--allow-empty", "-m", "main"], cwd=repo)
+    run_git_command(["merge", "-q", "--no-ff", "-m", "merge", "side"], cwd=repo)
+
+
+def get_history(repo: Path) -> Dict[str, List[str]]:
+    """Map the subject of every commit reachable from HEAD to the subjects of
+    its parents, in order."""
+    log = run_git_command(["log", "--format=%H %P"], cwd=repo).stdout.decode()
+    subjects = {
+        line[:40]: line[41:]
+        for line in run_git_command(["log", "--format=%H %s"], cwd=repo)
+        .stdout.decode()
+        .splitlines()
+    }
+    history = {}
+    for line in log.splitlines():
+        oid, *parents = line.split()
+        history[subjects[oid]] = [subjects[parent] for parent in parents]
+    return history